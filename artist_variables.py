@@ -0,0 +1,174 @@
+"""
+Artist Variables Module
+
+Emulates the "Additional Artists Variables" Picard plugin for dry runs, so
+scripts relying on its variables (script_components.PLUGIN_ADDITIONAL_ARTISTS_TAGS)
+can be evaluated against a tag manifest.
+
+The variables are derived from the artist credit tags of each track:
+
+    Track:  artists, artist, artistsort, musicbrainz_artistid
+    Album:  albumartists, albumartist, albumartistsort, musicbrainz_albumartistid
+
+Join phrases are recovered from the full credit (e.g. "A feat. B"), and
+sort names by splitting the sort credit on the same phrases. Standardized
+names are not stored in tags; manifests may provide them as the optional
+multi-values "_artists_std" and "_albumartists_std", otherwise the names
+as credited are used.
+
+A credit repeats across every track of an album and often across a whole
+discography, so results are memoized per distinct credit.
+"""
+
+from functools import lru_cache
+from typing import Dict, Iterable, Iterator, List, Mapping, Sequence, Tuple
+
+from script_components import PLUGIN_ADDITIONAL_ARTISTS_TAGS
+from script_engine import join_multi
+
+
+# Tags holding each level's credit: names, full credit, sort credit, ids, standardized names
+CREDIT_TAGS = {
+    "album": ("albumartists", "albumartist", "albumartistsort", "musicbrainz_albumartistid", "_albumartists_std"),
+    "track": ("artists", "artist", "artistsort", "musicbrainz_artistid", "_artists_std"),
+}
+
+# Join phrase used when the full credit does not contain the names
+FALLBACK_JOIN_PHRASE = "; "
+
+
+def _values(value) -> Tuple[str, ...]:
+    if not value:
+        return ()
+    if isinstance(value, str):
+        return (value,)
+    return tuple(value)
+
+
+def _text(value) -> str:
+    # Multi-valued credits are joined as the engine shows them, and are
+    # hashable for the memo cache
+    if not value:
+        return ""
+    if isinstance(value, str):
+        return value
+    return join_multi(tuple(value))
+
+
+def join_phrases(names: Sequence[str], credit: str) -> List[str]:
+    """Recover the phrases joining credited names, e.g. [" feat. ", ""]"""
+    phrases = []
+    pos = credit.find(names[0]) if credit else -1
+    if pos < 0:
+        return [FALLBACK_JOIN_PHRASE] * (len(names) - 1) + [""]
+    pos += len(names[0])
+    for name in names[1:]:
+        found = credit.find(name, pos)
+        if found < 0:
+            return [FALLBACK_JOIN_PHRASE] * (len(names) - 1) + [""]
+        phrases.append(credit[pos:found])
+        pos = found + len(name)
+    phrases.append(credit[pos:])
+    return phrases
+
+
+def sort_names(names: Sequence[str], sort_credit: str, phrases: Sequence[str]) -> List[str]:
+    """Split a sort credit such as "Beatles, The feat. Wonder, Stevie" into sort names"""
+    if not sort_credit:
+        return list(names)
+    if len(names) == 1:
+        return [sort_credit]
+    result = []
+    pos = 0
+    for phrase in phrases[:-1]:
+        found = sort_credit.find(phrase, pos) if phrase else -1
+        if found < 0:
+            # The sort credit does not follow the credit layout: only the
+            # primary artist's sort name can be trusted
+            return [sort_credit.split(FALLBACK_JOIN_PHRASE)[0]] + list(names[1:])
+        result.append(sort_credit[pos:found])
+        pos = found + len(phrase)
+    result.append(sort_credit[pos:])
+    return result
+
+
+def _join(values: Sequence[str], phrases: Sequence[str]) -> str:
+    parts = []
+    for i, value in enumerate(values):
+        if i:
+            parts.append(phrases[i - 1])
+        parts.append(value)
+    return "".join(parts)
+
+
+def derive_variables(level: str, names: Tuple[str, ...], credit: str, sort_credit: str,
+                     ids: Tuple[str, ...], standard: Tuple[str, ...]) -> Tuple[Tuple[str, str], ...]:
+    """Derive the plugin variables of one level ("album" or "track") from its credit"""
+    if not names:
+        return ()
+    phrases = join_phrases(names, credit)
+    sorted_names = sort_names(names, sort_credit, phrases)
+    std = standard if len(standard) == len(names) else names
+    prefix = f"_artists_{level}"
+
+    values = {
+        "primary_std": std[0],
+        "primary_cred": names[0],
+        "primary_sort": sorted_names[0],
+        "primary_id": ids[0] if ids else "",
+        "all_std": _join(std, phrases),
+        "all_cred": _join(names, phrases),
+        "all_sort": _join(sorted_names, phrases),
+        "all_sort_primary": _join([sorted_names[0]] + list(std[1:]), phrases),
+        "additional_std": _join(std[1:], phrases[1:]),
+        "additional_cred": _join(names[1:], phrases[1:]),
+        "count": str(len(names)),
+    }
+    return tuple((f"{prefix}_{key}", value) for key, value in values.items()
+                 if value and f"{prefix}_{key}" in PLUGIN_ADDITIONAL_ARTISTS_TAGS)
+
+
+class AdditionalArtistsVariables:
+    """
+    Adds the plugin's variables to tracks.
+
+    Derived variables are memoized per distinct credit in a bounded LRU
+    cache; stats() reports its hit rate.
+    """
+
+    def __init__(self, maxsize: int = 65536):
+        self._derive = lru_cache(maxsize=maxsize)(derive_variables)
+
+    def variables(self, tags: Mapping) -> Dict[str, str]:
+        """Get the plugin variables for a track"""
+        result = {}
+        for level, (names_tag, credit_tag, sort_tag, ids_tag, std_tag) in CREDIT_TAGS.items():
+            names = _values(tags.get(names_tag)) or _values(tags.get(credit_tag))
+            result.update(self._derive(
+                level, names, _text(tags.get(credit_tag)), _text(tags.get(sort_tag)),
+                _values(tags.get(ids_tag)), _values(tags.get(std_tag)),
+            ))
+        return result
+
+    def apply(self, tags: Mapping) -> Dict:
+        """Copy of the track's tags with the plugin variables added"""
+        result = self.variables(tags)
+        result.update(tags)
+        return result
+
+    def apply_all(self, tracks: Iterable[Mapping]) -> Iterator[Dict]:
+        """Add the plugin variables to many tracks"""
+        for tags in tracks:
+            yield self.apply(tags)
+
+    def stats(self) -> Dict[str, float]:
+        """Get the memo cache counters"""
+        info = self._derive.cache_info()
+        lookups = info.hits + info.misses
+        return {
+            "size": info.currsize,
+            "maxsize": info.maxsize,
+            "hits": info.hits,
+            "misses": info.misses,
+            "hit_rate": info.hits / lookups if lookups else 0.0,
+        }
@@ -0,0 +1,57 @@
+#!/usr/bin/env python3
+"""
+Benchmark: row-at-a-time vs columnar batch evaluation
+
+Renders the paths of a synthetic library with each preset's script, once
+track by track with script_engine and once in columnar batches with
+script_batch, and checks both give the same paths.
+
+Run: python benchmarks/bench_batch.py [albums] [--batch-size N]
+"""
+
+import argparse
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from library_fixtures import generate_library
+from presets import PRESETS, get_preset_by_name
+from script_batch import compile_batch, render_paths_batch
+from script_builder import ScriptBuilder
+from script_engine import compile_script, render_paths
+
+
+def bench(render, repeat=3):
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        paths = list(render())
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best, paths
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("albums", nargs="?", type=int, default=2000)
+    parser.add_argument("--batch-size", type=int, default=10000)
+    args = parser.parse_args()
+
+    tracks = generate_library(args.albums, multi_artist_ratio=0.3)
+    print(f"Fixture library: {args.albums} albums, {len(tracks)} tracks, batches of {args.batch_size}\n")
+    print(f"{'Preset':<12} {'row us/track':>13} {'batch us/track':>15} {'speedup':>8}")
+    for preset_name in PRESETS:
+        script = ScriptBuilder(get_preset_by_name(preset_name)).build()
+        compiled = compile_script(script)
+        batch = compile_batch(script)
+        row_time, row_paths = bench(lambda: render_paths(compiled, tracks))
+        batch_time, batch_paths = bench(lambda: render_paths_batch(batch, tracks, args.batch_size))
+        assert row_paths == batch_paths, f"{preset_name}: batch rendered different paths"
+        print(f"{preset_name:<12} {row_time / len(tracks) * 1e6:>13.1f} "
+              f"{batch_time / len(tracks) * 1e6:>15.1f} {row_time / batch_time:>7.2f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,82 @@
+#!/usr/bin/env python3
+"""
+Benchmark: incremental vs full reparse of an edited script
+
+Types and deletes a character at random places inside literal text of a
+script (Bob Swift's naming script by default), re-rendering sample tracks
+after each keystroke incrementally and from scratch, and checks both give
+the same paths.
+
+Run: python benchmarks/bench_incremental.py [script.pts] [--keystrokes N]
+"""
+
+import argparse
+import random
+import sys
+import time
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+from artist_variables import AdditionalArtistsVariables
+from library_fixtures import generate_library
+from script_engine import compile_script, render_path
+from script_incremental import IncrementalRenderer, IncrementalScript
+
+
+def percentile(times, fraction):
+    ordered = sorted(times)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("script", nargs="?", default=str(ROOT / "Info" / "Bob Swift's Naming Script.pts"))
+    parser.add_argument("--keystrokes", type=int, default=200)
+    parser.add_argument("--tracks", type=int, default=8)
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    with open(args.script, "r", encoding="utf-8") as f:
+        text = f.read()
+    artist_variables = AdditionalArtistsVariables()
+    library = generate_library(20, multi_artist_ratio=0.3, feat_ratio=0.3)
+    tracks = {str(index): artist_variables.apply(tags)
+              for index, tags in enumerate(library[::len(library) // args.tracks][:args.tracks])}
+
+    start = time.perf_counter()
+    renderer = IncrementalRenderer(IncrementalScript(text), tracks)
+    print(f"Script: {len(text):,} characters, {len(renderer.script.statements)} top-level statements, "
+          f"{len(tracks)} sample tracks; first render {(time.perf_counter() - start) * 1000:.1f} ms\n")
+
+    rng = random.Random(args.seed)
+    incremental, full = [], []
+    evaluated = 0
+    for _ in range(args.keystrokes):
+        current = renderer.script.text
+        position = rng.choice([index for index in range(0, len(current), 7) if current[index].isalpha()])
+        for edit in ((position, position, "x"), (position, position + 1, "")):
+            before = renderer.evaluated
+            start = time.perf_counter()
+            paths = dict(renderer.edit(*edit))
+            incremental.append(time.perf_counter() - start)
+            evaluated += renderer.evaluated - before
+            if renderer.script.error is not None:
+                continue
+            start = time.perf_counter()
+            compiled = compile_script(renderer.script.text)
+            expected = {key: render_path(compiled, tags) for key, tags in tracks.items()}
+            full.append(time.perf_counter() - start)
+            assert paths == expected, f"Incremental render differs after editing at {position}"
+
+    print(f"{'':<12} {'p50 ms':>8} {'p95 ms':>8} {'max ms':>8}")
+    for label, times in (("incremental", incremental), ("full", full)):
+        print(f"{label:<12} {percentile(times, 0.5) * 1000:>8.2f} {percentile(times, 0.95) * 1000:>8.2f} "
+              f"{max(times) * 1000:>8.2f}")
+    print(f"\nStatements evaluated per keystroke: {evaluated / len(incremental):.1f} "
+          f"of {len(renderer.script.statements) * len(tracks)}")
+
+
+if __name__ == "__main__":
+    main()
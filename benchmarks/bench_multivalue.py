@@ -0,0 +1,105 @@
+#!/usr/bin/env python3
+"""
+Benchmark: multi-value tag representation
+
+Evaluates a script using $getmulti, $lenmulti, $join, $foreach, $map and
+$inmulti over a library where most tracks credit several artists. The
+"joined strings" run stores multi-value tags as "; "-joined text that every
+function splits again. The "tuples" run keeps them as tuples, read directly
+by the compiled functions and only joined when needed as plain text.
+Before timing, the plugin variables of a track whose artist credits are
+lists must match those of the same track with its credits as joined text.
+
+Run: python benchmarks/bench_multivalue.py [albums]
+"""
+
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from artist_variables import AdditionalArtistsVariables
+from library_fixtures import generate_library
+from script_engine import FUNCTIONS, MULTI_VALUE_SEPARATOR, compile_script, render_path
+
+
+MULTI_FUNCTIONS = ["getmulti", "lenmulti", "join", "inmulti", "foreach", "map", "setmulti"]
+
+SCRIPT = r"""
+$set(_primary,$getmulti(%artists%,0))
+$set(_count,$lenmulti(%artists%))
+$set(_credit,$join(%artists%, & ))
+$set(_initials,)
+$foreach(%artists%,$set(_initials,%_initials%$firstalphachar(%_loop_value%)))
+$set(_upper,$map(%artists%,$upper(%_loop_value%)))
+$set(_hasGuest,$inmulti(%artists%,Daft Punk))
+$setmulti(_credits,%artists%)
+%_primary%/$if($gt(%_count%,1),%_initials% - ,)%album%/
+$num(%tracknumber%,2). %title%$if(%_hasGuest%, [with Daft Punk],) [$getmulti(%_credits%,-1)]
+"""
+
+# Tag readers return every artist credit tag as a list
+LIST_CREDITS_TRACK = {
+    "artists": ["Daft Punk", "Pharrell Williams"],
+    "artist": ["Daft Punk", "Pharrell Williams"],
+    "artistsort": ["Daft Punk", "Williams, Pharrell"],
+    "albumartists": ["Daft Punk"],
+    "albumartist": ["Daft Punk"],
+    "albumartistsort": ["Daft Punk"],
+}
+
+
+def joined(tracks):
+    """Copy of tracks with multi-value tags joined into plain text"""
+    return [{name: value if isinstance(value, str) else MULTI_VALUE_SEPARATOR.join(value)
+             for name, value in tags.items()} for tags in tracks]
+
+
+def bench(compiled, tracks, repeat=3):
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        paths = [render_path(compiled, tags) for tags in tracks]
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best, paths
+
+
+def check_list_credits():
+    """Whether list-valued credits give the plugin variables of their joined text"""
+    credits = ("artist", "artistsort", "albumartist", "albumartistsort")
+    text_credits = {name: MULTI_VALUE_SEPARATOR.join(value) if name in credits else value
+                    for name, value in LIST_CREDITS_TRACK.items()}
+    variables = AdditionalArtistsVariables().variables
+    return variables(LIST_CREDITS_TRACK) == variables(text_credits)
+
+
+def main():
+    if not check_list_credits():
+        sys.exit("List-valued artist credits gave different plugin variables than joined ones")
+    albums = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    tracks = generate_library(albums, multi_artist_ratio=0.8)
+    tuple_tracks = [{name: value if isinstance(value, str) else tuple(value)
+                     for name, value in tags.items()} for tags in tracks]
+    string_tracks = joined(tracks)
+    multi = sum(1 for tags in tracks if len(tags["artists"]) > 1)
+    print(f"Fixture library: {albums} albums, {len(tracks)} tracks, {multi} with several artists\n")
+
+    # Without the compile hooks every multi-value function evaluates its
+    # argument to text and splits it, as with joined-string storage
+    split_functions = dict(FUNCTIONS)
+    for name in MULTI_FUNCTIONS:
+        split_functions[name] = FUNCTIONS[name]._replace(compiler=None)
+
+    string_time, string_paths = bench(compile_script(SCRIPT, functions=split_functions), string_tracks)
+    tuple_time, tuple_paths = bench(compile_script(SCRIPT), tuple_tracks)
+    assert string_paths == tuple_paths, "representations rendered different paths"
+
+    print(f"{'Representation':<16} {'us/track':>10} {'speedup':>8}")
+    print(f"{'joined strings':<16} {string_time / len(tracks) * 1e6:>10.1f} {1:>7.2f}x")
+    print(f"{'tuples':<16} {tuple_time / len(tracks) * 1e6:>10.1f} {string_time / tuple_time:>7.2f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,121 @@
+#!/usr/bin/env python3
+"""
+Benchmark: character sanitization variants
+
+Compares the evaluation cost of generated scripts when invalid characters
+are replaced per field ("fields" scope) or once over the assembled path
+("path" scope), against the previous behavior of always sanitizing all
+four fields. The "character map" variant uses the safe_replacements
+policy, whose $replace chains the engine evaluates with str.translate.
+Before timing, each variant must replace every invalid character,
+backslash included, in a sample track.
+
+Run: python benchmarks/bench_sanitization.py [albums]
+"""
+
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from library_fixtures import generate_library
+from presets import PRESETS, get_preset_by_name
+from script_builder import SANITIZED_FIELDS, ScriptBuilder
+from script_engine import FUNCTIONS, compile_script, render_path
+
+
+class AllFieldsScriptBuilder(ScriptBuilder):
+    """Builder sanitizing all four fields, whether referenced or not"""
+
+    def _referenced_fields(self, body):
+        return list(SANITIZED_FIELDS)
+
+
+def counting_functions(counter):
+    """Copy of the function registry that counts $rreplace calls"""
+    functions = dict(FUNCTIONS)
+    spec = FUNCTIONS["rreplace"]
+
+    def compiler(node, args):
+        evaluator = spec.compiler(node, args)
+        if evaluator is None:
+            evaluator = lambda state: spec.func(state, *[arg(state) for arg in args])
+
+        def counted(state):
+            counter[0] += 1
+            return evaluator(state)
+        return counted
+
+    functions["rreplace"] = spec._replace(compiler=compiler)
+    return functions
+
+
+def build_variants(preset_name):
+    config = get_preset_by_name(preset_name)
+    variants = {"all fields": AllFieldsScriptBuilder(config).build()}
+    config.sanitize_scope = "fields"
+    variants["referenced fields"] = ScriptBuilder(config).build()
+    config.sanitize_scope = "path"
+    variants["assembled path"] = ScriptBuilder(config).build()
+    config.sanitize_scope = "fields"
+    config.sanitize_policy = "safe_replacements"
+    variants["character map"] = ScriptBuilder(config).build()
+    return variants
+
+
+# Track with characters invalid in file names, backslash included, in the
+# album and title, which every preset sanitizes
+INVALID_CHARS_TRACK = {
+    "albumartist": "AC-DC", "artist": "AC-DC", "album": 'Live\\Dead: "Who?" <Made>*|',
+    "title": "Back\\In Black", "tracknumber": "1", "totaltracks": "10", "date": "1986",
+    "_extension": "flac",
+}
+
+
+def check_variants(variants):
+    """Variants leaving an invalid character of INVALID_CHARS_TRACK in its path"""
+    failed = []
+    for variant, script in variants.items():
+        path = render_path(compile_script(script), INVALID_CHARS_TRACK)
+        if any(char in path for char in '\\:*?"<>|'):
+            failed.append(f"{variant}: {path}")
+    return failed
+
+
+def bench(script, tracks, repeat=3):
+    """Best wall time over repeat runs, and $rreplace calls in one run"""
+    counter = [0]
+    compiled = compile_script(script, functions=counting_functions(counter))
+    best = None
+    for _ in range(repeat):
+        counter[0] = 0
+        start = time.perf_counter()
+        for tags in tracks:
+            render_path(compiled, tags)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best, counter[0]
+
+
+def main():
+    albums = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    tracks = generate_library(albums)
+    print(f"Fixture library: {albums} albums, {len(tracks)} tracks\n")
+    print(f"{'Preset':<12} {'Variant':<18} {'us/track':>10} {'rreplace/track':>15} {'speedup':>8}")
+    for preset_name in PRESETS:
+        variants = build_variants(preset_name)
+        failed = check_variants(variants)
+        if failed:
+            sys.exit(f"{preset_name}: invalid characters left by\n  " + "\n  ".join(failed))
+        baseline = None
+        for variant, script in variants.items():
+            elapsed, calls = bench(script, tracks)
+            baseline = baseline or elapsed
+            print(f"{preset_name:<12} {variant:<18} {elapsed / len(tracks) * 1e6:>10.1f} "
+                  f"{calls / len(tracks):>15.1f} {baseline / elapsed:>7.2f}x")
+        print()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,78 @@
+#!/usr/bin/env python3
+"""
+Benchmark: in-memory track representation
+
+Writes a synthetic manifest, then loads it in a fresh process as plain
+dicts and as compact TrackRecords, reporting the peak RSS of each load.
+The manifest is written once and reused by later runs.
+
+Run: python benchmarks/bench_track_records.py [tracks] [--manifest FILE]
+"""
+
+import argparse
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+from itertools import islice
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from library_fixtures import iter_library
+from manifest import load_manifest, write_manifest
+from track_records import TrackPool, load_records
+
+
+def peak_rss_mb() -> float:
+    # ru_maxrss is in kilobytes on Linux, bytes on macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024 * 1024 if sys.platform == "darwin" else 1024)
+
+
+def write_fixture(path: Path, tracks: int):
+    # Roughly 12 tracks per album; generate enough albums and cut at the track count
+    library = iter_library(albums=tracks // 6 + 1, multi_artist_ratio=0.2)
+    write_manifest(path, islice(library, tracks))
+
+
+def load(mode: str, path: str):
+    """Load a manifest in this process and report its peak RSS"""
+    baseline = peak_rss_mb()
+    start = time.perf_counter()
+    if mode == "dicts":
+        tracks = load_manifest(path)
+        detail = ""
+    else:
+        pool = TrackPool()
+        tracks = load_records(path, pool)
+        detail = f"  ({pool.stats()['values']} pooled values)"
+    elapsed = time.perf_counter() - start
+    print(f"{mode:<8} {len(tracks):>10} {elapsed:>8.1f} {peak_rss_mb() - baseline:>10.0f}{detail}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("tracks", nargs="?", type=int, default=5_000_000)
+    parser.add_argument("--manifest", help="Manifest to write (default: temporary directory)")
+    parser.add_argument("--load", choices=["dicts", "records"], help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.load:
+        load(args.load, args.manifest)
+        return
+
+    path = Path(args.manifest or Path(tempfile.gettempdir()) / f"bench_tracks_{args.tracks}.ndjson")
+    if not path.exists():
+        print(f"Writing {args.tracks} tracks to {path}...")
+        write_fixture(path, args.tracks)
+    print(f"Manifest: {path} ({path.stat().st_size / 1e6:.0f} MB)\n")
+
+    print(f"{'Mode':<8} {'tracks':>10} {'load s':>8} {'peak MB':>10}")
+    for mode in ("records", "dicts"):
+        subprocess.run([sys.executable, __file__, "--load", mode, "--manifest", str(path)], check=False)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,119 @@
+"""
+Synthetic Library Fixtures
+
+Generates deterministic tag data resembling a real music library, for
+benchmarking generated scripts outside of Picard. Tracks are plain dicts
+keyed by the tag names in script_components.STANDARD_TAGS.
+"""
+
+import random
+from typing import Dict, Iterator, List
+
+from script_components import SPECIAL_IDS
+
+
+ARTISTS = [
+    ("The Beatles", "Beatles, The"),
+    ("Pink Floyd", "Pink Floyd"),
+    ("AC/DC", "AC/DC"),
+    ("Guns N' Roses", "Guns N' Roses"),
+    ("The Rolling Stones", "Rolling Stones, The"),
+    ("Sigur Rós", "Sigur Rós"),
+    ("坂本龍一", "Sakamoto, Ryuichi"),
+    ("Björk", "Björk"),
+    ("A Tribe Called Quest", "Tribe Called Quest, A"),
+    ("Godspeed You! Black Emperor", "Godspeed You! Black Emperor"),
+    ("?uestlove", "?uestlove"),
+    ("Florence + the Machine", "Florence + the Machine"),
+    ("The Who", "Who, The"),
+    ("Nine Inch Nails", "Nine Inch Nails"),
+    ("!!!", "!!!"),
+    ("Daft Punk", "Daft Punk"),
+]
+
+TITLE_WORDS = [
+    "Love", "Night", "Dream", "Fire", "Road", "Heart", "Blue", "Time",
+    "Rain", "Star", "Home", "Light", "Shadow", "River", "Gold", "Echo",
+    "What?", "Part 1: Intro", "Live at \"Wembley\"", "<Untitled>", "A/B",
+    "夜明け", "Ça Plane", "Señorita", "Nøkken", "Mañana",
+]
+
+LABELS = ["Apple", "Harvest", "EMI", "Warp", "Sub Pop", "4AD", "Columbia"]
+
+FORMATS = ["flac", "flac", "mp3", "m4a", "ogg"]
+
+
+def _words(rng: random.Random, count: int) -> str:
+    return " ".join(rng.choice(TITLE_WORDS) for _ in range(count))
+
+
+def iter_library(albums: int = 1000, seed: int = 1,
+                 va_ratio: float = 0.1, multi_disc_ratio: float = 0.15,
+                 soundtrack_ratio: float = 0.05, feat_ratio: float = 0.1,
+                 multi_artist_ratio: float = 0.1) -> Iterator[Dict]:
+    """
+    Yield the tracks of a synthetic library, album by album.
+
+    The same arguments always produce the same tracks.
+    """
+    rng = random.Random(seed)
+    for album_index in range(albums):
+        album_artist, album_artist_sort = rng.choice(ARTISTS)
+        is_va = rng.random() < va_ratio
+        is_soundtrack = rng.random() < soundtrack_ratio
+        total_discs = rng.choice([2, 2, 3, 4]) if rng.random() < multi_disc_ratio else 1
+        year = str(rng.randint(1955, 2024))
+        extension = rng.choice(FORMATS)
+        album = {
+            "album": _words(rng, rng.randint(1, 4)),
+            "albumartist": "Various Artists" if is_va else album_artist,
+            "albumartistsort": "Various Artists" if is_va else album_artist_sort,
+            "musicbrainz_albumartistid": (SPECIAL_IDS["VARIOUS_ARTISTS_ID"] if is_va
+                                          else f"artist-{ARTISTS.index((album_artist, album_artist_sort))}"),
+            "musicbrainz_albumid": f"album-{seed}-{album_index}",
+            "date": f"{year}-{rng.randint(1, 12):02d}-01",
+            "originaldate": year if rng.random() < 0.5 else "",
+            "totaldiscs": str(total_discs),
+            "label": rng.choice(LABELS),
+            "catalognumber": f"CAT{rng.randint(100, 9999)}",
+            "_releasecomment": "Remaster" if rng.random() < 0.2 else "",
+            "_primaryreleasetype": "album",
+            "_secondaryreleasetype": "soundtrack" if is_soundtrack else ("compilation" if is_va else ""),
+            "releasetype": "album; soundtrack" if is_soundtrack else "album",
+            "_extension": extension,
+        }
+        for disc in range(1, total_discs + 1):
+            total_tracks = rng.randint(6, 16)
+            disc_subtitle = _words(rng, 2) if total_discs > 1 and rng.random() < 0.3 else ""
+            for track in range(1, total_tracks + 1):
+                if is_va:
+                    artist, artist_sort = rng.choice(ARTISTS)
+                else:
+                    artist, artist_sort = album_artist, album_artist_sort
+                artists = [artist]
+                if rng.random() < multi_artist_ratio:
+                    artists += [name for name, _ in rng.sample(ARTISTS, rng.randint(1, 3))]
+                if rng.random() < feat_ratio:
+                    guest = rng.choice(ARTISTS)[0]
+                    artists.append(guest)
+                    artist = f"{artist} feat. {guest}"
+                elif len(artists) > 1:
+                    artist = " & ".join(artists)
+                tags = dict(album)
+                tags.update({
+                    "title": _words(rng, rng.randint(1, 5)),
+                    "artist": artist,
+                    "artists": artists,
+                    "artistsort": artist_sort,
+                    "tracknumber": str(track),
+                    "totaltracks": str(total_tracks),
+                    "discnumber": str(disc),
+                    "discsubtitle": disc_subtitle,
+                    "musicbrainz_trackid": f"track-{seed}-{album_index}-{disc}-{track}",
+                })
+                yield {name: value for name, value in tags.items() if value}
+
+
+def generate_library(albums: int = 1000, seed: int = 1, **kwargs) -> List[Dict]:
+    """Generate a synthetic library as a list of tracks"""
+    return list(iter_library(albums, seed, **kwargs))
@@ -0,0 +1,188 @@
+#!/usr/bin/env python3
+"""
+Config Diff
+
+Shows which files would move, and where, when a library switches from one
+naming config to another (e.g. from the organized to the detailed preset).
+
+Both scripts are rendered over a tag manifest in one streaming pass. Their
+top-level statements are aligned, and a statement found in both scripts is
+evaluated once and its variables copied to the other script's state, as
+long as none of the variables it reads were set differently by the two
+scripts before it. For two presets this shares most of the working
+variables section.
+
+Only the tracks whose path changes are printed, followed by the number of
+changed tracks per top-level directory.
+
+Run: python config_diff.py library.ndjson --from organized --to detailed
+     python config_diff.py library.ndjson --from-script old.pts --to-script new.pts --output diff.ndjson
+"""
+
+import argparse
+import difflib
+import json
+import sys
+from typing import Dict, Iterable, Iterator, List, Mapping, Optional, Set, Tuple
+
+from manifest import PATH_KEY, iter_manifest
+from presets import PRESETS, get_preset_script, load_user_presets
+from script_engine import ScriptState, compile_node, format_path, path_safe_tags, statement_effects
+from script_parser import Function, Node, parse_script
+
+
+# Operations of a diff plan: evaluated once for both scripts, or for one of them
+SHARED, OLD, NEW = "shared", "old", "new"
+
+
+def _is_noop(node: Node) -> bool:
+    return isinstance(node, Function) and node.name == "noop"
+
+
+class ConfigDiff:
+    """Renders two naming scripts side by side, sharing identical statements"""
+
+    def __init__(self, old_script: str, new_script: str):
+        old_items = [item for item in parse_script(old_script, strip_layout=True).items if not _is_noop(item)]
+        new_items = [item for item in parse_script(new_script, strip_layout=True).items if not _is_noop(item)]
+        # Variables that may hold different values in the two states
+        diverged: Set[str] = set()
+        # Once a statement writes unknown variables, nothing can be shared
+        poisoned = False
+        self.plan: List[Tuple[str, object, Optional[Set[str]]]] = []
+
+        def separate(side, items):
+            nonlocal poisoned
+            for item in items:
+                _, writes = statement_effects(item)
+                if writes is None:
+                    poisoned = True
+                else:
+                    diverged.update(writes)
+                self.plan.append((side, compile_node(item), None))
+
+        matcher = difflib.SequenceMatcher(None, old_items, new_items, autojunk=False)
+        for tag, i1, i2, j1, j2 in matcher.get_opcodes():
+            if tag != "equal":
+                separate(OLD, old_items[i1:i2])
+                separate(NEW, new_items[j1:j2])
+                continue
+            for item in old_items[i1:i2]:
+                reads, writes = statement_effects(item)
+                # A write may be conditional and leave the diverged value in place
+                if poisoned or writes is None or (reads | writes) & diverged:
+                    separate(OLD, [item])
+                    separate(NEW, [item])
+                else:
+                    diverged.difference_update(writes)
+                    self.plan.append((SHARED, compile_node(item), writes))
+
+        self.shared = sum(1 for side, _, _ in self.plan if side == SHARED)
+        self.statements = (len(old_items), len(new_items))
+
+    def render(self, tags: Mapping) -> Tuple[str, str]:
+        """Render the old and new paths of a track"""
+        tags = path_safe_tags(tags)
+        old_state, new_state = ScriptState(tags), ScriptState(tags)
+        old_context, new_context = old_state.context, new_state.context
+        old_output, new_output = [], []
+        for side, evaluator, writes in self.plan:
+            if side == SHARED:
+                output = evaluator(old_state)
+                old_output.append(output)
+                new_output.append(output)
+                for name in writes:
+                    if name in old_context:
+                        new_context[name] = old_context[name]
+                    else:
+                        new_context.pop(name, None)
+            elif side == OLD:
+                old_output.append(evaluator(old_state))
+            else:
+                new_output.append(evaluator(new_state))
+        extension = tags.get("_extension")
+        return format_path("".join(old_output), extension), format_path("".join(new_output), extension)
+
+    def diff(self, tracks: Iterable[Mapping]) -> Iterator[Dict]:
+        """Yield a row for each track whose path changes"""
+        for index, tags in enumerate(tracks):
+            old, new = self.render(tags)
+            if old != new:
+                yield {"track": tags.get(PATH_KEY) or index, "old": old, "new": new}
+
+
+def top_level_directory(path: str) -> str:
+    return path.split("/", 1)[0] if "/" in path else ""
+
+
+class DiffSummary:
+    """Counts tracks and changed tracks per top-level directory of the old paths"""
+
+    def __init__(self):
+        self.tracks: Dict[str, int] = {}
+        self.changed: Dict[str, int] = {}
+
+    def add(self, old: str, changed: bool):
+        directory = top_level_directory(old)
+        self.tracks[directory] = self.tracks.get(directory, 0) + 1
+        if changed:
+            self.changed[directory] = self.changed.get(directory, 0) + 1
+
+    def format_text(self) -> str:
+        lines = [f"{'changed':>8} {'tracks':>8}  top-level directory"]
+        for directory, changed in sorted(self.changed.items(), key=lambda item: -item[1]):
+            lines.append(f"{changed:>8} {self.tracks[directory]:>8}  {directory or '(root)'}")
+        total_changed, total = sum(self.changed.values()), sum(self.tracks.values())
+        lines.append(f"{total_changed:>8} {total:>8}  total")
+        return "\n".join(lines)
+
+
+def _script(preset: Optional[str], path: Optional[str]) -> str:
+    if path:
+        with open(path, "r", encoding="utf-8") as f:
+            return f.read()
+    return get_preset_script(preset)
+
+
+def main(argv=None):
+    load_user_presets()
+    parser = argparse.ArgumentParser(description="Show which files move when the naming config changes")
+    parser.add_argument("manifest", help="Tag manifest (NDJSON, one track per line)")
+    old = parser.add_mutually_exclusive_group(required=True)
+    old.add_argument("--from", dest="old_preset", choices=list(PRESETS), help="Current preset")
+    old.add_argument("--from-script", help="Current Picard script file (.pts)")
+    new = parser.add_mutually_exclusive_group(required=True)
+    new.add_argument("--to", dest="new_preset", choices=list(PRESETS), help="New preset")
+    new.add_argument("--to-script", help="New Picard script file (.pts)")
+    parser.add_argument("--output", help="Write the changed rows here (NDJSON) instead of printing them")
+    parser.add_argument("--summary-only", action="store_true", help="Only print the per-directory summary")
+    args = parser.parse_args(argv)
+
+    try:
+        differ = ConfigDiff(_script(args.old_preset, args.from_script), _script(args.new_preset, args.to_script))
+    except ValueError as e:
+        parser.error(str(e))
+    summary = DiffSummary()
+    out = open(args.output, "w", encoding="utf-8") if args.output else None
+    try:
+        for index, tags in enumerate(iter_manifest(args.manifest)):
+            old_path, new_path = differ.render(tags)
+            summary.add(old_path, old_path != new_path)
+            if old_path == new_path or args.summary_only:
+                continue
+            row = {"track": tags.get(PATH_KEY) or index, "old": old_path, "new": new_path}
+            if out is not None:
+                out.write(json.dumps(row, ensure_ascii=False) + "\n")
+            else:
+                print(f"{old_path}\t->\t{new_path}")
+    finally:
+        if out is not None:
+            out.close()
+
+    print(f"\n{summary.format_text()}", file=sys.stderr)
+    print(f"{differ.shared} of {differ.statements[0]}/{differ.statements[1]} statements evaluated once "
+          f"for both scripts", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
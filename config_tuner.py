@@ -0,0 +1,254 @@
+#!/usr/bin/env python3
+"""
+Config Tuner
+
+Searches ScriptConfig values on a sample library for the configs giving
+the fewest problems: tracks colliding on the same path, file or folder
+names over the filesystem byte limits, and folders with too many entries.
+
+Candidates are every combination of the values given per field. Folder
+paths and filenames are cached separately: most fields only affect one
+of them, so a candidate whose folder layout and filename format have
+both been rendered before, in other candidates, is scored without
+rendering anything. Rendering runs in worker processes.
+
+Run: python config_tuner.py sample.ndjson [--preset simple] [--top 5]
+     python config_tuner.py sample.ndjson --field max_filename_length=120,160,200
+"""
+
+import argparse
+import itertools
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import asdict, fields, replace
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+from manifest import load_manifest
+from path_budget import PathBudget
+from presets import get_preset_by_name, load_user_presets
+from rename_plan import CollisionChecker, STATUS_COLLISION
+from script_batch import path_renderer
+from script_builder import ScriptBuilder, ScriptConfig
+
+
+# Values searched by default
+DEFAULT_SPACE = {
+    "max_filename_length": [120, 160, 200, 240],
+    "include_disambiguation": [False, True],
+    "include_catalog": [False, True],
+    "artist_folder_style": ["standard", "first_letter_subfolder"],
+}
+
+# Fields that only change the folder path, or only the filename
+FOLDER_FIELDS = {
+    "use_artist_folder", "artist_folder_style", "use_album_folder", "include_year_in_album",
+    "year_position", "disc_folder_format", "include_disc_subtitle", "separate_soundtracks",
+    "max_album_length", "use_original_year", "format_album_artist", "include_label",
+    "include_catalog", "include_format", "include_disambiguation",
+}
+FILENAME_FIELDS = {
+    "track_padding_length", "include_disc_in_track", "include_artist_in_filename",
+    "artist_separator", "include_track_number", "include_title", "include_track_artist_for_va",
+    "va_artist_separator", "show_featured_artists", "feat_format", "max_title_length",
+    "max_filename_length",
+}
+
+# Score weight of each problem
+DEFAULT_WEIGHTS = {"collisions": 100.0, "overruns": 100.0, "fanout": 1.0}
+
+# Folders with up to this many entries are not penalized
+DEFAULT_FANOUT_LIMIT = 500
+
+
+def _part_key(config: ScriptConfig, skip: set) -> Tuple:
+    return tuple((f.name, getattr(config, f.name)) for f in fields(ScriptConfig) if f.name not in skip)
+
+
+def folder_key(config: ScriptConfig) -> Tuple:
+    """Key of the config fields the folder path depends on"""
+    return _part_key(config, FILENAME_FIELDS)
+
+
+def filename_key(config: ScriptConfig) -> Tuple:
+    """Key of the config fields the filename depends on"""
+    return _part_key(config, FOLDER_FIELDS)
+
+
+def candidates(base: ScriptConfig, space: Dict[str, Sequence]) -> List[ScriptConfig]:
+    """Every combination of the searched values, applied to base"""
+    names = list(space)
+    return [replace(base, **dict(zip(names, values))) for values in itertools.product(*space.values())]
+
+
+# =============================================================================
+# RENDER WORKERS
+# =============================================================================
+
+_worker_tracks = None
+
+
+def _init_worker(manifest: str):
+    global _worker_tracks
+    _worker_tracks = load_manifest(manifest)
+
+
+def _render_parts(config: Dict) -> Tuple[List[str], List[str]]:
+    """Render the sample with a config, split into folder paths and filenames"""
+    render = path_renderer(ScriptBuilder(ScriptConfig(**config)).build())
+    folders, filenames = [], []
+    for path in render(_worker_tracks):
+        folder, _, filename = path.rpartition("/")
+        folders.append(folder)
+        filenames.append(filename)
+    return folders, filenames
+
+
+# =============================================================================
+# SCORING
+# =============================================================================
+
+def score_paths(folders: List[str], filenames: List[str], budget: PathBudget,
+                weights: Dict[str, float] = DEFAULT_WEIGHTS,
+                fanout_limit: int = DEFAULT_FANOUT_LIMIT) -> Dict:
+    """Count the problems of a set of paths and weigh them into a score"""
+    checker = CollisionChecker()
+    overruns_before = budget.overruns
+    children: Dict[str, set] = {}
+    seen_folders = set()
+    for index, (folder, filename) in enumerate(zip(folders, filenames)):
+        path = f"{folder}/{filename}" if folder else filename
+        checker.check(str(index), path)
+        budget.check(path)
+        children.setdefault(folder, set()).add(filename)
+        # Register each folder with its parent once
+        while folder and folder not in seen_folders:
+            seen_folders.add(folder)
+            parent, _, name = folder.rpartition("/")
+            children.setdefault(parent, set()).add(name + "/")
+            folder = parent
+    fanout = max((len(entries) for entries in children.values()), default=0)
+    result = {
+        "collisions": checker.counts[STATUS_COLLISION],
+        "overruns": budget.overruns - overruns_before,
+        "fanout": fanout,
+        "folders": len(seen_folders),
+    }
+    result["score"] = (weights["collisions"] * result["collisions"]
+                       + weights["overruns"] * result["overruns"]
+                       + weights["fanout"] * max(0, fanout - fanout_limit))
+    return result
+
+
+class ConfigTuner:
+    """Scores candidate configs on a sample manifest"""
+
+    def __init__(self, manifest: str, base: Optional[ScriptConfig] = None,
+                 space: Optional[Dict[str, Sequence]] = None, processes: Optional[int] = None,
+                 weights: Optional[Dict[str, float]] = None, fanout_limit: int = DEFAULT_FANOUT_LIMIT):
+        self.manifest = manifest
+        self.base = base or ScriptConfig()
+        self.space = space or DEFAULT_SPACE
+        self.processes = processes or os.cpu_count() or 1
+        self.weights = dict(DEFAULT_WEIGHTS, **(weights or {}))
+        self.fanout_limit = fanout_limit
+        self.folders: Dict[Tuple, List[str]] = {}
+        self.filenames: Dict[Tuple, List[str]] = {}
+        self.renders = 0
+
+    def _plan_renders(self, configs: Iterable[ScriptConfig]) -> List[ScriptConfig]:
+        """Candidates to render so every folder layout and filename format is rendered once"""
+        planned_folders, planned_filenames = set(self.folders), set(self.filenames)
+        renders = []
+        for config in configs:
+            folders, filenames = folder_key(config), filename_key(config)
+            if folders in planned_folders and filenames in planned_filenames:
+                continue
+            planned_folders.add(folders)
+            planned_filenames.add(filenames)
+            renders.append(config)
+        return renders
+
+    def tune(self, top: int = 5) -> List[Tuple[ScriptConfig, Dict]]:
+        """Score every candidate and return the best, lowest score first"""
+        configs = candidates(self.base, self.space)
+        renders = self._plan_renders(configs)
+        if renders:
+            with ProcessPoolExecutor(min(self.processes, len(renders)), initializer=_init_worker,
+                                     initargs=(self.manifest,)) as pool:
+                for config, (folders, filenames) in zip(
+                        renders, pool.map(_render_parts, [asdict(config) for config in renders])):
+                    self.folders.setdefault(folder_key(config), folders)
+                    self.filenames.setdefault(filename_key(config), filenames)
+            self.renders += len(renders)
+
+        budget = PathBudget()
+        results = []
+        for config in configs:
+            result = score_paths(self.folders[folder_key(config)], self.filenames[filename_key(config)],
+                                 budget, self.weights, self.fanout_limit)
+            results.append((config, result))
+        # Sorting is stable, so ties keep the order of the search space
+        results.sort(key=lambda item: item[1]["score"])
+        return results[:top]
+
+
+def _parse_value(text: str, default):
+    if isinstance(default, bool):
+        return text.lower() in ("1", "true", "yes", "y")
+    if isinstance(default, int):
+        return int(text)
+    return text
+
+
+def parse_space(specs: Iterable[str]) -> Dict[str, List]:
+    """Parse "field=value1,value2" options into a search space"""
+    defaults = asdict(ScriptConfig())
+    space = {}
+    for spec in specs:
+        name, _, values = spec.partition("=")
+        if name not in defaults:
+            raise ValueError(f"Unknown config field '{name}'")
+        space[name] = [_parse_value(value, defaults[name]) for value in values.split(",")]
+    return space
+
+
+def main(argv=None):
+    load_user_presets()
+    parser = argparse.ArgumentParser(description="Find ScriptConfig values with the fewest naming problems")
+    parser.add_argument("manifest", help="Sample tag manifest (NDJSON)")
+    parser.add_argument("--preset", help="Preset to start from (default: default settings)")
+    parser.add_argument("--field", action="append", default=[], metavar="NAME=V1,V2",
+                        help="Values to search for a field (repeatable; replaces the default search)")
+    parser.add_argument("--top", type=int, default=5, help="Number of configs to show")
+    parser.add_argument("--processes", type=int, help="Worker processes (default: CPU count)")
+    parser.add_argument("--fanout-limit", type=int, default=DEFAULT_FANOUT_LIMIT,
+                        help="Entries per folder above which fan-out is penalized")
+    args = parser.parse_args(argv)
+
+    try:
+        space = parse_space(args.field) if args.field else DEFAULT_SPACE
+    except ValueError as e:
+        parser.error(str(e))
+    try:
+        base = get_preset_by_name(args.preset) if args.preset else ScriptConfig()
+    except ValueError as e:
+        parser.error(str(e))
+    tuner = ConfigTuner(args.manifest, base, space, args.processes, fanout_limit=args.fanout_limit)
+    best = tuner.tune(args.top)
+
+    total = 1
+    for values in space.values():
+        total *= len(values)
+    print(f"{total} candidates, {tuner.renders} rendered\n", file=sys.stderr)
+    names = list(space)
+    widths = [max(len(name), *(len(str(value)) for value in space[name])) for name in names]
+    print(" ".join(f"{name:>{width}}" for name, width in zip(names, widths))
+          + f" {'collide':>8} {'overrun':>8} {'fanout':>7} {'score':>8}")
+    for config, result in best:
+        print(" ".join(f"{str(getattr(config, name)):>{width}}" for name, width in zip(names, widths))
+              + f" {result['collisions']:>8} {result['overruns']:>8} {result['fanout']:>7} {result['score']:>8.0f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,171 @@
+"""
+Manifest Module
+
+Reads and writes tag manifests: NDJSON files holding one JSON object per
+track, keyed by the tag names in script_components.STANDARD_TAGS.
+Multi-value tags are JSON arrays. The optional "_path" key holds the
+track's current file path.
+
+ManifestReader reads only the tracks of selected albums or album artists.
+It maps the file into memory and keeps a sidecar index of where each
+album and album artist's lines are, so re-planning one album only decodes
+that album's lines.
+"""
+
+import json
+import mmap
+import os
+from pathlib import Path
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple, Union
+
+
+# Manifest key holding a track's current file path
+PATH_KEY = "_path"
+
+# Tags ManifestReader indexes by default
+INDEX_KEYS = ("musicbrainz_albumid", "albumartist")
+
+# Suffix appended to a manifest's file name for its sidecar index
+INDEX_SUFFIX = ".idx.json"
+
+INDEX_VERSION = 1
+
+
+def iter_manifest(path: Union[str, Path]) -> Iterator[Dict]:
+    """Yield the tracks of a manifest one at a time"""
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            if line.strip():
+                yield json.loads(line)
+
+
+def load_manifest(path: Union[str, Path]) -> List[Dict]:
+    """Load all tracks of a manifest"""
+    return list(iter_manifest(path))
+
+
+def write_manifest(path: Union[str, Path], tracks: Iterable[Dict]) -> int:
+    """Write tracks to a manifest, returning how many were written"""
+    count = 0
+    with open(path, "w", encoding="utf-8") as f:
+        for tags in tracks:
+            f.write(json.dumps(tags, ensure_ascii=False))
+            f.write("\n")
+            count += 1
+    return count
+
+
+def index_value(value) -> str:
+    """Text a tag value is indexed under, with multiple values joined"""
+    if isinstance(value, str):
+        return value
+    return "; ".join(value)
+
+
+class ManifestReader:
+    """
+    Reads selected tracks of a manifest through mmap and an offset index.
+
+    The index maps each value of the indexed tags to the byte spans of the
+    lines holding it. Consecutive lines with the same value share one span.
+    The index is saved next to the manifest and rebuilt when the manifest's
+    size or modification time changes.
+    """
+
+    def __init__(self, path: Union[str, Path], keys: Iterable[str] = INDEX_KEYS,
+                 index_path: Optional[Union[str, Path]] = None):
+        self.path = Path(path)
+        self.keys = tuple(keys)
+        self.index_path = Path(index_path) if index_path else self.path.with_name(self.path.name + INDEX_SUFFIX)
+        self._file = open(self.path, "rb")
+        stat = os.fstat(self._file.fileno())
+        self._stamp = [stat.st_size, stat.st_mtime_ns]
+        # mmap cannot map an empty file
+        self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ) if stat.st_size else b""
+        self.rebuilt = False
+        self.spans = self._load_index()
+        if self.spans is None:
+            self.spans = self._build_index()
+            self._save_index()
+            self.rebuilt = True
+
+    def close(self):
+        if isinstance(self._map, mmap.mmap):
+            self._map.close()
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def _load_index(self) -> Optional[Dict[str, Dict[str, List[List[int]]]]]:
+        try:
+            with open(self.index_path, "r", encoding="utf-8") as f:
+                index = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if (index.get("version") != INDEX_VERSION or index.get("stamp") != self._stamp
+                or index.get("keys") != list(self.keys)):
+            return None
+        return index["spans"]
+
+    def _save_index(self):
+        index = {"version": INDEX_VERSION, "stamp": self._stamp, "keys": list(self.keys), "spans": self.spans}
+        tmp_path = self.index_path.with_name(self.index_path.name + ".tmp")
+        try:
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(index, f, ensure_ascii=False, separators=(",", ":"))
+            os.replace(tmp_path, self.index_path)
+        except OSError:
+            # A read-only location only costs a rebuild next time
+            pass
+
+    def _build_index(self) -> Dict[str, Dict[str, List[List[int]]]]:
+        data = self._map
+        size = len(data)
+        spans = {key: {} for key in self.keys}
+        pos = 0
+        while pos < size:
+            end = data.find(b"\n", pos)
+            end = size if end < 0 else end + 1
+            line = data[pos:end]
+            if line.strip():
+                tags = json.loads(line)
+                for key in self.keys:
+                    value = tags.get(key)
+                    if not value:
+                        continue
+                    value_spans = spans[key].setdefault(index_value(value), [])
+                    if value_spans and value_spans[-1][1] == pos:
+                        value_spans[-1][1] = end
+                    else:
+                        value_spans.append([pos, end])
+            pos = end
+        return spans
+
+    def values(self, key: str) -> List[str]:
+        """Get the indexed values of a tag"""
+        return list(self.spans[key])
+
+    def _iter_spans(self, spans: Iterable[Tuple[int, int]]) -> Iterator[Dict]:
+        data = self._map
+        for start, end in spans:
+            for line in data[start:end].splitlines():
+                if line.strip():
+                    yield json.loads(line)
+
+    def iter_tracks(self, key: str, values: Union[str, Iterable[str]]) -> Iterator[Dict]:
+        """Yield the tracks whose tag has one of the values, in manifest order"""
+        if key not in self.spans:
+            raise KeyError(f"Manifest is not indexed by '{key}'")
+        if isinstance(values, str):
+            values = [values]
+        index = self.spans[key]
+        spans = sorted(span for value in set(values) for span in index.get(value, ()))
+        return self._iter_spans(spans)
+
+    def iter_all(self) -> Iterator[Dict]:
+        """Yield all tracks of the manifest"""
+        return self._iter_spans([(0, len(self._map))])
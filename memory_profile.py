@@ -0,0 +1,252 @@
+#!/usr/bin/env python3
+"""
+Memory Profile Module
+
+Finds where the memory of a dry-run goes. tracemalloc traces the run and
+a snapshot is taken at each stage boundary. A stage's report gives the
+memory its allocations still hold, how far above its starting point the
+traced memory peaked, the overall peak, and the source lines holding the
+most of its memory.
+
+A streaming run goes through its stages once per chunk of tracks. The
+runs of a stage add up. Memory is counted against the stage that first
+allocated at its source line, also when a later stage or dropping the
+chunk frees it, so a stage's retained memory is what it still holds
+(caches, memos) and its peak growth is the most it held at once in any
+one run.
+
+Reports are saved as JSON. Comparing a report with one from an earlier run
+shows the stages whose own peak or retained memory grew; the overall peak
+is not compared, as it carries over what earlier stages retained.
+
+tracemalloc slows Python down several times and only sees memory
+allocated through Python, so profiling is only done when asked for. On
+Python 3.8, which cannot reset the peak, peaks are the highest traced
+memory since the run started, so only retained memory is per stage there.
+
+Run: python memory_profile.py old_report.json new_report.json [--threshold 0.1]
+"""
+
+import argparse
+import json
+import sys
+import time
+import tracemalloc
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional, Union
+
+
+REPORT_VERSION = 1
+
+# Allocations of the profiler and of importing modules. They are left out
+# of the statistics by site: filtering the traces of each snapshot instead
+# takes seconds once a run holds a few million blocks.
+_EXCLUDED_FILES = frozenset([
+    tracemalloc.__file__,
+    "<frozen importlib._bootstrap>",
+    "<frozen importlib._bootstrap_external>",
+    "<unknown>",
+    __file__,
+])
+
+
+class MemoryProfiler:
+    """
+    Traces memory per stage of a run.
+
+    Wrap each stage in stage(name); stages are expected to run one after
+    the other, and a stage run again adds to its earlier runs. top is the
+    number of allocation sites kept per stage.
+    """
+
+    def __init__(self, top: int = 10, frames: int = 1):
+        self.top = top
+        self.frames = frames
+        self.stages: List[Dict] = []
+        self._reports: Dict[str, Dict] = {}
+        # Net size and count of the blocks allocated at each site, by stage
+        self._sites: Dict[str, Dict[str, List[int]]] = {}
+        # Stage that first allocated at each site
+        self._owners: Dict[str, str] = {}
+        self._before: Optional[tracemalloc.Snapshot] = None
+        self._started_tracing = False
+
+    def start(self):
+        """Start tracing, if it is not already on"""
+        if not tracemalloc.is_tracing():
+            tracemalloc.start(self.frames)
+            self._started_tracing = True
+        self._before = tracemalloc.take_snapshot()
+
+    def stop(self):
+        """Stop tracing, if start() turned it on"""
+        if self._started_tracing:
+            tracemalloc.stop()
+            self._started_tracing = False
+        self._before = None
+
+    def _attribute(self, name: Optional[str] = None):
+        """Add the changes since the last snapshot to the stages owning their sites"""
+        after = tracemalloc.take_snapshot()
+        changed = set()
+        for stat in after.compare_to(self._before, "lineno"):
+            frame = stat.traceback[0]
+            if not stat.size_diff and not stat.count_diff or frame.filename in _EXCLUDED_FILES:
+                continue
+            site = f"{frame.filename}:{frame.lineno}"
+            owner = self._owners.get(site)
+            if owner is None:
+                # Memory freed that was allocated before any stage
+                if name is None or stat.size_diff <= 0:
+                    continue
+                owner = self._owners[site] = name
+            counts = self._sites[owner].setdefault(site, [0, 0])
+            counts[0] += stat.size_diff
+            counts[1] += stat.count_diff
+            changed.add(owner)
+        for owner in changed:
+            sites = self._sites[owner]
+            report = self._reports[owner]
+            report["retained"] = sum(size for size, _ in sites.values())
+            top = sorted(((size, count, site) for site, (size, count) in sites.items() if size > 0),
+                         reverse=True)
+            report["top"] = [{"site": site, "size": size, "count": count} for size, count, site in top[:self.top]]
+        self._before = after
+
+    def release(self):
+        """
+        Take the memory freed since the last stage off the stages that allocated it.
+
+        Call it after dropping what the stages passed along, e.g. a chunk of
+        tracks, so that only what they keep counts as retained.
+        """
+        self._attribute()
+
+    @contextmanager
+    def stage(self, name: str) -> Iterator[None]:
+        """Measure the memory allocated by the code run inside"""
+        if self._before is None:
+            self.start()
+        if hasattr(tracemalloc, "reset_peak"):
+            tracemalloc.reset_peak()
+        start_current = tracemalloc.get_traced_memory()[0]
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            seconds = time.perf_counter() - start
+            current, peak = tracemalloc.get_traced_memory()
+            report = self._reports.get(name)
+            if report is None:
+                report = self._reports[name] = {"stage": name, "runs": 0, "seconds": 0.0, "retained": 0,
+                                                "peak_growth": 0, "current": 0, "peak": 0, "top": []}
+                self.stages.append(report)
+                self._sites[name] = {}
+            report["runs"] += 1
+            report["seconds"] = round(report["seconds"] + seconds, 3)
+            report["peak_growth"] = max(report["peak_growth"], peak - start_current)
+            report["current"] = current
+            report["peak"] = max(report["peak"], peak)
+            self._attribute(name)
+
+    def report(self) -> Dict:
+        """The measurements of every stage so far"""
+        return {"version": REPORT_VERSION, "python": sys.version.split()[0], "stages": self.stages}
+
+    def save(self, path: Union[str, Path]):
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(self.report(), f, indent=2)
+            f.write("\n")
+
+    def format_text(self) -> str:
+        return format_report(self.report())
+
+
+def load_report(path: Union[str, Path]) -> Dict:
+    with open(path, "r", encoding="utf-8") as f:
+        report = json.load(f)
+    if not isinstance(report, dict) or report.get("version") != REPORT_VERSION:
+        raise ValueError(f"{path}: not a memory report of version {REPORT_VERSION}")
+    return report
+
+
+def format_size(size: float) -> str:
+    """Size in bytes as a short human-readable string, keeping its sign"""
+    sign = "-" if size < 0 else ""
+    size = abs(size)
+    for unit in ("B", "KiB", "MiB"):
+        if size < 1024:
+            return f"{sign}{size:.0f} {unit}" if unit == "B" else f"{sign}{size:.1f} {unit}"
+        size /= 1024
+    return f"{sign}{size:.2f} GiB"
+
+
+def format_report(report: Dict) -> str:
+    """Format a report as a table of stages and their top allocation sites"""
+    lines = [f"{'Stage':<12} {'runs':>6} {'seconds':>8} {'retained':>12} {'peak growth':>12} {'peak':>12}"]
+    for stage in report["stages"]:
+        lines.append(f"{stage['stage']:<12} {stage.get('runs', 1):>6} {stage['seconds']:>8.2f} "
+                     f"{format_size(stage['retained']):>12} "
+                     f"{format_size(stage['peak_growth']):>12} {format_size(stage['peak']):>12}")
+    for stage in report["stages"]:
+        if not stage["top"]:
+            continue
+        lines.append(f"\nTop allocations in {stage['stage']}:")
+        for site in stage["top"]:
+            lines.append(f"  {format_size(site['size']):>12} {site['count']:>9} blocks  {site['site']}")
+    return "\n".join(lines)
+
+
+def compare_reports(old: Dict, new: Dict, threshold: float = 0.1) -> List[Dict]:
+    """
+    Compare the stages of two reports.
+
+    A stage regressed when its peak growth or retained memory grew by
+    more than threshold (a fraction of the old value).
+    """
+    old_stages = {stage["stage"]: stage for stage in old["stages"]}
+    rows = []
+    for stage in new["stages"]:
+        before = old_stages.get(stage["stage"])
+        if before is None:
+            continue
+        row = {"stage": stage["stage"], "regressed": False}
+        for key in ("peak_growth", "retained"):
+            row[key] = (before[key], stage[key])
+            grown = stage[key] - before[key]
+            if grown > 0 and grown > threshold * max(before[key], 0):
+                row["regressed"] = True
+        rows.append(row)
+    return rows
+
+
+def format_comparison(rows: List[Dict]) -> str:
+    lines = [f"{'Stage':<12} {'old growth':>12} {'new growth':>12} {'old retained':>13} {'new retained':>13}"]
+    for row in rows:
+        (old_peak, new_peak), (old_retained, new_retained) = row["peak_growth"], row["retained"]
+        lines.append(f"{row['stage']:<12} {format_size(old_peak):>12} {format_size(new_peak):>12} "
+                     f"{format_size(old_retained):>13} {format_size(new_retained):>13}"
+                     f"{'  REGRESSED' if row['regressed'] else ''}")
+    return "\n".join(lines)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Compare the memory reports of two dry-runs")
+    parser.add_argument("old", help="Earlier memory report (JSON)")
+    parser.add_argument("new", help="Later memory report (JSON)")
+    parser.add_argument("--threshold", type=float, default=0.1,
+                        help="Growth, as a fraction, above which a stage counts as regressed")
+    args = parser.parse_args(argv)
+
+    try:
+        rows = compare_reports(load_report(args.old), load_report(args.new), args.threshold)
+    except (OSError, ValueError) as e:
+        parser.error(str(e))
+    print(format_comparison(rows))
+    if any(row["regressed"] for row in rows):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,123 @@
+"""
+Name Helpers Module
+
+Picard's artist-name transforms ($delprefix, $swapprefix, $firstalphachar
+and $initials) as plain Python functions, plus memo caches for them.
+
+These are pure functions of a few thousand distinct artist names that
+repeat across the whole library, so the engine routes them through one
+bounded memo per function. The memos belong to a run: reset_memos() clears
+them and memo_stats() reports their hit rates.
+"""
+
+import re
+from functools import lru_cache
+from typing import Callable, Dict, Hashable, Pattern, Sequence, Tuple
+
+
+DEFAULT_PREFIXES = ("A", "The")
+
+
+@lru_cache(maxsize=64)
+def _prefix_regex(prefixes: Tuple[str, ...]) -> Pattern:
+    return re.compile("(" + r"\s+)|(".join(map(re.escape, prefixes)) + r"\s+)")
+
+
+def split_prefix(text: str, prefixes: Sequence[str] = ()) -> Tuple[str, str]:
+    """Split a leading prefix ("The", "A" by default) off text: (rest, prefix)"""
+    text = text.strip()
+    match = _prefix_regex(tuple(prefixes) or DEFAULT_PREFIXES).match(text)
+    if match:
+        prefix = match.group()
+        return text[len(prefix):], prefix.strip()
+    return text, ""
+
+
+def delete_prefix(text: str, prefixes: Sequence[str] = ()) -> str:
+    """$delprefix: "The Beatles" -> "Beatles" """
+    return split_prefix(text, prefixes)[0]
+
+
+def swap_prefix(text: str, prefixes: Sequence[str] = ()) -> str:
+    """$swapprefix: "The Beatles" -> "Beatles, The" """
+    text, prefix = split_prefix(text, prefixes)
+    if prefix:
+        return f"{text}, {prefix}"
+    return text
+
+
+def first_alpha_char(text: str, nonalpha: str = "#") -> str:
+    """$firstalphachar: the uppercased first character, or nonalpha if it is not a letter"""
+    if text and text[0].isalpha():
+        return text[0].upper()
+    return nonalpha
+
+
+def initials(text: str) -> str:
+    """$initials: first letter of each space-separated word"""
+    return "".join(word[:1] for word in text.split(" ") if word[:1].isalpha())
+
+
+class MemoCache:
+    """
+    Bounded memo for a pure function.
+
+    A hit costs a single dict lookup. When full, the oldest entry is
+    evicted; with a library's worth of artist names the cache rarely fills.
+    """
+
+    def __init__(self, func: Callable, maxsize: int = 16384):
+        self.func = func
+        self.maxsize = maxsize
+        self._values: Dict[Hashable, str] = {}
+        self.hits = 0
+        self.misses = 0
+
+    def __call__(self, *key):
+        value = self._values.get(key)
+        if value is not None:
+            self.hits += 1
+            return value
+        self.misses += 1
+        value = self.func(*key)
+        if len(self._values) >= self.maxsize:
+            del self._values[next(iter(self._values))]
+        self._values[key] = value
+        return value
+
+    def clear(self):
+        """Empty the memo and reset the counters"""
+        self._values.clear()
+        self.hits = 0
+        self.misses = 0
+
+    def stats(self) -> Dict[str, float]:
+        """Get the memo counters"""
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self._values),
+            "maxsize": self.maxsize,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+        }
+
+
+# One memo per script function
+MEMOS = {
+    "delprefix": MemoCache(lambda text, prefixes: delete_prefix(text, prefixes)),
+    "swapprefix": MemoCache(lambda text, prefixes: swap_prefix(text, prefixes)),
+    "firstalphachar": MemoCache(first_alpha_char),
+    "initials": MemoCache(initials),
+}
+
+
+def reset_memos():
+    """Start a new run with empty memos"""
+    for memo in MEMOS.values():
+        memo.clear()
+
+
+def memo_stats() -> Dict[str, Dict[str, float]]:
+    """Get the counters of every memo"""
+    return {name: memo.stats() for name, memo in MEMOS.items()}
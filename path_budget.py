@@ -0,0 +1,92 @@
+"""
+Path Budget Module
+
+Checks rendered paths against filesystem length limits, which count UTF-8
+bytes rather than characters: 255 bytes per file or folder name on ext4,
+Btrfs and most other Linux filesystems, and 4096 bytes for a whole path.
+A CJK title is three bytes per character and an emoji four, so a name
+well under the character limit can still be rejected.
+
+The same folder names come back for every track of an album and every
+album of an artist, so encoded lengths are cached per distinct name.
+"""
+
+from typing import Dict, Iterable, Iterator, Optional
+
+
+# Longest file or folder name, in bytes
+COMPONENT_MAX_BYTES = 255
+
+# Longest path, in bytes
+PATH_MAX_BYTES = 4096
+
+
+class PathBudget:
+    """Finds path components and paths whose encoded length is over the limits"""
+
+    def __init__(self, component_max: int = COMPONENT_MAX_BYTES, path_max: int = PATH_MAX_BYTES,
+                 cache_size: int = 65536):
+        self.component_max = component_max
+        self.path_max = path_max
+        self.cache_size = cache_size
+        self._lengths: Dict[str, int] = {}
+        self.paths = 0
+        self.hits = 0
+        self.misses = 0
+        self.overruns = 0
+
+    def byte_length(self, text: str) -> int:
+        """UTF-8 length of a string, cached"""
+        length = self._lengths.get(text)
+        if length is None:
+            self.misses += 1
+            if len(self._lengths) >= self.cache_size:
+                self._lengths.clear()
+            length = self._lengths[text] = len(text.encode("utf-8", "surrogatepass"))
+        else:
+            self.hits += 1
+        return length
+
+    def check(self, path: str) -> Optional[Dict]:
+        """Get the overruns of a path, or None if it fits"""
+        self.paths += 1
+        components = path.split("/")
+        byte_length = self.byte_length
+        lengths = [byte_length(component) for component in components]
+        total = sum(lengths) + len(components) - 1
+        over = [(component, length) for component, length in zip(components, lengths)
+                if length > self.component_max]
+        if not over and total <= self.path_max:
+            return None
+        self.overruns += 1
+        overrun = {"path": path, "bytes": total}
+        if over:
+            overrun["components"] = [{"name": component, "bytes": length} for component, length in over]
+        return overrun
+
+    def check_all(self, paths: Iterable[str]) -> Iterator[Dict]:
+        """Yield the overruns of many paths"""
+        check = self.check
+        for path in paths:
+            overrun = check(path)
+            if overrun is not None:
+                yield overrun
+
+    def stats(self) -> Dict[str, float]:
+        """Get the checker counters"""
+        lookups = self.hits + self.misses
+        return {
+            "paths": self.paths,
+            "overruns": self.overruns,
+            "cached": len(self._lengths),
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+        }
+
+
+def format_overrun(overrun: Dict, component_max: int = COMPONENT_MAX_BYTES) -> str:
+    """Describe an overrun in one line"""
+    if "components" in overrun:
+        parts = ", ".join(f"{component['name']!r} is {component['bytes']} bytes"
+                          for component in overrun["components"])
+        return f"{overrun['path']}: {parts} (limit {component_max})"
+    return f"{overrun['path']}: path is {overrun['bytes']} bytes"
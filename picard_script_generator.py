@@ -20,6 +20,7 @@ try:
     from rich.text import Text
     from rich.prompt import Prompt, Confirm
     from rich import box
+    from rich.markup import escape
     import questionary
     from questionary import Style
 except ImportError:
@@ -32,15 +33,26 @@ except ImportError:
     from rich.text import Text
     from rich.prompt import Prompt, Confirm
     from rich import box
+    from rich.markup import escape
     import questionary
     from questionary import Style
 
 from script_builder import ScriptConfig, ScriptBuilder, generate_simple_script
-from presets import PRESETS, get_preset_by_name, get_preset_example
+from presets import PRESETS, get_preset_by_name, get_preset_example, get_preset_examples, load_user_presets
+from script_cost import CostCache, estimate_cost
+from script_preview import ExampleCache, ScriptPreview
 
 # Initialize Rich console
 console = Console()
 
+# Sample paths shown while customizing, reusing unchanged script sections
+# and rendering each distinct config once
+live_preview = ScriptPreview()
+live_examples = ExampleCache(live_preview)
+
+# Costs hinted next to each setting, estimated once per distinct config
+setting_costs = CostCache(live_preview.sections)
+
 # Custom questionary style
 custom_style = Style([
     ('qmark', 'fg:cyan bold'),
@@ -127,13 +139,21 @@ def show_preset_details(preset_name: str):
     print_header()
     
     preset = PRESETS[preset_name]
-    config = get_preset_by_name(preset_name)
+    try:
+        config = get_preset_by_name(preset_name)
+    except (OSError, ValueError) as e:
+        console.print(f"\n[bold red]✗ Cannot load {preset['name']}:[/bold red] {e}")
+        console.print("\n[dim]Press Enter to continue...[/dim]")
+        input()
+        return "back"
     
     console.print(f"\n[bold green]✓ Selected: {preset['name']}[/bold green]\n")
     
-    # Show example output
+    # Show example output, rendered from the preset's script
+    examples = get_preset_examples(preset_name)
+    width = max(len(kind) for kind in examples)
     console.print(Panel(
-        f"[cyan]{preset['example']}[/cyan]",
+        "\n".join(f"[dim]{kind:<{width}}[/dim]  [cyan]{escape(path)}[/cyan]" for kind, path in examples.items()),
         title="[bold]Example Output[/bold]",
         border_style="cyan"
     ))
@@ -165,30 +185,67 @@ def show_preset_details(preset_name: str):
     ).ask()
 
 
+def cost_hint(config: ScriptConfig, **changes) -> str:
+    """Describe how changing settings would change the per-file script cost"""
+    change = setting_costs.change_cost(config, **changes)
+    return f"  (toggle: {change.describe_change()})"
+
+
+def show_live_preview(config: ScriptConfig, previous: dict = None) -> dict:
+    """Show the paths of the sample tracks, highlighting those that changed"""
+    misses = live_examples.misses
+    paths = live_examples.examples(config)
+    changed = live_preview.changes(previous, paths) if previous else []
+    timing = f"{live_preview.seconds * 1000:.1f} ms" if live_examples.misses > misses else "cached"
+    table = Table(box=box.SIMPLE, show_header=False, padding=(0, 1))
+    table.add_column("Sample", style="dim")
+    table.add_column("Path")
+    for kind, path in paths.items():
+        style = "bold yellow" if kind in changed else "green"
+        table.add_row(kind, f"[{style}]{escape(path)}[/{style}]")
+    console.print(Panel(
+        table,
+        title="[bold]Live Preview[/bold]",
+        subtitle=f"[dim]{timing}[/dim]",
+        border_style="cyan",
+    ))
+    return paths
+
+
 def customize_config(config: ScriptConfig) -> ScriptConfig:
     """Allow user to customize a configuration"""
-    clear_screen()
-    print_header()
-    console.print("\n[bold cyan]🔧 Customize Your Script[/bold cyan]")
-    console.print("[dim]Modify the settings below. Press Enter to keep the default.[/dim]\n")
+    paths = None
     
     while True:
-        # Show current settings as a menu
+        clear_screen()
+        print_header()
+        console.print("\n[bold cyan]🔧 Customize Your Script[/bold cyan]")
+        console.print("[dim]Modify the settings below. Press Enter to keep the default.[/dim]\n")
+        paths = show_live_preview(config, paths)
+        
+        base_cost = setting_costs.cost(config)
+        alpha = config.artist_folder_style == "first_letter_subfolder"
+        
+        # Show current settings as a menu, with what each toggle would cost
         choices = [
             questionary.Choice(
-                f"Artist Folder: {'Yes' if config.use_artist_folder else 'No'}", 
+                f"Artist Folder: {'Yes' if config.use_artist_folder else 'No'}"
+                + cost_hint(config, use_artist_folder=not config.use_artist_folder),
                 value="artist_folder"
             ),
             questionary.Choice(
-                f"Album Folder: {'Yes' if config.use_album_folder else 'No'}", 
+                f"Album Folder: {'Yes' if config.use_album_folder else 'No'}"
+                + cost_hint(config, use_album_folder=not config.use_album_folder),
                 value="album_folder"
             ),
             questionary.Choice(
-                f"Year in Album: {'Yes' if config.include_year_in_album else 'No'} ({config.year_position})", 
+                f"Year in Album: {'Yes' if config.include_year_in_album else 'No'} ({config.year_position})"
+                + cost_hint(config, include_year_in_album=not config.include_year_in_album),
                 value="year_album"
             ),
             questionary.Choice(
-                f"Disc Subfolders: {'Yes' if config.use_disc_subfolder else 'No'}", 
+                f"Disc Subfolders: {'Yes' if config.use_disc_subfolder else 'No'}"
+                + cost_hint(config, use_disc_subfolder=not config.use_disc_subfolder),
                 value="disc_subfolder"
             ),
             questionary.Choice(
@@ -196,23 +253,34 @@ def customize_config(config: ScriptConfig) -> ScriptConfig:
                 value="track_padding"
             ),
             questionary.Choice(
-                f"Featured Artists: {'Yes' if config.show_featured_artists else 'No'}", 
+                f"Featured Artists: {'Yes' if config.show_featured_artists else 'No'}"
+                + cost_hint(config, show_featured_artists=not config.show_featured_artists),
                 value="featured"
             ),
             questionary.Choice(
-                f"Include Label: {'Yes' if config.include_label else 'No'}", 
+                f"Include Disambiguation: {'Yes' if config.include_disambiguation else 'No'}"
+                + cost_hint(config, include_disambiguation=not config.include_disambiguation),
+                value="disambiguation"
+            ),
+            questionary.Choice(
+                f"Include Label: {'Yes' if config.include_label else 'No'}"
+                + cost_hint(config, include_label=not config.include_label),
                 value="label"
             ),
             questionary.Choice(
-                f"Include Catalog #: {'Yes' if config.include_catalog else 'No'}", 
+                f"Include Catalog #: {'Yes' if config.include_catalog else 'No'}"
+                + cost_hint(config, include_catalog=not config.include_catalog),
                 value="catalog"
             ),
             questionary.Choice(
-                f"Include Format: {'Yes' if config.include_format else 'No'}", 
+                f"Include Format: {'Yes' if config.include_format else 'No'}"
+                + cost_hint(config, include_format=not config.include_format),
                 value="format"
             ),
             questionary.Choice(
-                f"Alphabetical Folders: {'Yes' if config.artist_folder_style == 'first_letter_subfolder' else 'No'}", 
+                f"Alphabetical Folders: {'Yes' if alpha else 'No'}"
+                + cost_hint(config,
+                            artist_folder_style="standard" if alpha else "first_letter_subfolder"),
                 value="alpha_folders"
             ),
             questionary.Separator(),
@@ -221,7 +289,7 @@ def customize_config(config: ScriptConfig) -> ScriptConfig:
         ]
         
         answer = questionary.select(
-            "Select a setting to modify:",
+            f"Select a setting to modify (per file: {base_cost.describe()}):",
             choices=choices,
             style=custom_style,
         ).ask()
@@ -306,6 +374,13 @@ def customize_config(config: ScriptConfig) -> ScriptConfig:
                     style=custom_style,
                 ).ask()
                 
+        elif answer == "disambiguation":
+            config.include_disambiguation = questionary.confirm(
+                "Include disambiguation in album folder (e.g., 'Abbey Road (Remaster)')?",
+                default=config.include_disambiguation,
+                style=custom_style,
+            ).ask()
+            
         elif answer == "label":
             config.include_label = questionary.confirm(
                 "Include record label in album folder?",
@@ -346,68 +421,75 @@ def custom_build_wizard() -> ScriptConfig:
     console.print("[dim]Answer a few questions to build your perfect naming script.[/dim]\n")
     
     config = ScriptConfig()
+    paths = show_live_preview(config)
+    
+    def answer(field: str, question, value=None):
+        """Ask a question, store the answer in config and refresh the preview"""
+        nonlocal paths
+        result = question.ask()
+        setattr(config, field, value(result) if value else result)
+        paths = show_live_preview(config, paths)
+        return result
     
     # Step 1: Folder Structure
     console.print("[bold]Step 1/5: Folder Structure[/bold]\n")
     
-    config.use_artist_folder = questionary.confirm(
+    answer("use_artist_folder", questionary.confirm(
         "Create artist folders?",
         default=True,
         style=custom_style,
-    ).ask()
+    ))
     
     if config.use_artist_folder:
-        use_alpha = questionary.confirm(
+        answer("artist_folder_style", questionary.confirm(
             "Group artists alphabetically (A/, B/, C/...)?",
             default=False,
             style=custom_style,
-        ).ask()
-        config.artist_folder_style = "first_letter_subfolder" if use_alpha else "standard"
+        ), lambda use_alpha: "first_letter_subfolder" if use_alpha else "standard")
         
-        use_sort = questionary.confirm(
+        answer("format_album_artist", questionary.confirm(
             "Use artist sort name? (e.g., 'Beatles, The' instead of 'The Beatles')",
             default=False,
             style=custom_style,
-        ).ask()
-        config.format_album_artist = "sort" if use_sort else "standard"
+        ), lambda use_sort: "sort" if use_sort else "standard")
     
-    config.use_album_folder = questionary.confirm(
+    answer("use_album_folder", questionary.confirm(
         "Create album folders?",
         default=True,
         style=custom_style,
-    ).ask()
+    ))
     
     # Step 2: Album Folder Details
     console.print("\n[bold]Step 2/5: Album Folder Details[/bold]\n")
     
     if config.use_album_folder:
-        config.include_year_in_album = questionary.confirm(
+        answer("include_year_in_album", questionary.confirm(
             "Include release year in album folder?",
             default=True,
             style=custom_style,
-        ).ask()
+        ))
         
         if config.include_year_in_album:
-            config.year_position = questionary.select(
+            answer("year_position", questionary.select(
                 "Year position:",
                 choices=[
                     questionary.Choice("[Year] Album Name", value="prefix"),
                     questionary.Choice("Album Name [Year]", value="suffix"),
                 ],
                 style=custom_style,
-            ).ask()
+            ))
             
-            config.use_original_year = questionary.confirm(
+            answer("use_original_year", questionary.confirm(
                 "Prefer original release year over reissue year?",
                 default=True,
                 style=custom_style,
-            ).ask()
+            ))
         
-        config.include_disambiguation = questionary.confirm(
+        answer("include_disambiguation", questionary.confirm(
             "Include disambiguation (e.g., 'Abbey Road (Remaster)')?",
             default=False,
             style=custom_style,
-        ).ask()
+        ))
         
         include_extra = questionary.confirm(
             "Include additional info in album folder?",
@@ -416,33 +498,33 @@ def custom_build_wizard() -> ScriptConfig:
         ).ask()
         
         if include_extra:
-            config.include_label = questionary.confirm(
+            answer("include_label", questionary.confirm(
                 "  Include record label?",
                 default=False,
                 style=custom_style,
-            ).ask()
-            config.include_catalog = questionary.confirm(
+            ))
+            answer("include_catalog", questionary.confirm(
                 "  Include catalog number?",
                 default=False,
                 style=custom_style,
-            ).ask()
-            config.include_format = questionary.confirm(
+            ))
+            answer("include_format", questionary.confirm(
                 "  Include audio format (FLAC, MP3)?",
                 default=False,
                 style=custom_style,
-            ).ask()
+            ))
     
     # Step 3: Multi-disc Handling
     console.print("\n[bold]Step 3/5: Multi-disc Albums[/bold]\n")
     
-    config.use_disc_subfolder = questionary.confirm(
+    answer("use_disc_subfolder", questionary.confirm(
         "Create subfolders for multi-disc albums?",
         default=True,
         style=custom_style,
-    ).ask()
+    ))
     
     if config.use_disc_subfolder:
-        config.disc_folder_format = questionary.select(
+        answer("disc_folder_format", questionary.select(
             "Disc folder naming:",
             choices=[
                 questionary.Choice("Disc 1, Disc 2...", value="disc"),
@@ -450,31 +532,31 @@ def custom_build_wizard() -> ScriptConfig:
                 questionary.Choice("Side A, Side B...", value="side"),
             ],
             style=custom_style,
-        ).ask()
+        ))
         
-        config.include_disc_subtitle = questionary.confirm(
+        answer("include_disc_subtitle", questionary.confirm(
             "Include disc subtitle if available?",
             default=True,
             style=custom_style,
-        ).ask()
+        ))
     else:
-        config.include_disc_in_track = questionary.confirm(
+        answer("include_disc_in_track", questionary.confirm(
             "Include disc number in track number (1-01, 1-02)?",
             default=True,
             style=custom_style,
-        ).ask()
+        ))
     
     # Step 4: Filename Format
     console.print("\n[bold]Step 4/5: Filename Format[/bold]\n")
     
-    config.include_track_number = questionary.confirm(
+    answer("include_track_number", questionary.confirm(
         "Include track number?",
         default=True,
         style=custom_style,
-    ).ask()
+    ))
     
     if config.include_track_number:
-        padding = questionary.select(
+        answer("track_padding_length", questionary.select(
             "Track number padding:",
             choices=[
                 questionary.Choice("1 digit (1, 2, 3...)", value="1"),
@@ -483,34 +565,33 @@ def custom_build_wizard() -> ScriptConfig:
             ],
             default="2",
             style=custom_style,
-        ).ask()
-        config.track_padding_length = int(padding)
+        ), int)
     
     config.include_title = True  # Always include title
     
-    config.include_artist_in_filename = questionary.confirm(
+    answer("include_artist_in_filename", questionary.confirm(
         "Always include artist in filename?",
         default=False,
         style=custom_style,
-    ).ask()
+    ))
     
     # Step 5: Special Handling
     console.print("\n[bold]Step 5/5: Special Handling[/bold]\n")
     
-    config.include_track_artist_for_va = questionary.confirm(
+    answer("include_track_artist_for_va", questionary.confirm(
         "Include track artist for Various Artists albums?",
         default=True,
         style=custom_style,
-    ).ask()
+    ))
     
-    config.show_featured_artists = questionary.confirm(
+    answer("show_featured_artists", questionary.confirm(
         "Show featured artists in filename?",
         default=True,
         style=custom_style,
-    ).ask()
+    ))
     
     if config.show_featured_artists:
-        config.feat_format = questionary.select(
+        answer("feat_format", questionary.select(
             "Featured artist format:",
             choices=[
                 questionary.Choice("[feat. Artist]", value="feat."),
@@ -519,13 +600,13 @@ def custom_build_wizard() -> ScriptConfig:
                 questionary.Choice("[with Artist]", value="with"),
             ],
             style=custom_style,
-        ).ask()
+        ))
     
-    config.separate_soundtracks = questionary.confirm(
+    answer("separate_soundtracks", questionary.confirm(
         "Put soundtracks in a separate 'Soundtracks' folder?",
         default=False,
         style=custom_style,
-    ).ask()
+    ))
     
     return config
 
@@ -548,6 +629,21 @@ def preview_script(config: ScriptConfig):
         expand=False
     ))
     
+    # Show what the script costs Picard for every file it names
+    cost = estimate_cost(script)
+    table = Table(title="Estimated Cost (worst-case branch)", box=box.ROUNDED)
+    table.add_column("Operation", style="cyan")
+    table.add_column("Per File", style="green", justify="right")
+    table.add_column("Per 10,000 Files", style="green", justify="right")
+    table.add_column("Per 1,000,000 Files", style="green", justify="right")
+    for label, value in (
+        ("Function calls", cost.calls),
+        ("Regex evaluations", cost.regex),
+        ("String builds", cost.builds),
+    ):
+        table.add_row(label, f"{value:,}", f"{value * 10_000:,}", f"{value * 1_000_000:,}")
+    console.print(table)
+    
     return script
 
 
@@ -572,23 +668,38 @@ def save_script(script: str, filename: str = None) -> str:
 
 
 def show_presets_overview():
-    """Show a table of all presets"""
-    clear_screen()
-    print_header()
-    console.print("\n[bold cyan]📋 Available Presets[/bold cyan]\n")
-    
-    table = Table(title="Preset Templates", box=box.ROUNDED)
-    table.add_column("Name", style="cyan bold")
-    table.add_column("Description", style="white")
-    table.add_column("Example Output", style="green")
-    
-    for key, preset in PRESETS.items():
-        table.add_row(preset["name"], preset["description"], preset["example"])
-    
-    console.print(table)
-    
-    console.print("\n[dim]Press Enter to return to the main menu...[/dim]")
-    input()
+    """Show a table of all presets, and the example output of the one selected"""
+    example_key = None
+    while True:
+        clear_screen()
+        print_header()
+        console.print("\n[bold cyan]📋 Available Presets[/bold cyan]\n")
+        
+        # Names and descriptions come from the preset index, so listing
+        # does not read or build the presets
+        table = Table(title="Preset Templates", box=box.ROUNDED)
+        table.add_column("Name", style="cyan bold")
+        table.add_column("Description", style="white")
+        for preset in PRESETS.values():
+            table.add_row(preset["name"], preset["description"])
+        console.print(table)
+        
+        if example_key is not None:
+            try:
+                example = f"[green]{escape(get_preset_example(example_key))}[/green]"
+            except (OSError, ValueError) as e:
+                example = f"[red]{escape(str(e))}[/red]"
+            console.print(f"\n[bold]{escape(PRESETS[example_key]['name'])}:[/bold] {example}")
+        
+        choices = [questionary.Choice(preset["name"], value=key) for key, preset in PRESETS.items()]
+        choices.append(questionary.Choice("← Back to Main Menu", value="back"))
+        example_key = questionary.select(
+            "\nShow the example output of:",
+            choices=choices,
+            style=custom_style,
+        ).ask()
+        if example_key in (None, "back"):
+            return
 
 
 def show_help():
@@ -653,6 +764,9 @@ Press Enter to return to the main menu...
 
 def main():
     """Main application entry point"""
+    for filename, problem in load_user_presets().items():
+        console.print(f"[dim]Skipped preset file {filename}: {problem}[/dim]")
+    
     try:
         while True:
             choice = show_main_menu()
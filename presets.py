@@ -3,9 +3,36 @@ Preset Templates for Picard Script Generator
 
 Pre-configured script settings for common use cases.
 Users can select a preset and optionally customize it further.
+
+Besides the built-in presets, presets can be loaded from a directory of
+JSON or TOML files (see load_preset_directory). Only their names and
+descriptions are read when the directory is listed, from a sidecar index
+kept by file modification time; a preset's settings are read and checked
+the first time it is used. A preset file looks like:
+
+    {
+        "name": "Label Archive",
+        "description": "Detailed, with 3-digit track numbers",
+        "base": "detailed",
+        "config": {"track_padding_length": 3, "max_filename_length": 160}
+    }
+
+or the same keys in TOML, with the settings in a [config] table.
 """
 
-from script_builder import ScriptConfig
+import json
+import os
+from dataclasses import asdict, fields
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple, Union
+
+from script_builder import ScriptBuilder, ScriptConfig
+from script_preview import ExampleCache
+
+try:
+    import tomllib
+except ImportError:  # Python < 3.11
+    tomllib = None
 
 
 def get_preset_simple() -> ScriptConfig:
@@ -253,41 +280,228 @@ PRESETS = {
         "name": "Simple",
         "description": "Basic: Artist/[Year] Album/01. Title",
         "getter": get_preset_simple,
-        "example": "The Beatles/[1969] Abbey Road/01. Come Together.mp3"
     },
     "organized": {
         "name": "Organized",
         "description": "Alphabetical: A/Artist/[Year] Album/Disc 1/01. Title",
         "getter": get_preset_organized,
-        "example": "T/The Beatles/[1969] Abbey Road (Remaster)/Disc 1/01. Come Together.mp3"
     },
     "detailed": {
         "name": "Detailed",
         "description": "Full info: A/Artist/[Year] Album [Label] {Cat#}/01. Title",
         "getter": get_preset_detailed,
-        "example": "T/The Beatles/[1969] Abbey Road [Apple] {PCS7088}/01. Come Together.mp3"
     },
     "flat": {
         "name": "Flat",
         "description": "No disc folders: Artist/[Year] Album/1-01. Title",
         "getter": get_preset_flat,
-        "example": "The Beatles/[1969] Abbey Road/1-01. Come Together.mp3"
     },
     "minimal": {
         "name": "Minimal",
         "description": "Album only: Album/01. Artist - Title",
         "getter": get_preset_minimal,
-        "example": "Abbey Road/01. The Beatles - Come Together.mp3"
     },
     "audiophile": {
         "name": "Audiophile",
         "description": "With format: A/Artist/[Year] Album [FLAC]/01. Title",
         "getter": get_preset_audiophile,
-        "example": "B/Beatles, The/[1969] Abbey Road [FLAC]/01. Come Together.flac"
     },
 }
 
 
+# Presets defined in code, which preset files can use as their base
+BUILTIN_PRESETS = tuple(PRESETS)
+
+# Environment variable naming a directory of preset files
+PRESETS_DIR_ENV = "PICARD_PRESETS_DIR"
+
+# Directory of preset files used when the variable is not set
+DEFAULT_PRESETS_DIR = Path(__file__).resolve().parent / "user_presets"
+
+PRESET_SUFFIXES = (".json", ".toml")
+
+# Sidecar index of the listing fields of each preset file
+PRESET_INDEX_NAME = ".preset-index.json"
+
+PRESET_INDEX_VERSION = 2
+
+# Allowed values of the settings that name one of a few choices
+CONFIG_CHOICES = {
+    "artist_folder_style": ("standard", "first_letter_subfolder"),
+    "year_position": ("prefix", "suffix"),
+    "disc_folder_format": ("disc", "side", "cd"),
+    "feat_format": ("feat.", "ft.", "featuring", "with"),
+    "sanitize_scope": ("fields", "path"),
+    "sanitize_policy": ("underscore", "safe_replacements"),
+    "length_unit": ("bytes", "characters"),
+    "format_album_artist": ("standard", "sort"),
+}
+
+
+def _stamp(path: Union[str, Path]) -> List[int]:
+    stat = os.stat(path)
+    return [stat.st_size, stat.st_mtime_ns]
+
+
+def read_preset_file(path: Union[str, Path]) -> Dict:
+    """Read a JSON or TOML preset file"""
+    path = Path(path)
+    if path.suffix == ".toml":
+        if tomllib is None:
+            raise ValueError(f"{path.name}: TOML presets need Python 3.11 or later")
+        with open(path, "rb") as f:
+            try:
+                return tomllib.load(f)
+            except tomllib.TOMLDecodeError as e:
+                raise ValueError(f"{path.name}: {e}") from None
+    with open(path, "r", encoding="utf-8") as f:
+        try:
+            data = json.load(f)
+        except ValueError as e:
+            raise ValueError(f"{path.name}: {e}") from None
+    if not isinstance(data, dict):
+        raise ValueError(f"{path.name}: expected an object")
+    return data
+
+
+def preset_config_fields(data: Dict, source: str = "preset") -> Dict:
+    """
+    Check the settings of a preset file and return them as ScriptConfig fields.
+
+    Settings are given under "config", on top of the built-in preset named
+    by "base" if any.
+    """
+    base = data.get("base")
+    if base is not None and base not in BUILTIN_PRESETS:
+        raise ValueError(f"{source}: unknown base preset '{base}'")
+    defaults = {f.name: f.default for f in fields(ScriptConfig)}
+    values = asdict(PRESETS[base]["getter"]()) if base else {}
+    config = data.get("config", {})
+    if not isinstance(config, dict):
+        raise ValueError(f"{source}: 'config' must be an object")
+    for name, value in config.items():
+        if name not in defaults:
+            raise ValueError(f"{source}: unknown setting '{name}'")
+        expected = type(defaults[name])
+        if type(value) is not expected:
+            raise ValueError(f"{source}: setting '{name}' must be {expected.__name__}, not {type(value).__name__}")
+        choices = CONFIG_CHOICES.get(name)
+        if choices is not None and value not in choices:
+            raise ValueError(f"{source}: setting '{name}' must be one of {', '.join(choices)}, not '{value}'")
+        # The integer settings are all lengths
+        if expected is int and value <= 0:
+            raise ValueError(f"{source}: setting '{name}' must be positive, not {value}")
+        values[name] = value
+    return values
+
+
+class PresetFile:
+    """A preset defined in a file, read on first use and again when the file changes"""
+
+    def __init__(self, path: Union[str, Path], stamp: Optional[List[int]] = None):
+        self.path = path
+        self.stamp = stamp
+        self._fields: Optional[Dict] = None
+
+    def current_stamp(self) -> List[int]:
+        return _stamp(self.path)
+
+    def config(self) -> ScriptConfig:
+        """Get the preset's configuration"""
+        stamp = self.current_stamp()
+        if self._fields is None or stamp != self.stamp:
+            self._fields = preset_config_fields(read_preset_file(self.path), os.path.basename(self.path))
+            self.stamp = stamp
+        return ScriptConfig(**self._fields)
+
+
+def _load_index(directory: Path) -> Dict[str, Dict]:
+    try:
+        with open(directory / PRESET_INDEX_NAME, "r", encoding="utf-8") as f:
+            index = json.load(f)
+    except (OSError, ValueError):
+        return {}
+    if index.get("version") != PRESET_INDEX_VERSION:
+        return {}
+    return index.get("files", {})
+
+
+def _save_index(directory: Path, files: Dict[str, Dict]):
+    index_path = directory / PRESET_INDEX_NAME
+    tmp_path = index_path.with_name(index_path.name + ".tmp")
+    try:
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"version": PRESET_INDEX_VERSION, "files": files}, f, ensure_ascii=False)
+        os.replace(tmp_path, index_path)
+    except OSError:
+        # A read-only directory only costs reading the files next time
+        pass
+
+
+def load_preset_directory(directory: Union[str, Path]) -> Dict[str, str]:
+    """
+    Add the presets of a directory of .json and .toml files to PRESETS.
+
+    Each file's name without suffix is its preset key. Files are only read
+    when they changed since the index was last saved. Returns the problems
+    of the files that could not be added, by file name, or the problem of
+    the directory itself when it cannot be listed.
+    """
+    directory = Path(directory)
+    index = _load_index(directory)
+    files: Dict[str, Dict] = {}
+    problems: Dict[str, str] = {}
+    try:
+        with os.scandir(directory) as entries:
+            # Hidden files include the index itself
+            found = sorted((entry.name, entry) for entry in entries
+                           if not entry.name.startswith(".") and entry.name.endswith(PRESET_SUFFIXES)
+                           and entry.is_file())
+    except OSError as e:
+        return {str(directory): e.strerror or str(e)}
+    # File defining each preset key, the first by name for keys defined twice
+    defined: Dict[str, str] = {}
+    for filename, entry in found:
+        key = os.path.splitext(filename)[0]
+        if key in BUILTIN_PRESETS:
+            problems[filename] = f"'{key}' is a built-in preset"
+            continue
+        if key in defined:
+            problems[filename] = f"'{key}' is already defined by {defined[key]}"
+            continue
+        defined[key] = filename
+        stat = entry.stat()
+        stamp = [stat.st_size, stat.st_mtime_ns]
+        listing = index.get(filename)
+        if listing is None or listing.get("stamp") != stamp:
+            try:
+                data = read_preset_file(entry.path)
+            except (OSError, ValueError) as e:
+                problems[filename] = str(e)
+                continue
+            listing = {"stamp": stamp, "name": str(data.get("name") or key),
+                       "description": str(data.get("description", ""))}
+        files[filename] = listing
+        preset = PresetFile(entry.path, stamp)
+        PRESETS[key] = {
+            "name": listing["name"],
+            "description": listing["description"],
+            "getter": preset.config,
+            "file": preset,
+        }
+    if files != index:
+        _save_index(directory, files)
+    return problems
+
+
+def load_user_presets() -> Dict[str, str]:
+    """Load the preset files of the directory named by PICARD_PRESETS_DIR, or of user_presets/"""
+    directory = os.environ.get(PRESETS_DIR_ENV) or DEFAULT_PRESETS_DIR
+    if not os.path.isdir(directory):
+        return {}
+    return load_preset_directory(directory)
+
+
 def get_preset_list():
     """Get list of preset names and descriptions"""
     return [(key, preset["name"], preset["description"]) 
@@ -301,8 +515,35 @@ def get_preset_by_name(name: str) -> ScriptConfig:
     raise ValueError(f"Unknown preset: {name}")
 
 
+# Built scripts by preset key, with the stamp of the preset file they came from
+_scripts: Dict[str, Tuple[Optional[List[int]], str]] = {}
+
+
+def get_preset_script(name: str) -> str:
+    """Get the script built from a preset, rebuilt only when its file changes"""
+    if name not in PRESETS:
+        raise ValueError(f"Unknown preset: {name}")
+    preset_file = PRESETS[name].get("file")
+    stamp = preset_file.current_stamp() if preset_file is not None else None
+    cached = _scripts.get(name)
+    if cached is not None and cached[0] == stamp:
+        return cached[1]
+    script = ScriptBuilder(get_preset_by_name(name)).build()
+    _scripts[name] = (stamp, script)
+    return script
+
+
+# Example paths by config content, shared by all presets
+_examples = ExampleCache()
+
+
+def get_preset_examples(name: str) -> Dict[str, str]:
+    """Get the paths a preset gives the built-in sample tracks, by kind of release"""
+    return _examples.examples(get_preset_by_name(name))
+
+
 def get_preset_example(name: str) -> str:
-    """Get example output for a preset"""
+    """Get example output for a preset: the path of the single-disc sample track"""
     if name in PRESETS:
-        return PRESETS[name]["example"]
+        return next(iter(get_preset_examples(name).values()))
     return ""
@@ -0,0 +1,377 @@
+#!/usr/bin/env python3
+"""
+Rename Pipeline
+
+Plans the renaming of a whole library in one pass, as an asyncio pipeline:
+
+    scan -> read tags -> render -> check -> write plan
+
+Stages are connected by bounded queues, so a slow stage holds back the
+ones before it instead of letting work pile up in memory. Directory
+listing, tag reading and plan writing are blocking I/O and run in a thread
+pool. Rendering runs in a process pool, in chunks of tracks. A track
+whose script loops go over the evaluation budget is left out of the plan
+and reported instead of stalling its worker.
+
+Each stage reports how many items it handled, how long it was busy and
+how deep its input queue got. The stage whose input queue stays full is
+the bottleneck. The same numbers, with CPU time and peak memory, can be
+written as run metrics (see run_metrics) while the pipeline runs.
+
+Run: python rename_pipeline.py my_script.pts /music --plan plan.ndjson
+     python rename_pipeline.py my_script.pts /music --plan plan.ndjson --manifest library.ndjson
+     python rename_pipeline.py my_script.pts /music --plan plan.ndjson --metrics-json metrics.json
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import sys
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from manifest import PATH_KEY
+from path_budget import PathBudget
+from rename_plan import CollisionChecker
+from run_metrics import RunMetrics
+from script_batch import path_renderer
+from script_engine import DEFAULT_MAX_SECONDS, DEFAULT_MAX_STEPS, EvaluationBudget, ScriptError, compile_script
+from tag_reader import AUDIO_EXTENSIONS, ManifestTagReader, TagReader, has_mutagen, read_file_tags
+
+
+# Marks the end of a queue's items
+DONE = object()
+
+
+@dataclass
+class StageMetrics:
+    """Counters for one pipeline stage"""
+    name: str
+    items: int = 0
+    busy: float = 0.0
+    queue_max: int = 0
+    queue_total: int = 0
+    samples: int = 0
+
+    def sample_queue(self, queue: asyncio.Queue):
+        """Record the depth of the stage's input queue"""
+        depth = queue.qsize()
+        self.queue_total += depth
+        self.samples += 1
+        if depth > self.queue_max:
+            self.queue_max = depth
+
+    @property
+    def queue_mean(self) -> float:
+        return self.queue_total / self.samples if self.samples else 0.0
+
+
+# =============================================================================
+# RENDER WORKERS
+# =============================================================================
+
+_worker_render = None
+
+# Tracks of the current chunk that went over the budget, as (source, reason)
+_worker_skipped: List[Tuple[str, str]] = []
+
+
+def _init_render_worker(script: str, max_steps: Optional[int], max_seconds: Optional[float]):
+    """Compile the script once per worker process"""
+    global _worker_render
+    budget = EvaluationBudget(max_steps, max_seconds) if max_steps or max_seconds else None
+    _worker_render = path_renderer(
+        script, budget=budget, on_exceeded=lambda tags, e: _worker_skipped.append((tags[PATH_KEY], str(e))))
+
+
+def _render_chunk(tracks: List[Dict], dest: str) -> Tuple[List[Tuple[str, str]], List[Tuple[str, str]], float]:
+    """Render the targets of a chunk of tracks, with the skipped tracks and the time it took"""
+    start = time.perf_counter()
+    pairs = [(tags[PATH_KEY], os.path.join(dest, path))
+             for tags, path in zip(tracks, _worker_render(tracks)) if path is not None]
+    skipped = list(_worker_skipped)
+    _worker_skipped.clear()
+    return pairs, skipped, time.perf_counter() - start
+
+
+def _timed(func, *args):
+    """Call func in a worker thread, returning its result and the time it took"""
+    start = time.perf_counter()
+    result = func(*args)
+    return result, time.perf_counter() - start
+
+
+def _list_directory(path: str, extensions: Iterable[str]) -> Tuple[List[str], List[str]]:
+    """Audio files and subdirectories of a directory, sorted"""
+    files, directories = [], []
+    try:
+        with os.scandir(path) as entries:
+            for entry in entries:
+                if entry.is_dir(follow_symlinks=False):
+                    directories.append(entry.path)
+                elif os.path.splitext(entry.name)[1].lower() in extensions:
+                    files.append(entry.path)
+    except OSError:
+        pass
+    return sorted(files), sorted(directories, reverse=True)
+
+
+# =============================================================================
+# PIPELINE
+# =============================================================================
+
+class RenamePipeline:
+    """
+    Scans a library and writes the rename plan its naming script gives.
+
+    read_tags is called with each file path and returns its tags, or None
+    to skip the file. By default tags are read with mutagen.
+    """
+
+    STAGES = ("scan", "read", "render", "check", "write")
+
+    def __init__(self, script: str, root: str, plan_path: str, dest: Optional[str] = None,
+                 read_tags: Optional[TagReader] = None, queue_size: int = 1000,
+                 readers: int = 8, processes: Optional[int] = None, chunk_size: int = 500,
+                 case_sensitive: bool = False, extensions: Iterable[str] = AUDIO_EXTENSIONS,
+                 run_metrics: Optional[RunMetrics] = None, max_steps: Optional[int] = DEFAULT_MAX_STEPS,
+                 max_seconds: Optional[float] = DEFAULT_MAX_SECONDS):
+        if read_tags is None:
+            if not has_mutagen():
+                raise RuntimeError("Reading tags from audio files needs mutagen (pip install mutagen); "
+                                   "or look tags up in a manifest instead")
+            read_tags = read_file_tags
+        # Fail before starting any worker if the script does not compile
+        compile_script(script)
+        self.script = script
+        self.root = root
+        self.plan_path = plan_path
+        self.dest = root if dest is None else dest
+        self.read_tags = read_tags
+        self.queue_size = queue_size
+        self.readers = readers
+        self.processes = processes or os.cpu_count() or 1
+        self.chunk_size = chunk_size
+        self.extensions = frozenset(extension.lower() for extension in extensions)
+        self.max_steps = max_steps
+        self.max_seconds = max_seconds
+        # Tracks over the evaluation budget, as (source, reason)
+        self.skipped: List[Tuple[str, str]] = []
+        self.checker = CollisionChecker(case_sensitive)
+        self.budget = PathBudget()
+        self.metrics = {name: StageMetrics(name) for name in self.STAGES}
+        self.elapsed = 0.0
+        self.run_metrics = run_metrics
+        if run_metrics is not None:
+            for metrics in self.metrics.values():
+                run_metrics.add_stage(metrics)
+            run_metrics.add_cache("path_lengths", lambda: {"hits": self.budget.hits, "misses": self.budget.misses})
+
+    def run(self) -> Dict[str, StageMetrics]:
+        """Run the pipeline to completion"""
+        return asyncio.run(self.run_async())
+
+    async def run_async(self) -> Dict[str, StageMetrics]:
+        start = time.perf_counter()
+        queues = [asyncio.Queue(self.queue_size) for _ in range(len(self.STAGES) - 1)]
+        with ThreadPoolExecutor(max(self.readers, 2)) as io_pool, \
+                ProcessPoolExecutor(self.processes, initializer=_init_render_worker,
+                                    initargs=(self.script, self.max_steps, self.max_seconds)) as cpu_pool:
+            flusher = asyncio.ensure_future(self._flush_metrics()) if self.run_metrics is not None else None
+            finished = False
+            try:
+                await asyncio.gather(
+                    self._scan(io_pool, queues[0]),
+                    self._read(io_pool, queues[0], queues[1]),
+                    self._render(cpu_pool, queues[1], queues[2]),
+                    self._check(queues[2], queues[3]),
+                    self._write(io_pool, queues[3]),
+                )
+                finished = True
+            finally:
+                if flusher is not None:
+                    flusher.cancel()
+                if self.run_metrics is not None and not finished:
+                    self.run_metrics.close(finished=False)
+        self.elapsed = time.perf_counter() - start
+        if self.run_metrics is not None:
+            # After the render workers exited, so their CPU time counts
+            self.run_metrics.close()
+        return self.metrics
+
+    async def _flush_metrics(self):
+        while True:
+            await asyncio.sleep(self.run_metrics.interval)
+            self.run_metrics.flush()
+
+    async def _scan(self, pool, out: asyncio.Queue):
+        loop = asyncio.get_running_loop()
+        metrics = self.metrics["scan"]
+        pending = [self.root]
+        while pending:
+            (files, directories), elapsed = await loop.run_in_executor(
+                pool, _timed, _list_directory, pending.pop(), self.extensions)
+            metrics.busy += elapsed
+            pending.extend(directories)
+            for path in files:
+                metrics.items += 1
+                await out.put(path)
+        await out.put(DONE)
+
+    async def _read(self, pool, source: asyncio.Queue, out: asyncio.Queue):
+        loop = asyncio.get_running_loop()
+        metrics = self.metrics["read"]
+
+        async def reader():
+            while True:
+                metrics.sample_queue(source)
+                path = await source.get()
+                if path is DONE:
+                    # Let the other readers see the end too
+                    await source.put(DONE)
+                    return
+                tags, elapsed = await loop.run_in_executor(pool, _timed, self.read_tags, path)
+                metrics.busy += elapsed
+                if tags is not None:
+                    metrics.items += 1
+                    await out.put(tags)
+
+        await asyncio.gather(*[reader() for _ in range(self.readers)])
+        await out.put(DONE)
+
+    async def _render(self, pool, source: asyncio.Queue, out: asyncio.Queue):
+        loop = asyncio.get_running_loop()
+        metrics = self.metrics["render"]
+        # Chunks in flight, oldest first so the plan keeps the read order
+        in_flight = deque()
+
+        async def emit_oldest():
+            pairs, skipped, elapsed = await in_flight.popleft()
+            metrics.busy += elapsed
+            metrics.items += len(pairs)
+            self.skipped.extend(skipped)
+            for pair in pairs:
+                await out.put(pair)
+
+        chunk = []
+        while True:
+            metrics.sample_queue(source)
+            tags = await source.get()
+            if tags is not DONE:
+                chunk.append(tags)
+                if len(chunk) < self.chunk_size:
+                    continue
+            if chunk:
+                in_flight.append(loop.run_in_executor(pool, _render_chunk, chunk, self.dest))
+                chunk = []
+            while in_flight and (tags is DONE or len(in_flight) >= self.processes * 2):
+                await emit_oldest()
+            if tags is DONE:
+                break
+        await out.put(DONE)
+
+    async def _check(self, source: asyncio.Queue, out: asyncio.Queue):
+        metrics = self.metrics["check"]
+        check = self.checker.check
+        check_length = self.budget.check
+        while True:
+            metrics.sample_queue(source)
+            pair = await source.get()
+            if pair is DONE:
+                break
+            start = time.perf_counter()
+            entry = check(*pair)
+            overrun = check_length(entry["target"])
+            if overrun is not None:
+                # The same shape whether components or the whole path are too long
+                entry["overrun"] = {"components": overrun.get("components", []), "bytes": overrun["bytes"]}
+            metrics.busy += time.perf_counter() - start
+            metrics.items += 1
+            await out.put(entry)
+        await out.put(DONE)
+
+    async def _write(self, pool, source: asyncio.Queue):
+        loop = asyncio.get_running_loop()
+        metrics = self.metrics["write"]
+        with open(self.plan_path, "w", encoding="utf-8") as f:
+            lines = []
+            while True:
+                metrics.sample_queue(source)
+                entry = await source.get()
+                if entry is not DONE:
+                    lines.append(json.dumps(entry, ensure_ascii=False) + "\n")
+                    if len(lines) < self.chunk_size:
+                        continue
+                if lines:
+                    _, elapsed = await loop.run_in_executor(pool, _timed, f.writelines, lines)
+                    metrics.busy += elapsed
+                    metrics.items += len(lines)
+                    lines = []
+                if entry is DONE:
+                    break
+
+    def format_metrics(self) -> str:
+        """Format the stage metrics as a text table"""
+        lines = [f"{'Stage':<8} {'items':>9} {'busy s':>8} {'items/s':>10} {'queue mean':>11} {'queue max':>10}"]
+        for metrics in self.metrics.values():
+            rate = metrics.items / metrics.busy if metrics.busy else 0.0
+            lines.append(f"{metrics.name:<8} {metrics.items:>9} {metrics.busy:>8.2f} {rate:>10.0f} "
+                         f"{metrics.queue_mean:>11.1f} {metrics.queue_max:>10}")
+        lines.append(f"\nQueue size {self.queue_size}; {self.elapsed:.2f} s wall time. "
+                     f"The stage after the fullest queue is the bottleneck.")
+        counts = ", ".join(f"{count} {status}" for status, count in self.checker.counts.items())
+        lines.append(f"Plan: {counts}; {self.budget.overruns} too long")
+        if self.skipped:
+            lines.append(f"\nSkipped {len(self.skipped)} tracks over the evaluation budget:")
+            lines.extend(f"  {source}: {reason}" for source, reason in self.skipped)
+        return "\n".join(lines)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Plan renaming a library with a Picard naming script")
+    parser.add_argument("script", help="Picard script file (.pts)")
+    parser.add_argument("root", help="Library directory to scan")
+    parser.add_argument("--plan", required=True, help="Rename plan to write (NDJSON)")
+    parser.add_argument("--dest", help="Directory the targets are relative to (default: root)")
+    parser.add_argument("--manifest", action="append",
+                        help="Look tags up by path in this manifest instead of reading files (repeatable)")
+    parser.add_argument("--queue-size", type=int, default=1000, help="Capacity of each stage queue")
+    parser.add_argument("--readers", type=int, default=8, help="Concurrent tag readers")
+    parser.add_argument("--processes", type=int, help="Render processes (default: CPU count)")
+    parser.add_argument("--chunk-size", type=int, default=500, help="Tracks per render chunk")
+    parser.add_argument("--case-sensitive", action="store_true", help="Treat targets differing in case as distinct")
+    parser.add_argument("--max-steps", type=int, default=DEFAULT_MAX_STEPS,
+                        help="Loop iterations allowed per track before it is skipped (0: no limit)")
+    parser.add_argument("--max-seconds", type=float, default=DEFAULT_MAX_SECONDS,
+                        help="Seconds allowed per track before it is skipped (0: no limit)")
+    parser.add_argument("--metrics-json", metavar="FILE", help="Write run metrics to this JSON file")
+    parser.add_argument("--metrics-prom", metavar="FILE",
+                        help="Write run metrics to this Prometheus textfile collector file")
+    parser.add_argument("--metrics-interval", type=float, default=30.0,
+                        help="Seconds between metric flushes during the run")
+    args = parser.parse_args(argv)
+
+    run_metrics = None
+    if args.metrics_json or args.metrics_prom:
+        run_metrics = RunMetrics("rename_pipeline", args.metrics_json, args.metrics_prom, args.metrics_interval)
+    try:
+        with open(args.script, "r", encoding="utf-8") as f:
+            script = f.read()
+        read_tags = ManifestTagReader(args.manifest) if args.manifest else None
+        pipeline = RenamePipeline(script, args.root, args.plan, dest=args.dest, read_tags=read_tags,
+                                  queue_size=args.queue_size, readers=args.readers,
+                                  processes=args.processes, chunk_size=args.chunk_size,
+                                  case_sensitive=args.case_sensitive, run_metrics=run_metrics,
+                                  max_steps=args.max_steps, max_seconds=args.max_seconds)
+        pipeline.run()
+    except (RuntimeError, ScriptError, OSError, ValueError) as e:
+        parser.error(str(e))
+    print(pipeline.format_metrics(), file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
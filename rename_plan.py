@@ -0,0 +1,70 @@
+"""
+Rename Plan Module
+
+A rename plan lists where each track of a library would be moved. It is
+an NDJSON file like a tag manifest, with one entry per track: the track's
+current path ("source"), the path its naming script gives it ("target")
+and a status. Tracks whose target is already taken by an earlier track
+are marked as collisions, and carry the source of that track.
+"""
+
+from pathlib import Path
+from typing import Dict, Iterable, Iterator, Optional, Union
+
+from manifest import iter_manifest, write_manifest
+
+
+STATUS_MOVE = "move"
+STATUS_UNCHANGED = "unchanged"
+STATUS_COLLISION = "collision"
+
+
+def target_key(target: str, case_sensitive: bool = False) -> str:
+    """Key under which two targets land on the same file"""
+    return target if case_sensitive else target.casefold()
+
+
+class CollisionChecker:
+    """
+    Gives plan entries their status as they are checked one by one.
+
+    Targets are compared case-insensitively by default, since the
+    filesystems of most music shares (SMB, macOS, Windows) are.
+    """
+
+    def __init__(self, case_sensitive: bool = False):
+        self.case_sensitive = case_sensitive
+        self.targets: Dict[str, str] = {}
+        self.counts = {STATUS_MOVE: 0, STATUS_UNCHANGED: 0, STATUS_COLLISION: 0}
+
+    def check(self, source: str, target: str) -> Dict:
+        """Build the plan entry moving source to target"""
+        entry = {"source": source, "target": target}
+        key = target_key(target, self.case_sensitive)
+        first = self.targets.get(key)
+        if first is not None and first != source:
+            entry["status"] = STATUS_COLLISION
+            entry["conflicts_with"] = first
+        else:
+            self.targets[key] = source
+            entry["status"] = STATUS_UNCHANGED if source == target else STATUS_MOVE
+        self.counts[entry["status"]] += 1
+        return entry
+
+
+def iter_plan(path: Union[str, Path]) -> Iterator[Dict]:
+    """Yield the entries of a rename plan"""
+    return iter_manifest(path)
+
+
+def write_plan(path: Union[str, Path], entries: Iterable[Dict]) -> int:
+    """Write a rename plan, returning how many entries were written"""
+    return write_manifest(path, entries)
+
+
+def check_plan(entries: Iterable[Dict], case_sensitive: bool = False,
+               checker: Optional[CollisionChecker] = None) -> Iterator[Dict]:
+    """Re-check the status of plan entries, e.g. after merging several plans"""
+    checker = checker or CollisionChecker(case_sensitive)
+    for entry in entries:
+        yield checker.check(entry["source"], entry["target"])
@@ -0,0 +1,213 @@
+"""
+Run Metrics Module
+
+Collects machine-readable numbers from a naming run, for capacity planning:
+items and busy time per stage, cache hit rates, wall and CPU time, and
+peak resident memory. They are written as JSON and in the Prometheus
+textfile collector format (node_exporter --collector.textfile.directory),
+every flush interval while the run goes on and once more at the end.
+
+Both files are replaced atomically, so a collector never reads half a
+file. A stage's rate is items per second it was busy; the run's rate is
+the items of its last stage per second of wall time.
+
+CPU time and peak RSS of child processes (e.g. render workers) only count
+once the children have exited, so they show up in the final flush.
+"""
+
+import json
+import os
+import sys
+import time
+from pathlib import Path
+from typing import Callable, Dict, Mapping, Optional, Union
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+
+# Prefix of every Prometheus metric name
+METRIC_PREFIX = "picard_naming"
+
+# Stats getter of a cache, returning at least "hits" and "misses"
+CacheStats = Callable[[], Mapping[str, float]]
+
+
+class StageCounter:
+    """Items handled by a stage and the time it was busy"""
+
+    __slots__ = ("name", "items", "busy")
+
+    def __init__(self, name: str):
+        self.name = name
+        self.items = 0
+        self.busy = 0.0
+
+
+def _peak_rss(who) -> Optional[int]:
+    """Peak resident set size in bytes"""
+    if resource is None:
+        return None
+    peak = resource.getrusage(who).ru_maxrss
+    # Kilobytes on Linux, bytes on macOS
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+def _label(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _write_atomic(path: Path, text: str):
+    tmp_path = path.with_name(path.name + ".tmp")
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        f.write(text)
+    os.replace(tmp_path, path)
+
+
+class RunMetrics:
+    """
+    Metrics of one run, flushed to a JSON file and a Prometheus textfile.
+
+    Stages are anything with name, items and busy attributes; stage()
+    creates a StageCounter. Call tick() as often as convenient: it only
+    flushes once the interval has passed since the last flush.
+    """
+
+    def __init__(self, run: str = "run", json_path: Optional[Union[str, Path]] = None,
+                 prom_path: Optional[Union[str, Path]] = None, interval: float = 30.0):
+        self.run = run
+        self.json_path = Path(json_path) if json_path else None
+        self.prom_path = Path(prom_path) if prom_path else None
+        self.interval = interval
+        self.stages: Dict[str, object] = {}
+        self.caches: Dict[str, CacheStats] = {}
+        self.flushes = 0
+        self.finished = False
+        self._start = time.perf_counter()
+        self._cpu_start = os.times()
+        self._next_flush = time.monotonic() + interval
+
+    def stage(self, name: str) -> StageCounter:
+        """Get the counter of a stage, creating it on first use"""
+        counter = self.stages.get(name)
+        if counter is None:
+            counter = self.stages[name] = StageCounter(name)
+        return counter
+
+    def add_stage(self, stage):
+        """Report an existing stage counter"""
+        self.stages[stage.name] = stage
+
+    def add_cache(self, name: str, stats: CacheStats):
+        """Report the hit rate of a cache"""
+        self.caches[name] = stats
+
+    def snapshot(self) -> Dict:
+        """Current values of every metric"""
+        wall = time.perf_counter() - self._start
+        cpu = os.times()
+        stages = {}
+        for name, stage in self.stages.items():
+            stages[name] = {
+                "items": stage.items,
+                "busy_seconds": round(stage.busy, 6),
+                "items_per_second": round(stage.items / stage.busy, 1) if stage.busy else 0.0,
+            }
+        caches = {}
+        for name, stats in self.caches.items():
+            values = stats()
+            hits, misses = values["hits"], values["misses"]
+            lookups = hits + misses
+            caches[name] = {"hits": hits, "misses": misses,
+                            "hit_rate": round(hits / lookups, 4) if lookups else 0.0}
+        last = next(reversed(self.stages.values()), None)
+        return {
+            "run": self.run,
+            "finished": self.finished,
+            "timestamp": time.time(),
+            "wall_seconds": round(wall, 6),
+            "tracks_per_second": round(last.items / wall, 1) if last is not None and wall else 0.0,
+            "cpu_seconds": {
+                "user": round(cpu.user - self._cpu_start.user, 3),
+                "system": round(cpu.system - self._cpu_start.system, 3),
+                "children_user": round(cpu.children_user - self._cpu_start.children_user, 3),
+                "children_system": round(cpu.children_system - self._cpu_start.children_system, 3),
+            },
+            "peak_rss_bytes": {
+                "self": _peak_rss(resource.RUSAGE_SELF) if resource else None,
+                "children": _peak_rss(resource.RUSAGE_CHILDREN) if resource else None,
+            },
+            "stages": stages,
+            "caches": caches,
+        }
+
+    def format_prometheus(self, snapshot: Dict) -> str:
+        """Format a snapshot for the Prometheus textfile collector"""
+        lines = []
+        run = f'run="{_label(self.run)}"'
+
+        def metric(name, kind, help_text, samples):
+            name = f"{METRIC_PREFIX}_{name}"
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {kind}")
+            for labels, value in samples:
+                if value is not None:
+                    lines.append(f"{name}{{{','.join([run] + labels)}}} {value}")
+
+        stages, caches = snapshot["stages"], snapshot["caches"]
+        metric("stage_items_total", "counter", "Items handled by a stage",
+               [([f'stage="{_label(name)}"'], stage["items"]) for name, stage in stages.items()])
+        metric("stage_busy_seconds_total", "counter", "Seconds a stage was busy",
+               [([f'stage="{_label(name)}"'], stage["busy_seconds"]) for name, stage in stages.items()])
+        metric("stage_items_per_second", "gauge", "Items a stage handles per busy second",
+               [([f'stage="{_label(name)}"'], stage["items_per_second"]) for name, stage in stages.items()])
+        metric("cache_hits_total", "counter", "Cache hits",
+               [([f'cache="{_label(name)}"'], cache["hits"]) for name, cache in caches.items()])
+        metric("cache_misses_total", "counter", "Cache misses",
+               [([f'cache="{_label(name)}"'], cache["misses"]) for name, cache in caches.items()])
+        metric("cache_hit_ratio", "gauge", "Cache hits per lookup",
+               [([f'cache="{_label(name)}"'], cache["hit_rate"]) for name, cache in caches.items()])
+        metric("wall_seconds", "gauge", "Wall time since the run started", [([], snapshot["wall_seconds"])])
+        metric("tracks_per_second", "gauge", "Tracks through the last stage per wall second",
+               [([], snapshot["tracks_per_second"])])
+        cpu = snapshot["cpu_seconds"]
+        metric("cpu_seconds_total", "counter", "CPU time of the run and its exited child processes",
+               [(['process="self"', 'mode="user"'], cpu["user"]),
+                (['process="self"', 'mode="system"'], cpu["system"]),
+                (['process="children"', 'mode="user"'], cpu["children_user"]),
+                (['process="children"', 'mode="system"'], cpu["children_system"])])
+        rss = snapshot["peak_rss_bytes"]
+        metric("peak_rss_bytes", "gauge", "Peak resident set size",
+               [(['process="self"'], rss["self"]), (['process="children"'], rss["children"])])
+        metric("finished", "gauge", "1 once the run has completed", [([], int(snapshot["finished"]))])
+        metric("last_flush_timestamp_seconds", "gauge", "Unix time of this flush",
+               [([], round(snapshot["timestamp"], 3))])
+        return "\n".join(lines) + "\n"
+
+    def flush(self) -> Dict:
+        """Write the current metrics to the configured files"""
+        snapshot = self.snapshot()
+        if self.json_path is not None:
+            _write_atomic(self.json_path, json.dumps(snapshot, indent=2) + "\n")
+        if self.prom_path is not None:
+            _write_atomic(self.prom_path, self.format_prometheus(snapshot))
+        self.flushes += 1
+        self._next_flush = time.monotonic() + self.interval
+        return snapshot
+
+    def tick(self):
+        """Flush if the interval has passed since the last flush"""
+        if time.monotonic() >= self._next_flush:
+            self.flush()
+
+    def close(self, finished: bool = True) -> Dict:
+        """
+        Write the final metrics.
+
+        The run is only marked finished when it ran to completion; after an
+        error or an interrupt, pass finished=False.
+        """
+        self.finished = finished
+        return self.flush()
@@ -0,0 +1,380 @@
+"""
+Script Batch Module
+
+Evaluates a naming script over a batch of tracks at once. Tags are held
+as columns: one list per tag name with a value per track. Each node of the
+script produces a column of results, so the Python overhead of walking the
+script is paid once per batch instead of once per track. Values that are
+the same for every track, such as constants and settings, stay plain
+strings and are never expanded into lists.
+
+$if and $if2 split the batch: each branch is only evaluated for the rows
+that take it, so $set inside a branch only touches those rows.
+
+Only functions whose result depends on their arguments alone are
+supported, plus $set, $get, $unset, $if, $if2 and $noop. That covers
+every script the generator emits; compile_batch() raises ScriptError for
+anything else, and such scripts can still be run with script_engine.
+"""
+
+from itertools import islice
+from typing import Callable, Dict, Iterable, Iterator, List, Mapping, Optional, Sequence, Union
+
+from script_engine import (
+    FUNCTIONS, BudgetExceeded, EvaluationBudget, ScriptError, compile_script, format_path, join_multi,
+    render_paths,
+)
+from script_parser import Expression, Function, Node, Text, Variable, parse_script
+
+
+# A column holds one value per row, or a single string shared by all rows
+Column = Union[str, List[str]]
+
+# Rows of the batch an evaluator works on; None means all of them
+Rows = Optional[List[int]]
+
+BatchEvaluator = Callable[["BatchState", Rows], Column]
+
+# Functions evaluated element by element with the row engine's implementation
+PURE_FUNCTIONS = {
+    "eq", "ne", "gt", "gte", "lt", "lte", "and", "or", "not", "in",
+    "startswith", "endswith", "eq_any", "ne_all", "eq_all", "ne_any",
+    "left", "right", "len", "upper", "lower", "title", "replace", "rreplace",
+    "rsearch", "num", "pad", "strip", "trim", "substr", "find",
+    "firstalphachar", "initials", "delprefix", "swapprefix", "reverse",
+    "truncate", "firstwords", "add", "sub", "mul", "div", "mod", "min", "max",
+}
+
+
+class BatchState:
+    """Variables of every track in a batch, as columns"""
+
+    __slots__ = ("columns", "size")
+
+    def __init__(self, columns: Mapping[str, Column], size: int):
+        self.columns = dict(columns)
+        self.size = size
+
+    def count(self, rows: Rows) -> int:
+        return self.size if rows is None else len(rows)
+
+    def get(self, name: str, rows: Rows) -> Column:
+        column = self.columns.get(name, "")
+        if column.__class__ is str or rows is None:
+            return column
+        return [column[i] for i in rows]
+
+    def set(self, name: str, value: Column, rows: Rows):
+        if rows is None:
+            self.columns[name] = value
+            return
+        column = self.columns.get(name, "")
+        if column.__class__ is str:
+            if value.__class__ is str and value == column:
+                return
+            column = [column] * self.size
+        else:
+            # Columns can be shared between variables, so never update one in place
+            column = list(column)
+        if value.__class__ is str:
+            for i in rows:
+                column[i] = value
+        else:
+            for i, item in zip(rows, value):
+                column[i] = item
+        self.columns[name] = column
+
+
+def _empty(state, rows):
+    return ""
+
+
+def _expand(value: Column, size: int) -> List[str]:
+    return [value] * size if value.__class__ is str else value
+
+
+def _subset(rows: Rows, positions: List[int]) -> List[int]:
+    """Rows of the batch at the given positions of a selection"""
+    return positions if rows is None else [rows[k] for k in positions]
+
+
+# =============================================================================
+# FUNCTIONS
+# =============================================================================
+
+def _literal_name(node: Function) -> str:
+    name = node.args[0].literal
+    if name is None:
+        raise ScriptError(f"'${node.name}' needs a constant variable name in batch evaluation")
+    return name
+
+
+def compile_set(node, args):
+    name = _literal_name(node)
+    value = args[1]
+
+    def evaluator(state, rows):
+        state.set(name, value(state, rows), rows)
+        return ""
+    return evaluator
+
+
+def compile_get(node, args):
+    name = _literal_name(node)
+    return lambda state, rows: state.get(name, rows)
+
+
+def compile_unset(node, args):
+    name = _literal_name(node)
+    if name.endswith("*"):
+        raise ScriptError("'$unset' with a wildcard is not supported in batch evaluation")
+
+    def evaluator(state, rows):
+        state.set(name, "", rows)
+        return ""
+    return evaluator
+
+
+def compile_if(node, args):
+    condition, then = args[0], args[1]
+    otherwise = args[2] if len(args) > 2 else _empty
+
+    def evaluator(state, rows):
+        test = condition(state, rows)
+        if test.__class__ is str:
+            return then(state, rows) if test else otherwise(state, rows)
+        taken = [k for k, value in enumerate(test) if value]
+        if not taken:
+            return otherwise(state, rows)
+        if len(taken) == len(test):
+            return then(state, rows)
+        skipped = [k for k, value in enumerate(test) if not value]
+        out = [""] * len(test)
+        for positions, branch in ((taken, then), (skipped, otherwise)):
+            if branch is _empty:
+                continue
+            value = branch(state, _subset(rows, positions))
+            if value.__class__ is str:
+                if value:
+                    for k in positions:
+                        out[k] = value
+            else:
+                for k, item in zip(positions, value):
+                    out[k] = item
+        return out
+    return evaluator
+
+
+def compile_if2(node, args):
+    def evaluator(state, rows):
+        # Positions of the selection still without a value; None until the
+        # first argument that is not the same for all rows
+        pending = None
+        out = None
+        for arg in args:
+            value = arg(state, rows if pending is None else _subset(rows, pending))
+            if value.__class__ is str:
+                if not value:
+                    continue
+                if pending is None:
+                    return value
+                for k in pending:
+                    out[k] = value
+                return out
+            if pending is None:
+                out = list(value)
+                pending = [k for k, item in enumerate(value) if not item]
+            else:
+                remaining = []
+                for k, item in zip(pending, value):
+                    if item:
+                        out[k] = item
+                    else:
+                        remaining.append(k)
+                pending = remaining
+            if not pending:
+                break
+        return "" if out is None else out
+    return evaluator
+
+
+def compile_pure(func):
+    """Batch version of a function whose result only depends on its arguments"""
+    def compiler(node, args):
+        def evaluator(state, rows):
+            values = [arg(state, rows) for arg in args]
+            varying = [k for k, value in enumerate(values) if value.__class__ is not str]
+            if not varying:
+                return func(None, *values)
+            if len(varying) == 1:
+                # Album-level tags repeat across tracks, so compute each distinct value once
+                k = varying[0]
+                column = values[k]
+                results = {}
+                out = []
+                for item in column:
+                    result = results.get(item)
+                    if result is None:
+                        values[k] = item
+                        result = results[item] = func(None, *values)
+                    out.append(result)
+                return out
+            size = state.count(rows)
+            return [func(None, *row) for row in zip(*[_expand(value, size) for value in values])]
+        return evaluator
+    return compiler
+
+
+# Batch compilers, keyed by function name; each is called with the Function
+# node and the compiled arguments and returns a BatchEvaluator
+BATCH_FUNCTIONS: Dict[str, Callable] = {
+    "noop": lambda node, args: _empty,
+    "set": compile_set,
+    "get": compile_get,
+    "unset": compile_unset,
+    "if": compile_if,
+    "if2": compile_if2,
+}
+BATCH_FUNCTIONS.update((name, compile_pure(FUNCTIONS[name].func)) for name in PURE_FUNCTIONS)
+
+
+# =============================================================================
+# COMPILATION
+# =============================================================================
+
+def compile_batch_node(node: Node) -> BatchEvaluator:
+    """Compile a syntax tree node into a callable evaluating it for a batch"""
+    if isinstance(node, Text):
+        value = node.value
+        return lambda state, rows: value
+
+    if isinstance(node, Variable):
+        name = node.name
+        return lambda state, rows: state.get(name, rows)
+
+    if isinstance(node, Function):
+        compiler = BATCH_FUNCTIONS.get(node.name)
+        spec = FUNCTIONS.get(node.name)
+        if spec is None:
+            raise ScriptError(f"Unknown function '${node.name}'")
+        if compiler is None:
+            raise ScriptError(f"'${node.name}' is not supported in batch evaluation")
+        if len(node.args) < spec.min_args or (spec.max_args is not None and len(node.args) > spec.max_args):
+            raise ScriptError(f"Wrong number of arguments for '${node.name}'")
+        if node.name == "noop":
+            return _empty
+        return compiler(node, [compile_batch_node(arg) for arg in node.args])
+
+    parts = [compile_batch_node(item) for item in node.items]
+    parts = [part for part in parts if part is not _empty]
+    if not parts:
+        return _empty
+    if len(parts) == 1:
+        return parts[0]
+
+    def evaluator(state, rows):
+        values = [part(state, rows) for part in parts]
+        if all(value.__class__ is str for value in values):
+            return "".join(values)
+        size = state.count(rows)
+        return ["".join(row) for row in zip(*[_expand(value, size) for value in values])]
+    return evaluator
+
+
+def _variable_names(node: Node, names: set):
+    if isinstance(node, Variable):
+        names.add(node.name)
+    elif isinstance(node, Function):
+        if node.name == "get" and node.args:
+            names.add(node.args[0].literal)
+        for arg in node.args:
+            _variable_names(arg, names)
+    elif isinstance(node, Expression):
+        for item in node.items:
+            _variable_names(item, names)
+
+
+class BatchScript:
+    """A parsed script compiled for batch evaluation"""
+
+    def __init__(self, source: str, tree: Expression, evaluator: BatchEvaluator):
+        self.source = source
+        self.tree = tree
+        self.evaluator = evaluator
+        names = set()
+        _variable_names(tree, names)
+        # Tags the script can read; only these need to be turned into columns
+        self.variables = frozenset(names)
+
+    def evaluate(self, columns: Mapping[str, Column], size: int) -> List[str]:
+        """Evaluate the script for a batch and return the output of each row"""
+        return _expand(self.evaluator(BatchState(columns, size), None), size)
+
+
+def compile_batch(source: str, naming: bool = True) -> BatchScript:
+    """
+    Compile a script for batch evaluation.
+
+    Raises ScriptError if the script uses a function the batch engine
+    does not support.
+    """
+    tree = parse_script(source, strip_layout=naming)
+    return BatchScript(source, tree, compile_batch_node(tree))
+
+
+# =============================================================================
+# FILE NAMING
+# =============================================================================
+
+def _path_safe_text(value) -> str:
+    if value.__class__ is str:
+        return value.replace("/", "_")
+    return join_multi(tuple(value)).replace("/", "_")
+
+
+def to_columns(tracks: Sequence[Mapping], names: Iterable[str]) -> Dict[str, Column]:
+    """
+    Build path-safe text columns from tracks, as render_path() prepares tags.
+
+    Multi-value tags are joined. A tag no track has becomes an empty string.
+    """
+    columns = {}
+    for name in names:
+        column = [_path_safe_text(tags.get(name, "")) for tags in tracks]
+        columns[name] = column if any(column) else ""
+    return columns
+
+
+def render_paths_batch(script: Union[str, BatchScript], tracks: Iterable[Mapping],
+                       batch_size: int = 10000) -> Iterator[str]:
+    """Render the paths for many tracks, batch_size tracks at a time"""
+    if isinstance(script, str):
+        script = compile_batch(script)
+    names = script.variables | {"_extension"}
+    tracks = iter(tracks)
+    while True:
+        batch = list(islice(tracks, batch_size))
+        if not batch:
+            return
+        columns = to_columns(batch, names)
+        extensions = _expand(columns["_extension"], len(batch))
+        for output, extension in zip(script.evaluate(columns, len(batch)), extensions):
+            yield format_path(output, extension)
+
+
+def path_renderer(script: str, batch_size: int = 10000, budget: Optional[EvaluationBudget] = None,
+                  on_exceeded: Optional[Callable[[Mapping, BudgetExceeded], None]] = None,
+                  ) -> Callable[[Iterable[Mapping]], Iterator[Optional[str]]]:
+    """
+    Compile a naming script into a function rendering the paths of tracks.
+
+    Uses the batch engine when the script allows it, and the row engine
+    otherwise. Only the row engine runs loops, so only it needs the
+    budget: tracks going over it are rendered as None (see render_paths).
+    """
+    try:
+        batch = compile_batch(script)
+    except ScriptError:
+        compiled = compile_script(script)
+        return lambda tracks: render_paths(compiled, tracks, budget, on_exceeded)
+    return lambda tracks: render_paths_batch(batch, tracks, batch_size)
@@ -6,9 +6,56 @@ All generated code uses only valid Picard scripting syntax and real variables.
 """
 
 from dataclasses import dataclass, field
-from typing import Optional, List
+from typing import Callable, Dict, Hashable, List, Optional, Tuple
 from datetime import datetime
 
+from script_components import SAFE_REPLACEMENTS, WINDOWS_INVALID_CHARS
+from script_parser import escape_text
+
+
+# Working variables that get a sanitized "...Safe" copy when referenced
+SANITIZED_FIELDS = ["_nAlbum", "_nTitle", "_nAlbumArtist", "_nTrackArtist"]
+
+# Regex matching characters that are invalid in file and folder names
+INVALID_CHARS_REGEX = '[\\\\/:*?"<>|]+'
+
+# Same as above but keeps "/" so it can run over an assembled path
+INVALID_PATH_CHARS_REGEX = '[\\\\:*?"<>|]+'
+
+# Regexes replacing multi-byte characters with as many ASCII characters as
+# their UTF-8 encoding has bytes, so $len counts bytes; widest first
+UTF8_WIDTH_REGEXES = [
+    ("[\\U00010000-\\U0010ffff]", "____"),
+    ("[\\u0800-\\uffff]", "___"),
+    ("[\\u0080-\\u07ff]", "__"),
+]
+
+
+# Config fields each cacheable section reads; the header is never cached
+# because it carries the generation time
+_SANITIZE_FIELDS = ("replace_invalid_chars", "sanitize_scope")
+SECTION_FIELDS = {
+    "_add_settings_section": (
+        "track_padding_length", "max_album_length", "max_title_length", "max_filename_length",
+        "length_unit",
+    ),
+    "_add_constants_section": (),
+    "_add_working_variables": ("use_original_year", "length_unit"),
+    "_add_file_path_generation": (
+        "use_artist_folder", "artist_folder_style", "format_album_artist", "separate_soundtracks",
+        "use_album_folder", "include_year_in_album", "year_position", "include_disambiguation",
+        "include_label", "include_catalog", "include_format", "use_disc_subfolder",
+        "disc_folder_format", "include_disc_subtitle",
+    ) + _SANITIZE_FIELDS,
+    "_add_filename_generation": (
+        "include_track_number", "include_disc_in_track", "use_disc_subfolder",
+        "include_artist_in_filename", "artist_separator", "include_track_artist_for_va",
+        "va_artist_separator", "include_title", "show_featured_artists", "feat_format",
+        "length_unit",
+    ) + _SANITIZE_FIELDS,
+    "_add_output": _SANITIZE_FIELDS + ("sanitize_policy",),
+}
+
 
 @dataclass
 class ScriptConfig:
@@ -16,7 +63,7 @@ class ScriptConfig:
     
     # Folder Structure
     use_artist_folder: bool = True
-    artist_folder_style: str = "standard"  # standard, sort, first_letter_subfolder
+    artist_folder_style: str = "standard"  # standard, first_letter_subfolder
     use_album_folder: bool = True
     include_year_in_album: bool = True
     year_position: str = "prefix"  # prefix, suffix
@@ -52,11 +99,14 @@ class ScriptConfig:
     
     # Character Replacements
     replace_invalid_chars: bool = True
+    sanitize_scope: str = "fields"  # fields, path
+    sanitize_policy: str = "underscore"  # underscore, safe_replacements
     
     # Length Limits
     max_album_length: int = 100
     max_title_length: int = 100
     max_filename_length: int = 200
+    length_unit: str = "bytes"  # bytes, characters
     
     # Special Options
     use_original_year: bool = True
@@ -70,11 +120,45 @@ class ScriptConfig:
     include_disambiguation: bool = False
 
 
+class SectionCache:
+    """
+    Generated script sections, keyed by the config fields each section reads.
+
+    Shared between builders so that changing one setting only regenerates
+    the sections reading it.
+    """
+    
+    def __init__(self):
+        self._parts: Dict[Tuple[Hashable, ...], List[str]] = {}
+        self.hits = 0
+        self.misses = 0
+    
+    def get(self, key: Tuple[Hashable, ...]) -> Optional[List[str]]:
+        parts = self._parts.get(key)
+        if parts is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return parts
+    
+    def put(self, key: Tuple[Hashable, ...], parts: List[str]):
+        self._parts[key] = parts
+    
+    def stats(self) -> Dict[str, float]:
+        """Get the cache counters"""
+        lookups = self.hits + self.misses
+        return {
+            "sections": len(self._parts),
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+        }
+
+
 class ScriptBuilder:
     """Builds Picard file naming scripts from configuration"""
     
-    def __init__(self, config: ScriptConfig):
+    def __init__(self, config: ScriptConfig, cache: Optional[SectionCache] = None):
         self.config = config
+        self.cache = cache
         self.script_parts = []
     
     def build(self) -> str:
@@ -85,29 +169,47 @@ class ScriptBuilder:
         self._add_header()
         
         # Add user settings variables
-        self._add_settings_section()
+        self._add_section(self._add_settings_section)
         
         # Add constants
-        self._add_constants_section()
+        self._add_section(self._add_constants_section)
         
         # Add working variables
-        self._add_working_variables()
+        self._add_section(self._add_working_variables)
         
-        # Add character sanitization
-        if self.config.replace_invalid_chars:
-            self._add_character_sanitization()
+        # Build the file path and filename, keeping them aside so that
+        # sanitization can be limited to the fields they reference
+        body_start = len(self.script_parts)
+        self._add_section(self._add_file_path_generation)
+        self._add_section(self._add_filename_generation)
+        body = self.script_parts[body_start:]
+        del self.script_parts[body_start:]
         
-        # Build the file path
-        self._add_file_path_generation()
+        # Add character sanitization
+        if self._sanitize_fields():
+            self._add_character_sanitization("".join(body))
         
-        # Build the filename
-        self._add_filename_generation()
+        self.script_parts.extend(body)
         
         # Add final output
-        self._add_output()
+        self._add_section(self._add_output)
         
         return "\n".join(self.script_parts)
     
+    def _add_section(self, add: Callable[[], None]):
+        """Run a section method, or reuse its parts from the cache"""
+        if self.cache is None:
+            add()
+            return
+        key = (add.__name__,) + tuple(getattr(self.config, name) for name in SECTION_FIELDS[add.__name__])
+        parts = self.cache.get(key)
+        if parts is None:
+            start = len(self.script_parts)
+            add()
+            self.cache.put(key, self.script_parts[start:])
+        else:
+            self.script_parts.extend(parts)
+    
     def _add_header(self):
         """Add script header with metadata"""
         timestamp = datetime.now().strftime("%Y-%m-%d %H:%M")
@@ -136,7 +238,7 @@ $noop( Padding minimum lengths )
 $set(_PaddedDiscNumMinLength,1)
 $set(_PaddedTrackNumMinLength,{self.config.track_padding_length})
 
-$noop( Maximum lengths for truncation )
+$noop( Maximum lengths for truncation, in {"UTF-8 bytes" if self.config.length_unit == "bytes" else "characters"} )
 $set(_aTitleMaxLength,{self.config.max_album_length})
 $set(_tTitleMaxLength,{self.config.max_title_length})
 $set(_tFilenameMaxLength,{self.config.max_filename_length})
@@ -207,9 +309,83 @@ $noop( Padded disc and track numbers )
 $set(_nPaddedDiscNum,$num(%_nDiscNum%,%_DiscPadLength%))
 $set(_nPaddedTrackNum,$num(%_nTrackNum%,%_TrackPadLength%))
 """)
+        
+        # Title length limits
+        self.script_parts.append(f"""
+$noop( Truncate album and track titles )
+{self._truncate("_nAlbum", "_aTitleMaxLength")}
+{self._truncate("_nTitle", "_tTitleMaxLength")}
+""")
+    
+    def _byte_length(self, expression: str) -> str:
+        """Script expression giving the UTF-8 byte length of an expression"""
+        for regex, replacement in UTF8_WIDTH_REGEXES:
+            expression = f"$rreplace({expression},{escape_text(regex)},{replacement})"
+        return f"$len({expression})"
     
-    def _add_character_sanitization(self):
+    def _truncate(self, name: str, limit: str, suffix: str = "") -> str:
+        """Script statements truncating a working variable to a length limit, then appending suffix"""
+        value = f"%{name}%"
+        budget = f"$sub(%{limit}%,{len(suffix)})" if suffix else f"%{limit}%"
+        if self.config.length_unit != "bytes":
+            return f"""$if($gt($len({value}),%{limit}%),
+    $set({name},$left({value},{budget}){suffix})
+)"""
+        # The first budget characters give the average width of what is
+        # kept, so budget over that width is the first guess. Every character
+        # has at least one byte, so dropping as many characters as the guess
+        # has bytes over the budget fits; every character has at most four,
+        # so adding a quarter of the bytes left as characters still fits.
+        # Bytes are only counted when the value could be over the limit at all.
+        cut = "%_nTruncated%"
+        return f"""$if($gt($len({value}),$div(%{limit}%,4)),
+    $set(_nByteLength,{self._byte_length(value)})
+    $if($gt(%_nByteLength%,%{limit}%),
+        $set(_nTruncated,$left({value},{budget}))
+        $set(_nTruncated,$left({value},$div($mul({budget},$len({cut})),{self._byte_length(cut)})))
+        $set(_nTruncated,$left({value},$max(0,$sub($len({cut}),$max(0,$sub({self._byte_length(cut)},{budget}))))))
+        $set(_nTruncated,$left({value},$add($len({cut}),$div($sub({budget},{self._byte_length(cut)}),4))))
+        $set({name},{cut}{suffix})
+    )
+)"""
+    
+    def _sanitize_fields(self) -> bool:
+        """Whether individual fields are sanitized before the path is built"""
+        return self.config.replace_invalid_chars and self.config.sanitize_scope == "fields"
+    
+    def _sanitize_path(self) -> bool:
+        """Whether the assembled path is sanitized once at output"""
+        return self.config.replace_invalid_chars and self.config.sanitize_scope == "path"
+    
+    def _field(self, name: str) -> str:
+        """Reference to a working variable, using its sanitized copy if enabled"""
+        if self._sanitize_fields():
+            return f"%{name}Safe%"
+        return f"%{name}%"
+    
+    def _sanitize(self, expression: str, keep_slash: bool = False) -> str:
+        """Wrap a script expression so invalid characters get replaced"""
+        if self.config.sanitize_policy == "safe_replacements":
+            # One $replace per character, using the mapping from SAFE_REPLACEMENTS
+            for char in WINDOWS_INVALID_CHARS:
+                if keep_slash and char == "/":
+                    continue
+                replacement = SAFE_REPLACEMENTS.get(char, "_")
+                expression = f"$replace({expression},{escape_text(char)},{escape_text(replacement)})"
+            return expression
+        regex = INVALID_PATH_CHARS_REGEX if keep_slash else INVALID_CHARS_REGEX
+        return f"$rreplace({expression},{escape_text(regex)},_)"
+    
+    def _referenced_fields(self, body: str) -> List[str]:
+        """Get the sanitizable fields whose sanitized copy is used in body"""
+        return [name for name in SANITIZED_FIELDS if f"%{name}Safe%" in body]
+    
+    def _add_character_sanitization(self, body: str):
         """Add character sanitization for Windows compatibility"""
+        fields = self._referenced_fields(body)
+        if not fields:
+            return
+        
         self.script_parts.append("""
 $noop(
 ########################################################################
@@ -217,12 +393,12 @@ $noop(
 ########################################################################
 )
 
-$noop( Create sanitized versions of metadata for file/folder names )
-$set(_nAlbumSafe,$rreplace(%_nAlbum%,[\\\\/:*?"<>|]+,_))
-$set(_nTitleSafe,$rreplace(%_nTitle%,[\\\\/:*?"<>|]+,_))
-$set(_nAlbumArtistSafe,$rreplace(%_nAlbumArtist%,[\\\\/:*?"<>|]+,_))
-$set(_nTrackArtistSafe,$rreplace(%_nTrackArtist%,[\\\\/:*?"<>|]+,_))
-""")
+$noop( Create sanitized versions of metadata for file/folder names )""")
+        
+        self.script_parts.append("\n".join(
+            f"$set({name}Safe,{self._sanitize(f'%{name}%')})"
+            for name in fields
+        ) + "\n")
     
     def _add_file_path_generation(self):
         """Generate the folder path structure"""
@@ -239,19 +415,16 @@ $noop(
         # Artist folder
         if self.config.use_artist_folder:
             if self.config.artist_folder_style == "first_letter_subfolder":
-                self.script_parts.append("""
+                self.script_parts.append(f"""
 $noop( Get first letter for artist grouping )
-$set(_nInitial,$upper($firstalphachar($if2(%_nAlbumArtistSort%,%_nAlbumArtistSafe%),#)))
+$set(_nInitial,$upper($firstalphachar($if2(%_nAlbumArtistSort%,{self._field("_nAlbumArtist")}),#)))
 """)
                 path_parts.append("%_nInitial%")
             
             if self.config.format_album_artist == "sort":
                 path_parts.append("%_nAlbumArtistSort%")
             else:
-                if self.config.replace_invalid_chars:
-                    path_parts.append("%_nAlbumArtistSafe%")
-                else:
-                    path_parts.append("%_nAlbumArtist%")
+                path_parts.append(self._field("_nAlbumArtist"))
         
         # Handle Various Artists
         self.script_parts.append("""
@@ -269,31 +442,20 @@ $set(_isSoundtrack,$in(%_secondaryreleasetype%,soundtrack))
         # Album folder
         if self.config.use_album_folder:
             album_folder_parts = []
+            album = self._field("_nAlbum")
             
             if self.config.include_year_in_album:
                 if self.config.year_position == "prefix":
                     album_folder_parts.append("[%_nYear%]")
                     if self.config.include_disambiguation:
-                        if self.config.replace_invalid_chars:
-                            album_folder_parts.append(" %_nAlbumSafe%$if(%_releasecomment%, \\(%_releasecomment%\\),)")
-                        else:
-                            album_folder_parts.append(" %_nAlbum%$if(%_releasecomment%, \\(%_releasecomment%\\),)")
+                        album_folder_parts.append(f" {album}$if(%_releasecomment%, \\(%_releasecomment%\\),)")
                     else:
-                        if self.config.replace_invalid_chars:
-                            album_folder_parts.append(" %_nAlbumSafe%")
-                        else:
-                            album_folder_parts.append(" %_nAlbum%")
+                        album_folder_parts.append(f" {album}")
                 else:
-                    if self.config.replace_invalid_chars:
-                        album_folder_parts.append("%_nAlbumSafe%")
-                    else:
-                        album_folder_parts.append("%_nAlbum%")
+                    album_folder_parts.append(album)
                     album_folder_parts.append(" [%_nYear%]")
             else:
-                if self.config.replace_invalid_chars:
-                    album_folder_parts.append("%_nAlbumSafe%")
-                else:
-                    album_folder_parts.append("%_nAlbum%")
+                album_folder_parts.append(album)
             
             if self.config.include_label:
                 album_folder_parts.append("$if(%label%, [%label%],)")
@@ -387,7 +549,7 @@ $noop(
         
         # Artist (for Various Artists or if configured)
         if self.config.include_artist_in_filename or self.config.include_track_artist_for_va:
-            artist_part = self.config.replace_invalid_chars and "%_nTrackArtistSafe%" or "%_nTrackArtist%"
+            artist_part = self._field("_nTrackArtist")
             if self.config.include_artist_in_filename:
                 filename_parts.append(f"{self.config.artist_separator}{artist_part}")
             elif self.config.include_track_artist_for_va:
@@ -395,7 +557,7 @@ $noop(
         
         # Title
         if self.config.include_title:
-            title_part = self.config.replace_invalid_chars and "%_nTitleSafe%" or "%_nTitle%"
+            title_part = self._field("_nTitle")
             if filename_parts:
                 # Add separator if we have something before
                 if self.config.include_track_number:
@@ -437,11 +599,9 @@ $set(_nFileName,{"".join(filename_parts)})
 """)
         
         # Apply length limits
-        self.script_parts.append("""
+        self.script_parts.append(f"""
 $noop( Truncate filename if too long )
-$if($gt($len(%_nFileName%),%_tFilenameMaxLength%),
-    $set(_nFileName,$left(%_nFileName%,$sub(%_tFilenameMaxLength%,3))...)
-)
+{self._truncate("_nFileName", "_tFilenameMaxLength", "...")}
 """)
     
     def _add_output(self):
@@ -451,8 +611,16 @@ $noop(
 ########################################################################
 #  OUTPUT - Final path and filename                                    #
 ########################################################################
-)
-
+)""")
+        
+        if self._sanitize_path():
+            output = self._sanitize("$if(%_nFilePath%,%_nFilePath%/%_nFileName%,%_nFileName%)", keep_slash=True)
+            self.script_parts.append(f"""
+$noop( Combine path and filename, replace invalid characters in one pass )
+{output}
+""")
+        else:
+            self.script_parts.append("""
 $noop( Combine path and filename, ensure no double slashes )
 $if(%_nFilePath%,
     %_nFilePath%/%_nFileName%,
@@ -92,6 +92,7 @@ PLUGIN_ADDITIONAL_ARTISTS_TAGS = {
     "_artists_album_primary_std": "Primary album artist (standardized)",
     "_artists_album_primary_cred": "Primary album artist (as credited)",
     "_artists_album_primary_sort": "Primary album artist (sort name)",
+    "_artists_album_primary_id": "Primary album artist MusicBrainz ID",
     "_artists_album_all_std": "All album artists (standardized)",
     "_artists_album_all_cred": "All album artists (as credited)",
     "_artists_album_all_sort": "All album artists (sort names)",
@@ -104,6 +105,7 @@ PLUGIN_ADDITIONAL_ARTISTS_TAGS = {
     "_artists_track_primary_std": "Primary track artist (standardized)",
     "_artists_track_primary_cred": "Primary track artist (as credited)",
     "_artists_track_primary_sort": "Primary track artist (sort name)",
+    "_artists_track_primary_id": "Primary track artist MusicBrainz ID",
     "_artists_track_all_std": "All track artists (standardized)",
     "_artists_track_all_cred": "All track artists (as credited)",
     "_artists_track_all_sort": "All track artists (sort names)",
@@ -0,0 +1,145 @@
+"""
+Script Cost Module
+
+Static cost model for Picard scripts. Walks the parsed script and counts
+the work Picard does for every file: function calls, regex evaluations and
+string-building operations, following the most expensive branch of each
+conditional.
+
+CostCache keeps the cost of each distinct config, so menus hinting what
+every setting would cost only build the configs they have not seen.
+"""
+
+from dataclasses import dataclass, replace
+from typing import Dict, Optional, Union
+
+from script_builder import ScriptBuilder, ScriptConfig, SectionCache
+from script_parser import Expression, Function, Node, Text, Variable, parse_script
+from script_preview import config_hash
+
+
+# Functions evaluating a regular expression
+REGEX_FUNCTIONS = {"rreplace", "rsearch"}
+
+# Functions returning a newly built string rather than one of their inputs
+STRING_FUNCTIONS = {
+    "left", "right", "upper", "lower", "title", "replace", "rreplace", "num",
+    "pad", "strip", "trim", "substr", "reverse", "truncate", "firstwords",
+    "swapprefix", "delprefix", "initials", "join", "map",
+}
+
+# Functions whose arguments are never evaluated
+IGNORED_FUNCTIONS = {"noop"}
+
+
+@dataclass(frozen=True)
+class ScriptCost:
+    """Work done per file"""
+    calls: int = 0
+    regex: int = 0
+    builds: int = 0
+
+    def __add__(self, other: "ScriptCost") -> "ScriptCost":
+        return ScriptCost(self.calls + other.calls, self.regex + other.regex,
+                          self.builds + other.builds)
+
+    def __sub__(self, other: "ScriptCost") -> "ScriptCost":
+        return ScriptCost(self.calls - other.calls, self.regex - other.regex,
+                          self.builds - other.builds)
+
+    def worst(self, other: "ScriptCost") -> "ScriptCost":
+        """Component-wise maximum, covering whichever branch is taken"""
+        return ScriptCost(max(self.calls, other.calls), max(self.regex, other.regex),
+                          max(self.builds, other.builds))
+
+    def describe(self) -> str:
+        return f"{self.calls} calls, {self.regex} regex, {self.builds} string builds"
+
+    def describe_change(self) -> str:
+        """Describe a cost difference, e.g. "+3 calls, +1 regex" """
+        parts = [f"{value:+d} {label}" for value, label in
+                 ((self.calls, "calls"), (self.regex, "regex"), (self.builds, "builds")) if value]
+        return ", ".join(parts) if parts else "no cost change"
+
+
+ZERO = ScriptCost()
+
+
+def node_cost(node: Node) -> ScriptCost:
+    """Worst-case cost of evaluating a node once"""
+    if isinstance(node, (Text, Variable)):
+        return ZERO
+
+    if isinstance(node, Function):
+        if node.name in IGNORED_FUNCTIONS:
+            return ZERO
+        own = ScriptCost(1, int(node.name in REGEX_FUNCTIONS), int(node.name in STRING_FUNCTIONS))
+        if node.name == "if" and node.args:
+            branches = ZERO
+            for arg in node.args[1:]:
+                branches = branches.worst(node_cost(arg))
+            return own + node_cost(node.args[0]) + branches
+        # $if2 stops at the first non-empty value, so the worst case is all of them
+        total = own
+        for arg in node.args:
+            total = total + node_cost(arg)
+        return total
+
+    items = [item for item in node.items
+             if not (isinstance(item, Function) and item.name in IGNORED_FUNCTIONS)]
+    total = ScriptCost(builds=int(len(items) > 1))
+    for item in items:
+        total = total + node_cost(item)
+    return total
+
+
+def estimate_cost(script: Union[str, Expression]) -> ScriptCost:
+    """
+    Estimate the per-file cost of a naming script.
+
+    Loop bodies ($foreach, $while, $map) are counted once.
+    """
+    if isinstance(script, str):
+        script = parse_script(script, strip_layout=True)
+    return node_cost(script)
+
+
+def config_cost(config: ScriptConfig, sections: Optional[SectionCache] = None) -> ScriptCost:
+    """Estimate the per-file cost of the script built from a ScriptConfig"""
+    return estimate_cost(ScriptBuilder(config, sections).build())
+
+
+def config_change_cost(config: ScriptConfig, base_cost: Optional[ScriptCost] = None, **changes) -> ScriptCost:
+    """
+    Cost difference of applying changes to a ScriptConfig.
+
+    Pass the config's own cost as base_cost when comparing many changes.
+    """
+    if base_cost is None:
+        base_cost = config_cost(config)
+    return config_cost(replace(config, **changes)) - base_cost
+
+
+class CostCache:
+    """Per-file costs of configs, estimated once per distinct config content"""
+
+    def __init__(self, sections: Optional[SectionCache] = None):
+        self.sections = sections or SectionCache()
+        self._costs: Dict[str, ScriptCost] = {}
+        self.hits = 0
+        self.misses = 0
+
+    def cost(self, config: ScriptConfig) -> ScriptCost:
+        """Get the per-file cost of a config"""
+        key = config_hash(config)
+        cost = self._costs.get(key)
+        if cost is None:
+            self.misses += 1
+            cost = self._costs[key] = config_cost(config, self.sections)
+        else:
+            self.hits += 1
+        return cost
+
+    def change_cost(self, config: ScriptConfig, **changes) -> ScriptCost:
+        """Cost difference of applying changes to a config"""
+        return self.cost(replace(config, **changes)) - self.cost(config)
@@ -0,0 +1,1024 @@
+"""
+Script Engine Module
+
+Evaluates MusicBrainz Picard scripts outside of Picard, so generated naming
+scripts can be dry-run against tag data. Scripts are parsed once and
+compiled into nested Python closures; evaluating a track then only walks
+those closures. Functions follow Picard's documented behavior.
+
+A hand-edited script can loop for a long time on a single track. An
+EvaluationBudget limits the loop steps ($while, $foreach and $map
+iterations) and wall-clock time of each track; render_paths() then skips
+the tracks going over it instead of stalling the whole run.
+"""
+
+import re
+import time
+from functools import lru_cache
+from typing import Callable, Dict, Iterable, Iterator, Mapping, NamedTuple, Optional, Set, Tuple, Union
+
+from name_helpers import MEMOS
+from script_parser import Expression, Function, Node, Text, Variable, parse_script
+from script_regex import REGEX_CACHE, regex_replace, regex_search
+
+
+# Separator used when a multi-value tag is read as plain text
+MULTI_VALUE_SEPARATOR = "; "
+
+
+class ScriptError(Exception):
+    """Raised when a script cannot be compiled"""
+
+
+class BudgetExceeded(Exception):
+    """Raised when evaluating a track goes over its EvaluationBudget"""
+
+
+# Loop steps and seconds a track may take by default
+DEFAULT_MAX_STEPS = 100000
+DEFAULT_MAX_SECONDS = 1.0
+
+
+class EvaluationBudget:
+    """
+    Loop step and wall-clock limits for evaluating one track.
+
+    Each iteration of $while, $foreach or $map is a step. Loops count
+    steps themselves and only call check() once steps reaches next_check,
+    so the clock is read every CLOCK_INTERVAL steps rather than each one.
+    A limit of 0 or None is no limit.
+    """
+
+    CLOCK_INTERVAL = 256
+
+    __slots__ = ("max_steps", "max_seconds", "steps", "next_check", "deadline")
+
+    def __init__(self, max_steps: Optional[int] = DEFAULT_MAX_STEPS,
+                 max_seconds: Optional[float] = DEFAULT_MAX_SECONDS):
+        self.max_steps = max_steps or None
+        self.max_seconds = max_seconds or None
+        self.start()
+
+    def start(self):
+        """Start the budget of a new track"""
+        self.steps = 0
+        self.deadline = time.perf_counter() + self.max_seconds if self.max_seconds else None
+        self._schedule()
+
+    def _schedule(self):
+        next_check = self.steps + self.CLOCK_INTERVAL
+        if self.max_steps is not None and next_check > self.max_steps + 1:
+            next_check = self.max_steps + 1
+        self.next_check = next_check
+
+    def check(self):
+        """Raise BudgetExceeded if a limit has been reached"""
+        if self.max_steps is not None and self.steps > self.max_steps:
+            raise BudgetExceeded(f"more than {self.max_steps} loop steps")
+        if self.deadline is not None and time.perf_counter() > self.deadline:
+            raise BudgetExceeded(f"more than {self.max_seconds:g} s after {self.steps} loop steps")
+        self._schedule()
+
+
+@lru_cache(maxsize=4096)
+def join_multi(values: Tuple[str, ...]) -> str:
+    """Join a multi-value as plain text, memoized since values repeat across tracks"""
+    return MULTI_VALUE_SEPARATOR.join(values)
+
+
+def split_multi(text: str, separator: str = MULTI_VALUE_SEPARATOR) -> Tuple[str, ...]:
+    """Split plain text into a multi-value"""
+    if not text:
+        return ()
+    if not separator:
+        return (text,)
+    return tuple(text.split(separator))
+
+
+class ScriptState:
+    """
+    Variables visible to a script while it is evaluated for one track.
+
+    Multi-value tags are kept as tuples and only joined into plain text
+    when a script reads them as %variables%.
+    """
+
+    __slots__ = ("context", "budget")
+
+    def __init__(self, tags: Mapping, budget: Optional[EvaluationBudget] = None):
+        self.context = dict(tags)
+        self.budget = budget
+
+    def get(self, name: str) -> str:
+        value = self.context.get(name, "")
+        if value.__class__ is str:
+            return value
+        if value.__class__ is not tuple:
+            value = tuple(value)
+        return join_multi(value)
+
+    def get_multi(self, name: str) -> Tuple[str, ...]:
+        """Get all values of a variable; plain text counts as a single value"""
+        value = self.context.get(name)
+        if not value:
+            return ()
+        if value.__class__ is str:
+            return (value,)
+        if value.__class__ is not tuple:
+            return tuple(value)
+        return value
+
+    def set(self, name: str, value: str):
+        if value:
+            self.context[name] = value
+        else:
+            self.context.pop(name, None)
+
+
+class ScriptFunction(NamedTuple):
+    """
+    A function callable from scripts.
+
+    With eval_args, func receives the evaluated argument strings. Otherwise
+    it receives one callable per argument that evaluates it on demand, which
+    is how conditionals skip the branches they do not take.
+
+    An optional compiler is called at compile time with the Function node
+    and the compiled arguments. It can return a specialized evaluator, e.g.
+    one with constant arguments precomputed, or None to use func.
+    """
+    func: Callable
+    eval_args: bool = True
+    min_args: int = 0
+    max_args: Optional[int] = None
+    compiler: Optional[Callable] = None
+
+
+# Registry of available functions, keyed by name without the "$"
+FUNCTIONS: Dict[str, ScriptFunction] = {}
+
+
+def script_function(name: str, eval_args: bool = True, min_args: int = 0,
+                    max_args: Optional[int] = None, compiler: Optional[Callable] = None):
+    """Decorator registering a function in FUNCTIONS"""
+    def decorator(func):
+        FUNCTIONS[name] = ScriptFunction(func, eval_args, min_args, max_args, compiler)
+        return func
+    return decorator
+
+
+def _to_int(value: str) -> int:
+    return int(value.strip())
+
+
+# =============================================================================
+# ASSIGNMENT FUNCTIONS
+# =============================================================================
+
+def _empty(state):
+    return ""
+
+
+@script_function("noop", eval_args=False, compiler=lambda node, args: _empty)
+def func_noop(state, *args):
+    return ""
+
+
+@script_function("set", min_args=2, max_args=2)
+def func_set(state, name, value):
+    state.set(name, value)
+    return ""
+
+
+@script_function("get", min_args=1, max_args=1)
+def func_get(state, name):
+    return state.get(name)
+
+
+@script_function("unset", min_args=1, max_args=1)
+def func_unset(state, name):
+    if name.endswith("*"):
+        prefix = name[:-1]
+        for key in [key for key in state.context if key.startswith(prefix)]:
+            del state.context[key]
+    else:
+        state.context.pop(name, None)
+    return ""
+
+
+# =============================================================================
+# CONDITIONAL FUNCTIONS
+# =============================================================================
+
+@script_function("if", eval_args=False, min_args=2, max_args=3)
+def func_if(state, condition, then, otherwise=None):
+    if condition(state):
+        return then(state)
+    if otherwise is not None:
+        return otherwise(state)
+    return ""
+
+
+@script_function("if2", eval_args=False, min_args=1)
+def func_if2(state, *args):
+    for arg in args:
+        value = arg(state)
+        if value:
+            return value
+    return ""
+
+
+@script_function("eq", min_args=2, max_args=2)
+def func_eq(state, x, y):
+    return "1" if x == y else ""
+
+
+@script_function("ne", min_args=2, max_args=2)
+def func_ne(state, x, y):
+    return "1" if x != y else ""
+
+
+def _compare(op):
+    def func(state, x, y):
+        try:
+            return "1" if op(_to_int(x), _to_int(y)) else ""
+        except ValueError:
+            return ""
+    return func
+
+
+script_function("gt", min_args=2, max_args=2)(_compare(lambda x, y: x > y))
+script_function("gte", min_args=2, max_args=2)(_compare(lambda x, y: x >= y))
+script_function("lt", min_args=2, max_args=2)(_compare(lambda x, y: x < y))
+script_function("lte", min_args=2, max_args=2)(_compare(lambda x, y: x <= y))
+
+
+@script_function("and", min_args=2)
+def func_and(state, *args):
+    return "1" if all(args) else ""
+
+
+@script_function("or", min_args=2)
+def func_or(state, *args):
+    return "1" if any(args) else ""
+
+
+@script_function("not", min_args=1, max_args=1)
+def func_not(state, x):
+    return "" if x else "1"
+
+
+@script_function("in", min_args=2, max_args=2)
+def func_in(state, text, needle):
+    return "1" if needle in text else ""
+
+
+@script_function("startswith", min_args=2, max_args=2)
+def func_startswith(state, text, prefix):
+    return "1" if text.startswith(prefix) else ""
+
+
+@script_function("endswith", min_args=2, max_args=2)
+def func_endswith(state, text, suffix):
+    return "1" if text.endswith(suffix) else ""
+
+
+@script_function("eq_any", min_args=2)
+def func_eq_any(state, x, *args):
+    return "1" if x in args else ""
+
+
+@script_function("ne_all", min_args=2)
+def func_ne_all(state, x, *args):
+    return "" if x in args else "1"
+
+
+@script_function("eq_all", min_args=2)
+def func_eq_all(state, x, *args):
+    return "1" if all(x == arg for arg in args) else ""
+
+
+@script_function("ne_any", min_args=2)
+def func_ne_any(state, x, *args):
+    return "" if all(x == arg for arg in args) else "1"
+
+
+# =============================================================================
+# TEXT FUNCTIONS
+# =============================================================================
+
+@script_function("left", min_args=2, max_args=2)
+def func_left(state, text, length):
+    try:
+        return text[:_to_int(length)]
+    except ValueError:
+        return ""
+
+
+@script_function("right", min_args=2, max_args=2)
+def func_right(state, text, length):
+    try:
+        length = _to_int(length)
+    except ValueError:
+        return ""
+    return text[-length:] if length > 0 else ""
+
+
+@script_function("len", min_args=1, max_args=1)
+def func_len(state, text):
+    return str(len(text))
+
+
+@script_function("upper", min_args=1, max_args=1)
+def func_upper(state, text):
+    return text.upper()
+
+
+@script_function("lower", min_args=1, max_args=1)
+def func_lower(state, text):
+    return text.lower()
+
+
+@script_function("title", min_args=1, max_args=1)
+def func_title(state, text):
+    if not text:
+        return text
+    chars = [text[0].upper()]
+    capital = False
+    for i in range(1, len(text)):
+        ch = text[i]
+        if ch in "'’" and text[i - 1].isalpha():
+            capital = False
+        elif not ch.isalnum():
+            capital = True
+        elif capital and ch.isalpha():
+            capital = False
+            ch = ch.upper()
+        else:
+            capital = False
+        chars.append(ch)
+    return "".join(chars)
+
+
+def translation_table(steps) -> Dict[int, str]:
+    """Build a str.translate table equivalent to single-character replaces applied in order"""
+    table = {}
+    for char, _ in steps:
+        value = char
+        for old, new in steps:
+            value = value.replace(old, new)
+        table[ord(char)] = value
+    return table
+
+
+def compile_replace(node, args):
+    """
+    Fuse chains of single-character $replace calls into one str.translate.
+
+    Character maps such as the safe_replacements sanitization policy nest one
+    $replace per character; the fused evaluator makes a single pass instead.
+    Most text holds none of the characters, and a character-class search
+    rules that out for less than str.translate costs, so the text is only
+    translated when the search finds one.
+    """
+    old = node.args[1].literal
+    new = node.args[2].literal
+    if old is None or new is None or len(old) != 1:
+        return None
+    text = args[0]
+    steps = getattr(text, "replace_steps", ())
+    if steps:
+        text = text.replace_source
+    steps = steps + ((old, new),)
+    table = translation_table(steps)
+    search = re.compile("[" + "".join(re.escape(char) for char, _ in steps) + "]").search
+
+    def evaluator(state):
+        value = text(state)
+        return value.translate(table) if search(value) else value
+
+    evaluator.replace_steps = steps
+    evaluator.replace_source = text
+    return evaluator
+
+
+@script_function("replace", min_args=3, max_args=3, compiler=compile_replace)
+def func_replace(state, text, old, new):
+    return text.replace(old, new)
+
+
+def compile_rreplace(node, args):
+    """Hoist a literal pattern (and replacement) out of the per-track work"""
+    pattern = node.args[1].literal
+    if pattern is None:
+        return None
+    compiled = REGEX_CACHE.compile(pattern)
+    text, _, replacement = args
+    constant = node.args[2].literal
+    if constant is not None:
+        return lambda state: regex_replace(compiled, text(state), constant)
+    return lambda state: regex_replace(compiled, text(state), replacement(state))
+
+
+@script_function("rreplace", min_args=3, max_args=3, compiler=compile_rreplace)
+def func_rreplace(state, text, pattern, replacement):
+    return regex_replace(REGEX_CACHE.compile(pattern), text, replacement)
+
+
+def compile_rsearch(node, args):
+    """Hoist a literal pattern out of the per-track work"""
+    pattern = node.args[1].literal
+    if pattern is None:
+        return None
+    compiled = REGEX_CACHE.compile(pattern)
+    text = args[0]
+    return lambda state: regex_search(compiled, text(state))
+
+
+@script_function("rsearch", min_args=2, max_args=2, compiler=compile_rsearch)
+def func_rsearch(state, text, pattern):
+    return regex_search(REGEX_CACHE.compile(pattern), text)
+
+
+@script_function("num", min_args=2, max_args=2)
+def func_num(state, text, length):
+    try:
+        length = max(0, min(_to_int(length), 20))
+    except ValueError:
+        return ""
+    try:
+        value = _to_int(text)
+    except ValueError:
+        value = 0
+    return f"{value:0{length}d}" if length else str(value)
+
+
+@script_function("pad", min_args=3, max_args=3)
+def func_pad(state, text, length, char):
+    try:
+        return char * (_to_int(length) - len(text)) + text
+    except ValueError:
+        return ""
+
+
+@script_function("strip", min_args=1, max_args=1)
+def func_strip(state, text):
+    return " ".join(text.split())
+
+
+@script_function("trim", min_args=1, max_args=2)
+def func_trim(state, text, char=None):
+    return text.strip(char) if char else text.strip()
+
+
+@script_function("substr", min_args=2, max_args=3)
+def func_substr(state, text, start, end=""):
+    try:
+        start = _to_int(start) if start else None
+        end = _to_int(end) if end else None
+    except ValueError:
+        return ""
+    return text[start:end]
+
+
+@script_function("find", min_args=2, max_args=2)
+def func_find(state, haystack, needle):
+    index = haystack.find(needle)
+    return str(index) if index >= 0 else ""
+
+
+@script_function("firstalphachar", min_args=1, max_args=2)
+def func_firstalphachar(state, text, nonalpha="#", _memo=MEMOS["firstalphachar"]):
+    return _memo(text, nonalpha)
+
+
+@script_function("initials", min_args=1, max_args=1)
+def func_initials(state, text, _memo=MEMOS["initials"]):
+    return _memo(text)
+
+
+@script_function("delprefix", min_args=1)
+def func_delprefix(state, text, *prefixes, _memo=MEMOS["delprefix"]):
+    return _memo(text, prefixes)
+
+
+@script_function("swapprefix", min_args=1)
+def func_swapprefix(state, text, *prefixes, _memo=MEMOS["swapprefix"]):
+    return _memo(text, prefixes)
+
+
+@script_function("reverse", min_args=1, max_args=1)
+def func_reverse(state, text):
+    return text[::-1]
+
+
+@script_function("truncate", min_args=2, max_args=2)
+def func_truncate(state, text, length):
+    try:
+        return text[:_to_int(length)].rstrip()
+    except ValueError:
+        return text
+
+
+@script_function("firstwords", min_args=2, max_args=2)
+def func_firstwords(state, text, length):
+    try:
+        length = _to_int(length)
+    except ValueError:
+        length = 0
+    if length < 0:
+        length = len(text) + length
+    if len(text) <= length:
+        return text
+    if text[length] == " ":
+        return text[:length]
+    return text[:length].rsplit(" ", 1)[0]
+
+
+# =============================================================================
+# MATHEMATICAL FUNCTIONS
+# =============================================================================
+
+def _arithmetic(op):
+    def func(state, x, y, *args):
+        try:
+            result = op(_to_int(x), _to_int(y))
+            for arg in args:
+                result = op(result, _to_int(arg))
+        except (ValueError, ZeroDivisionError):
+            return ""
+        return str(result)
+    return func
+
+
+script_function("add", min_args=2)(_arithmetic(lambda x, y: x + y))
+script_function("sub", min_args=2)(_arithmetic(lambda x, y: x - y))
+script_function("mul", min_args=2)(_arithmetic(lambda x, y: x * y))
+script_function("div", min_args=2)(_arithmetic(lambda x, y: int(x / y)))
+script_function("mod", min_args=2)(_arithmetic(lambda x, y: x % y))
+script_function("min", min_args=2)(_arithmetic(min))
+script_function("max", min_args=2)(_arithmetic(max))
+
+
+# =============================================================================
+# MULTI-VALUE FUNCTIONS
+# =============================================================================
+
+def _compile_multi(node: Function, args, separator_index: int):
+    """
+    Compile the multi-value first argument of a function into an evaluator
+    returning a tuple.
+
+    As in Picard, a lone %variable% with the default separator reads the
+    stored values directly. Anything else is evaluated and split.
+    """
+    if len(node.args) > separator_index:
+        separator = node.args[separator_index].literal
+    else:
+        separator = MULTI_VALUE_SEPARATOR
+    name = node.args[0].variable
+    if name is not None and separator == MULTI_VALUE_SEPARATOR:
+        return lambda state: state.get_multi(name)
+    multi = args[0]
+    if separator is not None:
+        return lambda state: split_multi(multi(state), separator)
+    separator_arg = args[separator_index]
+    return lambda state: split_multi(multi(state), separator_arg(state))
+
+
+def _separator_value(node: Function, args, separator_index: int):
+    """Compile the separator argument into an evaluator"""
+    if len(node.args) <= separator_index:
+        return lambda state: MULTI_VALUE_SEPARATOR
+    return args[separator_index]
+
+
+def multi_function(name: str, separator_index: int, min_args: int, max_args: int):
+    """
+    Decorator registering a function taking a multi-value first argument.
+
+    The decorated function receives the state, the values as a tuple, the
+    separator and callables for the remaining arguments.
+    """
+    def decorator(op):
+        def compiler(node, args):
+            values = _compile_multi(node, args, separator_index)
+            separator = _separator_value(node, args, separator_index)
+            rest = args[1:separator_index]
+            return lambda state: op(state, values(state), separator(state), *rest)
+
+        def func(state, multi, *args):
+            # Generic path without compile-time information: evaluate and split
+            if len(args) >= separator_index:
+                separator = args[separator_index - 1](state)
+            else:
+                separator = MULTI_VALUE_SEPARATOR
+            return op(state, split_multi(multi(state), separator), separator, *args[:separator_index - 1])
+
+        FUNCTIONS[name] = ScriptFunction(func, False, min_args, max_args, compiler)
+        return op
+    return decorator
+
+
+@multi_function("getmulti", separator_index=2, min_args=2, max_args=3)
+def func_getmulti(state, values, separator, index):
+    try:
+        return values[_to_int(index(state))]
+    except (ValueError, IndexError):
+        return ""
+
+
+@multi_function("lenmulti", separator_index=1, min_args=1, max_args=2)
+def func_lenmulti(state, values, separator):
+    return str(len(values))
+
+
+@multi_function("join", separator_index=2, min_args=2, max_args=3)
+def func_join(state, values, separator, join_phrase):
+    return join_phrase(state).join(values)
+
+
+@multi_function("inmulti", separator_index=2, min_args=2, max_args=3)
+def func_inmulti(state, values, separator, value):
+    return "1" if value(state) in values else ""
+
+
+@multi_function("is_multi", separator_index=1, min_args=1, max_args=1)
+def func_is_multi(state, values, separator):
+    return "1" if len(values) > 1 else ""
+
+
+@multi_function("slice", separator_index=3, min_args=2, max_args=4)
+def func_slice(state, values, separator, start, end=None):
+    try:
+        start = _to_int(start(state) or "0")
+        end = end(state) if end is not None else ""
+        end = _to_int(end) if end else None
+    except ValueError:
+        return ""
+    return separator.join(values[start:end])
+
+
+@multi_function("sortmulti", separator_index=1, min_args=1, max_args=2)
+def func_sortmulti(state, values, separator):
+    return separator.join(sorted(values))
+
+
+@multi_function("reversemulti", separator_index=1, min_args=1, max_args=2)
+def func_reversemulti(state, values, separator):
+    return separator.join(reversed(values))
+
+
+@multi_function("unique", separator_index=2, min_args=1, max_args=3)
+def func_unique(state, values, separator, case_sensitive=None):
+    if case_sensitive is not None and case_sensitive(state):
+        unique = dict.fromkeys(values)
+    else:
+        unique = {}
+        for value in values:
+            unique.setdefault(value.lower(), value)
+        unique = unique.values()
+    return separator.join(unique)
+
+
+@multi_function("foreach", separator_index=2, min_args=2, max_args=3)
+def func_foreach(state, values, separator, loop_code):
+    budget = state.budget
+    for count, value in enumerate(values, 1):
+        if budget is not None:
+            budget.steps += 1
+            if budget.steps >= budget.next_check:
+                budget.check()
+        state.set("_loop_count", str(count))
+        state.set("_loop_value", value)
+        loop_code(state)
+    state.set("_loop_count", "")
+    state.set("_loop_value", "")
+    return ""
+
+
+@multi_function("map", separator_index=2, min_args=2, max_args=3)
+def func_map(state, values, separator, loop_code):
+    budget = state.budget
+    results = []
+    for count, value in enumerate(values, 1):
+        if budget is not None:
+            budget.steps += 1
+            if budget.steps >= budget.next_check:
+                budget.check()
+        state.set("_loop_count", str(count))
+        state.set("_loop_value", value)
+        results.append(loop_code(state))
+    state.set("_loop_count", "")
+    state.set("_loop_value", "")
+    return separator.join(results)
+
+
+# Iterations after which $while stops, as Picard's runaway check does
+WHILE_MAX_ITERATIONS = 1000
+
+
+@script_function("while", eval_args=False, min_args=2, max_args=2)
+def func_while(state, condition, loop_code):
+    budget = state.budget
+    count = 0
+    while count < WHILE_MAX_ITERATIONS:
+        count += 1
+        if budget is not None:
+            budget.steps += 1
+            if budget.steps >= budget.next_check:
+                budget.check()
+        state.set("_loop_count", str(count))
+        if not condition(state):
+            break
+        loop_code(state)
+    state.set("_loop_count", "")
+    return ""
+
+
+def compile_setmulti(node, args):
+    """Store a lone %variable% argument's values directly, without a join and split"""
+    name = args[0]
+    values = _compile_multi(Function(node.name, node.args[1:]), args[1:], 1)
+
+    def evaluator(state):
+        name_value = name(state)
+        if name_value:
+            state.set(name_value, values(state))
+        return ""
+    return evaluator
+
+
+@script_function("setmulti", eval_args=False, min_args=2, max_args=3, compiler=compile_setmulti)
+def func_setmulti(state, name, value, separator=None):
+    separator = separator(state) if separator is not None else MULTI_VALUE_SEPARATOR
+    state.set(name(state), split_multi(value(state), separator))
+    return ""
+
+
+@script_function("copy", min_args=2, max_args=2)
+def func_copy(state, new, old):
+    state.set(new, state.get_multi(old))
+    return ""
+
+
+@script_function("performer", min_args=0, max_args=2)
+def func_performer(state, pattern="", join=", "):
+    values = []
+    for name in state.context:
+        if name.startswith("performer:") and pattern in name[10:]:
+            values.extend(state.get_multi(name))
+    return join.join(values)
+
+
+# =============================================================================
+# COMPILATION
+# =============================================================================
+
+Evaluator = Callable[[ScriptState], str]
+
+
+def compile_node(node: Node, functions: Mapping[str, ScriptFunction] = FUNCTIONS,
+                 profiler=None) -> Evaluator:
+    """
+    Compile a syntax tree node into a callable evaluating it.
+
+    With a profiler (see script_profiler.ScriptProfiler), each function call
+    is wrapped so it gets timed.
+    """
+    if isinstance(node, Text):
+        value = node.value
+        return lambda state: value
+
+    if isinstance(node, Variable):
+        name = node.name
+        return lambda state: state.get(name)
+
+    if isinstance(node, Function):
+        evaluator = _compile_function(node, functions, profiler)
+        if profiler is not None and evaluator is not _empty:
+            target = node.args[0].literal if node.name == "set" and node.args else None
+            evaluator = profiler.wrap(node.name, evaluator, target)
+        return evaluator
+
+    # Comments and other constant-empty items are dropped entirely
+    parts = [compile_node(item, functions, profiler) for item in node.items]
+    parts = [part for part in parts if part is not _empty]
+    if not parts:
+        return _empty
+    if len(parts) == 1:
+        return parts[0]
+    return lambda state: "".join([part(state) for part in parts])
+
+
+def _compile_function(node: Function, functions: Mapping[str, ScriptFunction],
+                      profiler=None) -> Evaluator:
+    spec = functions.get(node.name)
+    if spec is None:
+        raise ScriptError(f"Unknown function '${node.name}'")
+    if len(node.args) < spec.min_args or (spec.max_args is not None and len(node.args) > spec.max_args):
+        raise ScriptError(f"Wrong number of arguments for '${node.name}'")
+
+    func = spec.func
+    args = [compile_node(arg, functions, profiler) for arg in node.args]
+    if spec.compiler is not None:
+        evaluator = spec.compiler(node, args)
+        if evaluator is not None:
+            return evaluator
+    if not spec.eval_args:
+        return lambda state: func(state, *args)
+
+    # Unrolled for the common arities to avoid building a list per call
+    if len(args) == 1:
+        a, = args
+        return lambda state: func(state, a(state))
+    if len(args) == 2:
+        a, b = args
+        return lambda state: func(state, a(state), b(state))
+    if len(args) == 3:
+        a, b, c = args
+        return lambda state: func(state, a(state), b(state), c(state))
+    return lambda state: func(state, *[arg(state) for arg in args])
+
+
+class CompiledScript:
+    """A parsed and compiled script, ready to be evaluated for many tracks"""
+
+    def __init__(self, source: str, tree: Expression, evaluator: Evaluator):
+        self.source = source
+        self.tree = tree
+        self.evaluator = evaluator
+
+    def run(self, tags: Mapping, budget: Optional[EvaluationBudget] = None) -> ScriptState:
+        """Evaluate the script and return the resulting variables"""
+        if budget is not None:
+            budget.start()
+        state = ScriptState(tags, budget)
+        self.evaluator(state)
+        return state
+
+    def evaluate(self, tags: Mapping, budget: Optional[EvaluationBudget] = None) -> str:
+        """
+        Evaluate the script and return its output.
+
+        Raises BudgetExceeded if the track goes over budget.
+        """
+        if budget is not None:
+            budget.start()
+        return self.evaluator(ScriptState(tags, budget))
+
+
+def compile_script(source: str, naming: bool = True,
+                   functions: Mapping[str, ScriptFunction] = FUNCTIONS,
+                   profiler=None) -> CompiledScript:
+    """
+    Compile a script.
+
+    Naming scripts ignore raw newlines and tabs, the same way Picard
+    treats its file naming script.
+    """
+    tree = parse_script(source, strip_layout=naming)
+    evaluator = compile_node(tree, functions, profiler)
+    if profiler is not None:
+        evaluator = profiler.wrap_script(evaluator)
+    return CompiledScript(source, tree, evaluator)
+
+
+# =============================================================================
+# FILE NAMING
+# =============================================================================
+
+def _path_safe(value):
+    if isinstance(value, str):
+        return value.replace("/", "_")
+    return tuple(item.replace("/", "_") for item in value)
+
+
+def path_safe_tags(tags: Mapping) -> Dict:
+    """Copy of tags with "/" replaced in every value, as Picard does before naming"""
+    return {name: _path_safe(value) for name, value in tags.items()}
+
+
+def render_path(script: Union[str, CompiledScript], tags: Mapping,
+                budget: Optional[EvaluationBudget] = None) -> str:
+    """
+    Render the relative path a naming script gives a track.
+
+    As in Picard, "/" inside tag values is replaced so values cannot create
+    folders. Whitespace around each path component is removed, empty
+    components are dropped and the file extension is appended.
+
+    Raises BudgetExceeded if the track goes over budget.
+    """
+    if isinstance(script, str):
+        script = compile_script(script)
+    tags = path_safe_tags(tags)
+    return format_path(script.evaluate(tags, budget), tags.get("_extension"))
+
+
+def format_path(output: str, extension: Optional[str] = None) -> str:
+    """Turn the output of a naming script into a clean relative path"""
+    path = "/".join(part for part in (part.strip() for part in output.split("/")) if part)
+    if extension:
+        path = f"{path}.{extension}"
+    return path
+
+
+def render_paths(script: Union[str, CompiledScript], tracks: Iterable[Mapping],
+                 budget: Optional[EvaluationBudget] = None,
+                 on_exceeded: Optional[Callable[[Mapping, BudgetExceeded], None]] = None) -> Iterator[Optional[str]]:
+    """
+    Render the paths for many tracks, compiling the script only once.
+
+    With a budget, a track going over it yields None instead of a path,
+    after on_exceeded is called with its tags and the error.
+    """
+    if isinstance(script, str):
+        script = compile_script(script)
+    if budget is None:
+        for tags in tracks:
+            yield render_path(script, tags)
+        return
+    for tags in tracks:
+        try:
+            path = render_path(script, tags, budget)
+        except BudgetExceeded as e:
+            if on_exceeded is not None:
+                on_exceeded(tags, e)
+            path = None
+        yield path
+
+
+# =============================================================================
+# STATIC ANALYSIS
+# =============================================================================
+
+# Functions writing the variable named by their first argument
+WRITE_FUNCTIONS = {"set", "unset", "setmulti", "copy"}
+
+# Functions reading the variable named by an argument, by argument index
+NAME_READ_FUNCTIONS = {"get": 0, "copy": 1}
+
+# Functions reading variables whose names are only known at run time
+DYNAMIC_READ_FUNCTIONS = {"performer"}
+
+# Loop functions and the variables they set while running their code
+LOOP_FUNCTIONS = {"foreach", "map"}
+LOOP_VARIABLES = ("_loop_count", "_loop_value")
+
+
+def statement_effects(node: Node) -> Tuple[Set[str], Optional[Set[str]]]:
+    """
+    Variables a statement reads and writes.
+
+    The writes are None when the variables touched cannot be known
+    statically, e.g. for $set with a computed name, $unset with a wildcard
+    or $performer. Inside $foreach or $map over a constant list, a
+    %_loop_value% name stands for each value of the list.
+    """
+    reads, writes = set(), set()
+    unknown = False
+
+    def add_names(target: Set[str], node: Function, index: int, loop_values: Optional[Tuple[str, ...]]):
+        nonlocal unknown
+        arg = node.args[index] if len(node.args) > index else None
+        literal = arg.literal if arg is not None else None
+        if literal is not None and not literal.endswith("*"):
+            target.add(literal)
+        elif arg is not None and loop_values is not None and arg.variable == "_loop_value":
+            target.update(loop_values)
+        else:
+            unknown = True
+
+    def walk(node: Node, loop_values: Optional[Tuple[str, ...]] = None):
+        nonlocal unknown
+        if isinstance(node, Variable):
+            reads.add(node.name)
+        elif isinstance(node, Expression):
+            for item in node.items:
+                walk(item, loop_values)
+        elif isinstance(node, Function):
+            if node.name == "noop":
+                return
+            if node.name in DYNAMIC_READ_FUNCTIONS:
+                unknown = True
+            if node.name in WRITE_FUNCTIONS:
+                add_names(writes, node, 0, loop_values)
+            if node.name in NAME_READ_FUNCTIONS:
+                add_names(reads, node, NAME_READ_FUNCTIONS[node.name], loop_values)
+            if node.name == "while":
+                writes.add("_loop_count")
+            if node.name in LOOP_FUNCTIONS and node.args:
+                writes.update(LOOP_VARIABLES)
+                walk(node.args[0], loop_values)
+                values = node.args[0].literal
+                separator = node.args[2].literal if len(node.args) > 2 else MULTI_VALUE_SEPARATOR
+                inner = split_multi(values, separator) if values is not None and separator is not None else None
+                for arg in node.args[1:]:
+                    walk(arg, inner)
+                return
+            for arg in node.args:
+                walk(arg, loop_values)
+
+    walk(node)
+    return reads, None if unknown else writes
@@ -0,0 +1,322 @@
+#!/usr/bin/env python3
+"""
+Incremental Script Module
+
+Keeps a hand-edited naming script parsed, validated and its sample paths
+rendered while it is being edited, without starting over on each change.
+
+An edit only reparses the top-level statements it touches: parsing starts
+at the statement containing the edit and stops as soon as it reaches a
+statement boundary past the edit that existed before it, from where the
+old statements are reused as they are.
+
+Rendering keeps, per sample track, the output of each statement and the
+values of the variables it wrote. After an edit, a statement is only
+evaluated again if it is new, or reads or writes a variable whose value
+may have changed (a conditional write leaves the earlier value in place).
+Any other statement has its recorded writes applied instead. Variables
+stop counting as changed as soon as a statement writes them back to the
+value they had before.
+
+Run: python script_incremental.py my_script.pts [--manifest sample.ndjson] [--interval 0.2]
+"""
+
+import argparse
+import bisect
+import itertools
+import os
+import sys
+import time
+from typing import Dict, List, Mapping, NamedTuple, Optional, Set, Tuple
+
+from manifest import iter_manifest
+from script_engine import (Evaluator, ScriptError, ScriptState, compile_node, format_path,
+                           path_safe_tags, statement_effects)
+from script_parser import Node, ScriptParser, ScriptSyntaxError
+
+
+class Statement:
+    """A compiled top-level statement and the variables it reads and writes"""
+
+    __slots__ = ("node", "evaluator", "reads", "writes", "inputs")
+
+    def __init__(self, node: Node):
+        self.node = node
+        self.evaluator: Evaluator = compile_node(node)
+        self.reads, self.writes = statement_effects(node)
+        # A write may be conditional, leaving the earlier value in place
+        self.inputs = self.reads | self.writes if self.writes is not None else self.reads
+
+
+class ScriptEdit(NamedTuple):
+    """Statements replaced by an edit: statements[first:first + added] replaced removed"""
+    first: int
+    removed: List[Statement]
+    added: int
+
+
+def text_edit(old: str, new: str) -> Tuple[int, int, str]:
+    """Smallest single edit turning old into new, as (start, end, replacement)"""
+    start = 0
+    limit = min(len(old), len(new))
+    while start < limit and old[start] == new[start]:
+        start += 1
+    end_old, end_new = len(old), len(new)
+    while end_old > start and end_new > start and old[end_old - 1] == new[end_new - 1]:
+        end_old -= 1
+        end_new -= 1
+    return start, end_old, new[start:end_new]
+
+
+class IncrementalScript:
+    """
+    A script split into top-level statements, reparsed incrementally.
+
+    spans holds the current (start, end) of each statement in text. Node
+    positions inside reused statements refer to where they were parsed.
+    """
+
+    def __init__(self, text: str, strip_layout: bool = True):
+        self.text = text
+        self.strip_layout = strip_layout
+        self.statements: List[Statement] = []
+        self.spans: List[Tuple[int, int]] = []
+        self.error: Optional[Exception] = None
+        self.reparsed = 0
+        self.parse()
+
+    def _parse_range(self, pos: int, stop=None) -> Tuple[List[Statement], List[Tuple[int, int]]]:
+        """Parse statements from pos until the end, or until stop(pos) is true"""
+        parser = ScriptParser(self.text, self.strip_layout)
+        parser.pos = pos
+        statements, spans = [], []
+        while parser.pos < len(self.text) and not (stop and stop(parser.pos)):
+            start = parser.pos
+            node, end = parser.parse_statement()
+            statements.append(Statement(node))
+            spans.append((start, end))
+        return statements, spans
+
+    def parse(self) -> ScriptEdit:
+        """Parse the whole script"""
+        removed = self.statements
+        try:
+            self.statements, self.spans = self._parse_range(0)
+        except (ScriptSyntaxError, ScriptError) as e:
+            self.error = e
+            return ScriptEdit(0, [], 0)
+        self.error = None
+        self.reparsed += len(self.statements)
+        return ScriptEdit(0, removed, len(self.statements))
+
+    def edit(self, start: int, end: int, replacement: str) -> ScriptEdit:
+        """
+        Replace text[start:end] and reparse the statements it touches.
+
+        On a syntax error the statements stay as they were before, error is
+        set and the next edit reparses the whole script.
+        """
+        old_length = len(self.text)
+        self.text = self.text[:start] + replacement + self.text[end:]
+        if self.error is not None:
+            return self.parse()
+        delta = len(replacement) - (end - start)
+        starts = [span[0] for span in self.spans] + [old_length]
+        # A statement ending where the edit starts may extend into it
+        first = bisect.bisect_left([span[1] for span in self.spans], start)
+        pos = starts[first] if first < len(self.spans) else old_length
+
+        def resync(new_pos):
+            old_pos = new_pos - delta
+            if old_pos < end:
+                return False
+            index = bisect.bisect_left(starts, old_pos)
+            return index < len(starts) and starts[index] == old_pos
+
+        try:
+            statements, spans = self._parse_range(pos, resync)
+        except (ScriptSyntaxError, ScriptError) as e:
+            self.error = e
+            return ScriptEdit(first, [], 0)
+        resume_pos = (spans[-1][1] if spans else pos) - delta
+        resume = bisect.bisect_left(starts, resume_pos)
+        removed = self.statements[first:resume]
+        self.statements[first:resume] = statements
+        self.spans[first:resume] = spans
+        if delta:
+            for index in range(first + len(spans), len(self.spans)):
+                span_start, span_end = self.spans[index]
+                self.spans[index] = (span_start + delta, span_end + delta)
+        self.reparsed += len(statements)
+        return ScriptEdit(first, removed, len(statements))
+
+    def set_text(self, text: str) -> ScriptEdit:
+        """Replace the whole text, reparsing only what differs"""
+        start, end, replacement = text_edit(self.text, text)
+        if start == end and not replacement:
+            return ScriptEdit(0, [], 0)
+        return self.edit(start, end, replacement)
+
+
+# Output and written variable values of a statement for one track; the
+# values are None for statements writing unknown variables
+Record = Tuple[str, Optional[Dict[str, Optional[str]]]]
+
+# Statements between two saved copies of a track's variables
+CHECKPOINT_INTERVAL = 32
+
+
+class IncrementalRenderer:
+    """
+    Renders sample tracks with an incremental script, reusing unaffected statements.
+
+    Every CHECKPOINT_INTERVAL statements a copy of each track's variables
+    is kept, so rendering restarts from the last copy before an edit.
+    """
+
+    def __init__(self, script: IncrementalScript, tracks: Mapping[str, Mapping]):
+        self.script = script
+        self.tracks = {key: path_safe_tags(tags) for key, tags in tracks.items()}
+        self.records: Dict[str, List[Record]] = {}
+        self.checkpoints: Dict[str, List[Dict]] = {}
+        self.paths: Dict[str, str] = {}
+        self.evaluated = 0
+        self.replayed = 0
+        self.update(ScriptEdit(0, [], len(script.statements)))
+
+    def edit(self, start: int, end: int, replacement: str) -> Dict[str, str]:
+        """Edit the script and render the sample tracks again"""
+        return self.update(self.script.edit(start, end, replacement))
+
+    def set_text(self, text: str) -> Dict[str, str]:
+        """Replace the script text and render the sample tracks again"""
+        return self.update(self.script.set_text(text))
+
+    def update(self, change: ScriptEdit) -> Dict[str, str]:
+        """Render the sample tracks after a change of statements"""
+        if self.script.error is not None:
+            return self.paths
+        statements = self.script.statements
+        first, added = change.first, change.added
+        shift = len(change.removed) - added
+        removed_writes: Optional[Set[str]] = set()
+        for statement in change.removed:
+            if statement.writes is None:
+                removed_writes = None
+                break
+            removed_writes |= statement.writes
+        for key, tags in self.tracks.items():
+            old_records = self.records.get(key, [])
+            old_checkpoints = self.checkpoints.get(key, [])
+            # Statements before the edit and their variables are unchanged
+            restart = min(first // CHECKPOINT_INTERVAL, len(old_checkpoints) - 1)
+            if restart >= 0:
+                checkpoints = old_checkpoints[:restart + 1]
+                state = ScriptState(checkpoints[restart])
+            else:
+                checkpoints = []
+                state = ScriptState(tags)
+            records = old_records[:max(restart, 0) * CHECKPOINT_INTERVAL]
+            context = state.context
+            # Variables that may hold a different value than in the last render
+            changed: Set[str] = set()
+            poisoned = False
+            for index in range(len(records), len(statements)):
+                statement = statements[index]
+                if index == len(checkpoints) * CHECKPOINT_INTERVAL:
+                    checkpoints.append(dict(context))
+                if index == first:
+                    if removed_writes is None:
+                        poisoned = True
+                    else:
+                        changed |= removed_writes
+                if index < first:
+                    record = old_records[index] if index < len(old_records) else None
+                elif index >= first + added and 0 <= index + shift < len(old_records):
+                    record = old_records[index + shift]
+                    if not changed and not poisoned and not shift:
+                        # Past the edit with nothing changed: the rest is as before
+                        records.extend(old_records[index:])
+                        checkpoints.extend(old_checkpoints[len(checkpoints):])
+                        break
+                else:
+                    record = None
+                if (record is not None and record[1] is not None and not poisoned
+                        and statement.inputs.isdisjoint(changed)):
+                    written = record[1]
+                    for name, value in written.items():
+                        if value is None:
+                            context.pop(name, None)
+                        else:
+                            context[name] = value
+                    if changed:
+                        changed.difference_update(written)
+                    records.append(record)
+                    self.replayed += 1
+                    continue
+                output = statement.evaluator(state)
+                self.evaluated += 1
+                if statement.writes is None:
+                    poisoned = True
+                    records.append((output, None))
+                    continue
+                written = {name: context.get(name) for name in statement.writes}
+                old_written = record[1] if record is not None else None
+                for name, value in written.items():
+                    if old_written is None or old_written.get(name) != value:
+                        changed.add(name)
+                    else:
+                        changed.discard(name)
+                records.append((output, written))
+            self.records[key] = records
+            self.checkpoints[key] = checkpoints
+            self.paths[key] = format_path("".join(record[0] for record in records), tags.get("_extension"))
+        return self.paths
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Validate and preview a naming script while it is edited")
+    parser.add_argument("script", help="Picard script file (.pts)")
+    parser.add_argument("--manifest", help="Render the first tracks of this manifest instead of the built-in samples")
+    parser.add_argument("--tracks", type=int, default=5, help="Tracks to render from the manifest")
+    parser.add_argument("--interval", type=float, default=0.2, help="Seconds between checks of the file")
+    args = parser.parse_args(argv)
+
+    if args.manifest:
+        tracks = {str(index): tags for index, tags in
+                  enumerate(itertools.islice(iter_manifest(args.manifest), args.tracks))}
+    else:
+        from script_preview import SAMPLE_TRACKS
+        tracks = SAMPLE_TRACKS
+
+    def read():
+        with open(args.script, "r", encoding="utf-8") as f:
+            return f.read()
+
+    mtime = os.stat(args.script).st_mtime_ns
+    renderer = IncrementalRenderer(IncrementalScript(read()), tracks)
+    last = None
+    try:
+        while True:
+            script = renderer.script
+            if script.error is not None:
+                print(f"Error: {script.error}", file=sys.stderr)
+            elif renderer.paths != last:
+                for key, path in renderer.paths.items():
+                    print(f"{key}\t{path}")
+                last = dict(renderer.paths)
+            while os.stat(args.script).st_mtime_ns == mtime:
+                time.sleep(args.interval)
+            mtime = os.stat(args.script).st_mtime_ns
+            start = time.perf_counter()
+            evaluated = renderer.evaluated
+            renderer.set_text(read())
+            print(f"-- {len(script.statements)} statements, "
+                  f"{renderer.evaluated - evaluated} evaluations, "
+                  f"{(time.perf_counter() - start) * 1000:.1f} ms", file=sys.stderr)
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,295 @@
+"""
+Script Parser Module
+
+Parses MusicBrainz Picard scripts (TaggerScript) into a small syntax tree.
+The grammar follows Picard's own parser: text, %variables% and
+$function(arg,...) calls, with backslash escapes for special characters.
+"""
+
+from typing import List, Optional, Tuple, Union
+
+
+# Characters that can be escaped with a backslash
+ESCAPE_CHARS = {
+    "n": "\n",
+    "t": "\t",
+    "\\": "\\",
+    "$": "$",
+    "%": "%",
+    "(": "(",
+    ")": ")",
+    ",": ",",
+}
+
+
+class ScriptSyntaxError(ValueError):
+    """Raised when a script cannot be parsed"""
+
+    def __init__(self, message: str, text: str, pos: int):
+        self.pos = pos
+        self.line = text.count("\n", 0, pos) + 1
+        self.column = pos - (text.rfind("\n", 0, pos) + 1) + 1
+        super().__init__(f"{message} at line {self.line}, column {self.column}")
+
+
+class Text:
+    """Literal text"""
+
+    __slots__ = ("value", "start", "end")
+
+    def __init__(self, value: str, start: int = 0, end: int = 0):
+        self.value = value
+        self.start = start
+        self.end = end
+
+    def __eq__(self, other):
+        return isinstance(other, Text) and other.value == self.value
+
+    def __hash__(self):
+        return hash(("text", self.value))
+
+    def __repr__(self):
+        return f"Text({self.value!r})"
+
+
+class Variable:
+    """Variable reference: %name%"""
+
+    __slots__ = ("name", "start", "end")
+
+    def __init__(self, name: str, start: int = 0, end: int = 0):
+        self.name = name
+        self.start = start
+        self.end = end
+
+    def __eq__(self, other):
+        return isinstance(other, Variable) and other.name == self.name
+
+    def __hash__(self):
+        return hash(("var", self.name))
+
+    def __repr__(self):
+        return f"Variable({self.name!r})"
+
+
+class Expression:
+    """Sequence of text, variables and function calls evaluated by concatenation"""
+
+    __slots__ = ("items", "start", "end")
+
+    def __init__(self, items: List["Node"], start: int = 0, end: int = 0):
+        self.items = tuple(items)
+        self.start = start
+        self.end = end
+
+    @property
+    def literal(self) -> Optional[str]:
+        """The constant value of the expression, or None if it is not constant"""
+        if all(isinstance(item, Text) for item in self.items):
+            return "".join(item.value for item in self.items)
+        return None
+
+    @property
+    def variable(self) -> Optional[str]:
+        """The variable name if the expression is a single %variable%"""
+        if len(self.items) == 1 and isinstance(self.items[0], Variable):
+            return self.items[0].name
+        return None
+
+    def __eq__(self, other):
+        return isinstance(other, Expression) and other.items == self.items
+
+    def __hash__(self):
+        return hash(self.items)
+
+    def __repr__(self):
+        return f"Expression({list(self.items)!r})"
+
+
+class Function:
+    """Function call: $name(arg1,arg2,...)"""
+
+    __slots__ = ("name", "args", "start", "end")
+
+    def __init__(self, name: str, args: List[Expression], start: int = 0, end: int = 0):
+        self.name = name
+        self.args = tuple(args)
+        self.start = start
+        self.end = end
+
+    def __eq__(self, other):
+        return (isinstance(other, Function) and other.name == self.name
+                and other.args == self.args)
+
+    def __hash__(self):
+        return hash((self.name, self.args))
+
+    def __repr__(self):
+        return f"Function({self.name!r}, {list(self.args)!r})"
+
+
+Node = Union[Text, Variable, Function, Expression]
+
+
+class ScriptParser:
+    """
+    Recursive descent parser for Picard scripts.
+
+    When strip_layout is set, raw newlines and tabs are dropped from literal
+    text, the way Picard treats file naming scripts. Node positions always
+    refer to the original text.
+    """
+
+    def __init__(self, text: str, strip_layout: bool = False):
+        self.text = text
+        self.strip_layout = strip_layout
+        self.pos = 0
+
+    def parse(self) -> Expression:
+        """Parse the whole script"""
+        expression, _ = self._parse_expression(top=True)
+        return expression
+
+    def parse_statement(self) -> Tuple[Node, int]:
+        """Parse a single top-level item starting at the current position"""
+        start = self.pos
+        ch = self.text[start]
+        self.pos += 1
+        if ch == "$":
+            node = self._parse_function(start)
+        elif ch == "%":
+            node = self._parse_variable(start)
+        else:
+            self.pos = start
+            node = self._parse_text(start, top=True)
+        return node, self.pos
+
+    def _error(self, message: str, pos: Optional[int] = None):
+        raise ScriptSyntaxError(message, self.text, self.pos if pos is None else pos)
+
+    def _parse_expression(self, top: bool) -> Tuple[Expression, Optional[str]]:
+        text = self.text
+        start = self.pos
+        items = []
+        while True:
+            if self.pos >= len(text):
+                if not top:
+                    self._error("Unexpected end of script")
+                return Expression(items, start, self.pos), None
+            ch = text[self.pos]
+            if not top and ch in ",)":
+                self.pos += 1
+                return Expression(items, start, self.pos - 1), ch
+            item_start = self.pos
+            self.pos += 1
+            if ch == "$":
+                items.append(self._parse_function(item_start))
+            elif ch == "%":
+                items.append(self._parse_variable(item_start))
+            else:
+                self.pos = item_start
+                item = self._parse_text(item_start, top)
+                if item.value:
+                    items.append(item)
+
+    def _parse_function(self, start: int) -> Function:
+        text = self.text
+        name_start = self.pos
+        while self.pos < len(text) and (text[self.pos].isalnum() or text[self.pos] == "_"):
+            self.pos += 1
+        if self.pos >= len(text):
+            self._error("Unexpected end of script")
+        if text[self.pos] != "(":
+            self._error(f"Unexpected character '{text[self.pos]}'")
+        name = text[name_start:self.pos]
+        if not name:
+            self._error("Missing function name")
+        self.pos += 1
+        args = []
+        while True:
+            arg, terminator = self._parse_expression(top=False)
+            args.append(arg)
+            if terminator == ")":
+                break
+        # $func() is a call without arguments, not a call with one empty argument
+        if len(args) == 1 and not args[0].items:
+            args = []
+        return Function(name, args, start, self.pos)
+
+    def _parse_variable(self, start: int) -> Variable:
+        text = self.text
+        name_start = self.pos
+        while self.pos < len(text):
+            ch = text[self.pos]
+            if ch == "%":
+                self.pos += 1
+                return Variable(text[name_start:self.pos - 1], start, self.pos)
+            if not (ch.isalnum() or ch in "_:"):
+                self._error(f"Unexpected character '{ch}' in variable name")
+            self.pos += 1
+        self._error("Unexpected end of script")
+
+    def _parse_text(self, start: int, top: bool) -> Text:
+        text = self.text
+        chars = []
+        while self.pos < len(text):
+            ch = text[self.pos]
+            if ch == "\\":
+                chars.append(self._parse_escape())
+                continue
+            if ch in "$%" or (not top and ch in ",)"):
+                break
+            if not top and ch == "(":
+                self._error("Unexpected character '('")
+            if not (self.strip_layout and ch in "\n\t"):
+                chars.append(ch)
+            self.pos += 1
+        return Text("".join(chars), start, self.pos)
+
+    def _parse_escape(self) -> str:
+        text = self.text
+        self.pos += 1
+        if self.pos >= len(text):
+            self._error("Unexpected end of script")
+        ch = text[self.pos]
+        self.pos += 1
+        if ch == "u":
+            code = text[self.pos:self.pos + 4]
+            if len(code) != 4 or any(c not in "0123456789abcdefABCDEF" for c in code):
+                self._error("Invalid unicode escape")
+            self.pos += 4
+            return chr(int(code, 16))
+        if ch not in ESCAPE_CHARS:
+            self._error(f"Unexpected escape sequence '\\{ch}'", self.pos - 2)
+        return ESCAPE_CHARS[ch]
+
+
+def parse_script(text: str, strip_layout: bool = False) -> Expression:
+    """Parse a Picard script into an Expression"""
+    return ScriptParser(text, strip_layout).parse()
+
+
+def escape_text(value: str) -> str:
+    """Escape literal text so it can be embedded in a script"""
+    out = []
+    for ch in value:
+        if ch in "\\$%(),":
+            out.append("\\" + ch)
+        elif ch == "\n":
+            out.append("\\n")
+        elif ch == "\t":
+            out.append("\\t")
+        else:
+            out.append(ch)
+    return "".join(out)
+
+
+def to_script(node: Node) -> str:
+    """Convert a syntax tree back to script text"""
+    if isinstance(node, Text):
+        return escape_text(node.value)
+    if isinstance(node, Variable):
+        return f"%{node.name}%"
+    if isinstance(node, Function):
+        return f"${node.name}(" + ",".join(to_script(arg) for arg in node.args) + ")"
+    return "".join(to_script(item) for item in node.items)
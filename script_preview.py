@@ -0,0 +1,132 @@
+"""
+Script Preview Module
+
+Renders a handful of sample tracks with a ScriptConfig, so the effect of
+each setting can be shown while it is being chosen.
+
+Generated sections are cached by the config fields they read (see
+SectionCache), and each section is compiled once per distinct text, so
+changing one setting only regenerates and recompiles the sections reading
+it before the samples are rendered again.
+
+ExampleCache uses the same samples as the example output of presets,
+computed once per distinct config.
+"""
+
+import hashlib
+import json
+import time
+from dataclasses import asdict
+from typing import Dict, List, Optional
+
+from script_builder import ScriptBuilder, ScriptConfig, SectionCache
+from script_components import SPECIAL_IDS
+from script_engine import ScriptState, compile_node, format_path, path_safe_tags
+from script_parser import parse_script
+
+
+_ALBUM = {
+    "albumartist": "The Beatles",
+    "albumartistsort": "Beatles, The",
+    "musicbrainz_albumartistid": "b10bbbfc-cf9e-42e0-be17-e2c3e1d2600d",
+    "album": "Abbey Road",
+    "date": "1987-04-30",
+    "originaldate": "1969-09-26",
+    "label": "Apple",
+    "catalognumber": "PCS 7088",
+    "_releasecomment": "Remaster",
+    "totaldiscs": "1",
+    "discnumber": "1",
+    "totaltracks": "17",
+    "_extension": "flac",
+}
+
+# Sample tracks by kind of release: single-disc, multi-disc, Various
+# Artists and soundtrack, with a featured artist on the multi-disc one
+SAMPLE_TRACKS: Dict[str, Dict] = {
+    "single-disc": dict(_ALBUM, artist="The Beatles", title="Come Together", tracknumber="1"),
+    "multi-disc": dict(
+        _ALBUM, album="The Beatles", date="1968-11-22", originaldate="1968-11-22",
+        _releasecomment="", catalognumber="PCS 7067", totaldiscs="2", discnumber="2",
+        discsubtitle="", totaltracks="13", tracknumber="3",
+        artist="The Beatles feat. Eric Clapton", title="While My Guitar Gently Weeps",
+    ),
+    "various-artists": dict(
+        _ALBUM, albumartist="Various Artists", albumartistsort="Various Artists",
+        musicbrainz_albumartistid=SPECIAL_IDS["VARIOUS_ARTISTS_ID"], album="Now That's What I Call Music!",
+        date="1983-11-28", originaldate="1983-11-28", label="Virgin", catalognumber="NOW 1",
+        _releasecomment="", totaldiscs="2", discnumber="1", totaltracks="15", tracknumber="1",
+        artist="Phil Collins", title="You Can't Hurry Love", _extension="mp3",
+        _secondaryreleasetype="compilation",
+    ),
+    "soundtrack": dict(
+        _ALBUM, albumartist="Vangelis", albumartistsort="Vangelis",
+        musicbrainz_albumartistid="c6b1f0a1-3ba0-4ae2-b6e2-ac7f9e6c5a5e", album="Blade Runner",
+        date="1994-05-25", originaldate="1994-05-25", label="EastWest", catalognumber="4509-96574-2",
+        _releasecomment="", totaltracks="12", tracknumber="12", artist="Vangelis",
+        title="Tears in Rain", _secondaryreleasetype="soundtrack",
+    ),
+}
+
+
+class ScriptPreview:
+    """Renders sample tracks with a config, reusing unchanged sections"""
+
+    def __init__(self, tracks: Optional[Dict[str, Dict]] = None):
+        self.tracks = {kind: path_safe_tags(tags) for kind, tags in (tracks or SAMPLE_TRACKS).items()}
+        self.sections = SectionCache()
+        self._compiled: Dict[str, object] = {}
+        self.seconds = 0.0
+
+    def _compile(self, part: str):
+        evaluator = self._compiled.get(part)
+        if evaluator is None:
+            evaluator = self._compiled[part] = compile_node(parse_script(part, strip_layout=True))
+        return evaluator
+
+    def render(self, config: ScriptConfig) -> Dict[str, str]:
+        """Render the path of each sample track"""
+        start = time.perf_counter()
+        builder = ScriptBuilder(config, self.sections)
+        builder.build()
+        # Sections are whole statements, so compiling them one by one gives
+        # the same result as compiling the joined script; the header is
+        # only a comment and changes every minute
+        evaluators = [self._compile(part) for part in builder.script_parts[1:]]
+        paths = {}
+        for kind, tags in self.tracks.items():
+            state = ScriptState(tags)
+            output = "".join(evaluator(state) for evaluator in evaluators)
+            paths[kind] = format_path(output, tags.get("_extension"))
+        self.seconds = time.perf_counter() - start
+        return paths
+
+    def changes(self, before: Dict[str, str], after: Dict[str, str]) -> List[str]:
+        """Sample kinds whose path differs between two renders"""
+        return [kind for kind in after if before.get(kind) != after[kind]]
+
+
+def config_hash(config: ScriptConfig) -> str:
+    """Hash of a config's settings"""
+    return hashlib.sha1(json.dumps(asdict(config), sort_keys=True).encode("utf-8")).hexdigest()
+
+
+class ExampleCache:
+    """Sample paths of configs, rendered once per distinct config content"""
+
+    def __init__(self, preview: Optional[ScriptPreview] = None):
+        self.preview = preview or ScriptPreview()
+        self._examples: Dict[str, Dict[str, str]] = {}
+        self.hits = 0
+        self.misses = 0
+
+    def examples(self, config: ScriptConfig) -> Dict[str, str]:
+        """Get the path of each sample track for a config"""
+        key = config_hash(config)
+        examples = self._examples.get(key)
+        if examples is None:
+            self.misses += 1
+            examples = self._examples[key] = self.preview.render(config)
+        else:
+            self.hits += 1
+        return examples
@@ -0,0 +1,148 @@
+"""
+Script Profiler Module
+
+Records where evaluation time goes when a script is run over many tracks:
+call counts and time per function ($rreplace, $if2, $num...), per $set
+target, and per call stack for flame graphs.
+
+Profiling is opt-in at compile time. A script compiled without a profiler
+has no wrappers at all, so an unprofiled run pays nothing for it.
+"""
+
+import time
+from typing import Callable, Dict, List, Tuple
+
+
+ROOT_FRAME = "script"
+
+
+class FrameStats:
+    """Counters for one function or $set target"""
+
+    __slots__ = ("calls", "total", "own")
+
+    def __init__(self):
+        self.calls = 0
+        self.total = 0.0
+        self.own = 0.0
+
+
+class ScriptProfiler:
+    """
+    Collects timings from evaluators wrapped at compile time.
+
+    total is inclusive time, counted only for the outermost active call of a
+    frame so recursion is not double counted. own excludes time spent in
+    nested calls. Stack timings are own time, as flame graphs expect.
+    """
+
+    def __init__(self, clock: Callable[[], float] = time.perf_counter):
+        self.clock = clock
+        self.functions: Dict[str, FrameStats] = {}
+        self.targets: Dict[str, FrameStats] = {}
+        self.stacks: Dict[Tuple[str, ...], float] = {}
+        self.tracks = 0
+        self._stack: List[str] = [ROOT_FRAME]
+        self._child_time: List[float] = [0.0]
+        self._active: Dict[str, int] = {}
+
+    def _stats(self, table: Dict[str, FrameStats], key: str) -> FrameStats:
+        stats = table.get(key)
+        if stats is None:
+            stats = table[key] = FrameStats()
+        return stats
+
+    def wrap(self, function: str, evaluator: Callable, target: str = None) -> Callable:
+        """Wrap a compiled function call so it is timed"""
+        frame = f"${function}({target})" if target else f"${function}"
+        function_stats = self._stats(self.functions, f"${function}")
+        target_stats = self._stats(self.targets, target) if target else None
+        stack = self._stack
+        child_time = self._child_time
+        active = self._active
+        clock = self.clock
+        stacks = self.stacks
+
+        def profiled(state):
+            stack.append(frame)
+            child_time.append(0.0)
+            depth = active.get(frame, 0)
+            active[frame] = depth + 1
+            start = clock()
+            try:
+                return evaluator(state)
+            finally:
+                elapsed = clock() - start
+                own = elapsed - child_time.pop()
+                key = tuple(stack)
+                stack.pop()
+                child_time[-1] += elapsed
+                active[frame] = depth
+                stacks[key] = stacks.get(key, 0.0) + own
+                for stats in (function_stats, target_stats):
+                    if stats is None:
+                        continue
+                    stats.calls += 1
+                    stats.own += own
+                    if not depth:
+                        stats.total += elapsed
+
+        # Keep attributes compile hooks rely on, such as fused $replace chains
+        profiled.__dict__.update(getattr(evaluator, "__dict__", {}))
+        return profiled
+
+    def wrap_script(self, evaluator: Callable) -> Callable:
+        """Wrap a whole compiled script, counting tracks and top-level time"""
+        stacks = self.stacks
+        child_time = self._child_time
+        clock = self.clock
+
+        def profiled(state):
+            self.tracks += 1
+            child_time[0] = 0.0
+            start = clock()
+            try:
+                return evaluator(state)
+            finally:
+                own = clock() - start - child_time[0]
+                stacks[(ROOT_FRAME,)] = stacks.get((ROOT_FRAME,), 0.0) + own
+
+        return profiled
+
+    def reset(self):
+        """Discard all collected timings"""
+        self.functions.clear()
+        self.targets.clear()
+        self.stacks.clear()
+        self.tracks = 0
+
+    def format_text(self, limit: int = 30) -> str:
+        """Flat report of the most expensive functions and $set targets"""
+        lines = [f"Tracks evaluated: {self.tracks}"]
+        for title, table in (("Functions", self.functions), ("$set targets", self.targets)):
+            lines.append("")
+            lines.append(f"{title} (by own time)")
+            lines.append(f"{'calls':>10} {'total ms':>10} {'own ms':>10} {'us/call':>8}  name")
+            ranked = sorted(table.items(), key=lambda item: item[1].own, reverse=True)
+            for name, stats in ranked[:limit]:
+                if not stats.calls:
+                    continue
+                lines.append(
+                    f"{stats.calls:>10} {stats.total * 1e3:>10.2f} {stats.own * 1e3:>10.2f} "
+                    f"{stats.own / stats.calls * 1e6:>8.2f}  {name}"
+                )
+        return "\n".join(lines)
+
+    def format_collapsed(self) -> str:
+        """
+        Collapsed stacks, one "frame;frame;frame value" line per stack.
+
+        Values are microseconds of own time, which flamegraph.pl, speedscope
+        and inferno accept as sample counts.
+        """
+        lines = []
+        for stack, own in sorted(self.stacks.items()):
+            value = int(round(own * 1e6))
+            if value > 0:
+                lines.append(f"{';'.join(stack)} {value}")
+        return "\n".join(lines) + "\n"
@@ -0,0 +1,124 @@
+"""
+Script Regex Module
+
+Compiled regular expression cache for $rreplace and $rsearch. Picard hands
+patterns straight to Python's re module, so scripts repeat the same pattern
+text for every track; the cache compiles each distinct pattern once.
+"""
+
+import re
+from collections import OrderedDict
+from typing import Dict, Optional, Pattern
+
+
+# Global inline flags such as (?i), which Python only accepts at the start
+_INLINE_FLAGS = re.compile(r"\(\?([aiLmsux]+)\)")
+
+
+def translate_pattern(pattern: str) -> str:
+    """
+    Translate a Picard pattern to one the running Python accepts.
+
+    Older Pythons allowed global inline flags anywhere in a pattern, and
+    scripts written for them (e.g. "%_reCaseInsensitive%" appended after
+    other text) still do. Newer Pythons reject these, so they are moved to
+    the start of the pattern.
+    """
+    flags = []
+
+    def collect(match):
+        flags.append(match.group(1))
+        return ""
+
+    if _INLINE_FLAGS.search(pattern, 1) is None:
+        return pattern
+    stripped = _INLINE_FLAGS.sub(collect, pattern)
+    return "(?" + "".join(sorted(set("".join(flags)))) + ")" + stripped
+
+
+class RegexCache:
+    """
+    Bounded LRU cache of compiled patterns.
+
+    Invalid patterns are cached as None so they are not recompiled for every
+    track either. Hit and miss counters are kept for profiling.
+    """
+
+    def __init__(self, maxsize: int = 256):
+        self.maxsize = maxsize
+        self._patterns: "OrderedDict[str, Optional[Pattern]]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __len__(self):
+        return len(self._patterns)
+
+    def compile(self, pattern: str) -> Optional[Pattern]:
+        """Get the compiled pattern, or None if it is invalid"""
+        patterns = self._patterns
+        try:
+            compiled = patterns[pattern]
+        except KeyError:
+            pass
+        else:
+            self.hits += 1
+            patterns.move_to_end(pattern)
+            return compiled
+
+        self.misses += 1
+        try:
+            compiled = re.compile(translate_pattern(pattern))
+        except re.error:
+            compiled = None
+        patterns[pattern] = compiled
+        if len(patterns) > self.maxsize:
+            patterns.popitem(last=False)
+            self.evictions += 1
+        return compiled
+
+    def clear(self):
+        """Empty the cache and reset the counters"""
+        self._patterns.clear()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def stats(self) -> Dict[str, float]:
+        """Get the cache counters"""
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self._patterns),
+            "maxsize": self.maxsize,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+        }
+
+
+# Cache shared by all compiled scripts
+REGEX_CACHE = RegexCache()
+
+
+def regex_replace(compiled: Optional[Pattern], text: str, replacement: str) -> str:
+    """$rreplace semantics: the text is returned unchanged on any regex error"""
+    if compiled is None:
+        return text
+    try:
+        return compiled.sub(replacement, text)
+    except re.error:
+        return text
+
+
+def regex_search(compiled: Optional[Pattern], text: str) -> str:
+    """$rsearch semantics: the first group if there is one, else the whole match"""
+    if compiled is None:
+        return ""
+    match = compiled.search(text)
+    if match is None:
+        return ""
+    try:
+        return match.group(1) or ""
+    except IndexError:
+        return match.group(0)
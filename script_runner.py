@@ -0,0 +1,298 @@
+#!/usr/bin/env python3
+"""
+Script Runner
+
+Dry-runs a Picard naming script over a tag manifest and prints the path
+each track would be given, optionally profiling where evaluation time goes.
+
+With --memory-profile the run streams the tracks a chunk at a time, one
+stage after the other for each chunk (read, derive artist variables,
+render, check collisions and lengths, output), so memory_profile can
+report what each stage allocates.
+
+Run: python script_runner.py my_script.pts library.ndjson [--profile]
+     python script_runner.py my_script.pts library.ndjson --album MBID
+     python script_runner.py my_script.pts library.ndjson --quiet --metrics-prom /var/lib/node_exporter/naming.prom
+     python script_runner.py my_script.pts library.ndjson --quiet --memory-profile memory.json
+"""
+
+import argparse
+import sys
+import time
+from itertools import islice
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from artist_variables import AdditionalArtistsVariables
+from manifest import PATH_KEY, ManifestReader, index_value, iter_manifest
+from memory_profile import MemoryProfiler, compare_reports, format_comparison, load_report
+from name_helpers import MEMOS, memo_stats, reset_memos
+from path_budget import PathBudget, format_overrun
+from rename_plan import STATUS_COLLISION, CollisionChecker
+from run_metrics import RunMetrics, StageCounter
+from script_engine import (DEFAULT_MAX_SECONDS, DEFAULT_MAX_STEPS, BudgetExceeded, EvaluationBudget,
+                           compile_script, render_path)
+from script_profiler import ScriptProfiler
+
+
+class ScriptRunner:
+    """
+    Renders naming paths for many tracks with one compiled script.
+
+    With a budget, render_all() leaves out the tracks going over it and
+    keeps them in skipped, with the reason.
+    """
+
+    def __init__(self, script: str, profile: bool = False, budget: Optional[EvaluationBudget] = None):
+        reset_memos()
+        self.profiler: Optional[ScriptProfiler] = ScriptProfiler() if profile else None
+        self.compiled = compile_script(script, profiler=self.profiler)
+        self.budget = budget
+        self.skipped: List[Tuple[Dict, str]] = []
+
+    def render(self, tags: Dict) -> str:
+        """Render the path for one track; raises BudgetExceeded if it goes over budget"""
+        return render_path(self.compiled, tags, self.budget)
+
+    def render_all(self, tracks: Iterable[Dict], stage: Optional[StageCounter] = None) -> Iterator[Tuple[Dict, str]]:
+        """Render the paths for many tracks, counting the time spent in stage if given"""
+        compiled, budget = self.compiled, self.budget
+        clock = time.perf_counter
+        for tags in tracks:
+            start = clock()
+            try:
+                path = render_path(compiled, tags, budget)
+            except BudgetExceeded as e:
+                path = None
+                self.skipped.append((tags, str(e)))
+            if stage is not None:
+                stage.busy += clock() - start
+                stage.items += 1
+            if path is not None:
+                yield tags, path
+
+
+def timed_tracks(tracks: Iterable[Dict], stage: StageCounter) -> Iterator[Dict]:
+    """Yield tracks, counting the time spent reading them in stage"""
+    clock = time.perf_counter
+    tracks = iter(tracks)
+    while True:
+        start = clock()
+        tags = next(tracks, None)
+        if tags is None:
+            return
+        stage.busy += clock() - start
+        stage.items += 1
+        yield tags
+
+
+def timed_map(function: Callable[[Dict], Dict], tracks: Iterable[Dict], stage: StageCounter) -> Iterator[Dict]:
+    """Yield function(tags) for each track, counting the time spent in function in stage"""
+    clock = time.perf_counter
+    for tags in tracks:
+        start = clock()
+        tags = function(tags)
+        stage.busy += clock() - start
+        stage.items += 1
+        yield tags
+
+
+def _budget(args) -> Optional[EvaluationBudget]:
+    if not args.max_steps and not args.max_seconds:
+        return None
+    return EvaluationBudget(args.max_steps, args.max_seconds)
+
+
+def report_skipped(skipped: List[Tuple[Dict, str]]):
+    """Print the tracks left out for going over the evaluation budget"""
+    if not skipped:
+        return
+    print(f"Skipped {len(skipped)} tracks over the evaluation budget:", file=sys.stderr)
+    for tags, reason in skipped:
+        print(f"  {tags.get(PATH_KEY) or tags.get('title') or '(no path)'}: {reason}", file=sys.stderr)
+
+
+def profile_memory(script: str, tracks: Iterable[Dict], args,
+                   artist_variables: Optional[AdditionalArtistsVariables] = None) -> MemoryProfiler:
+    """
+    Dry-run under tracemalloc, tracing the memory of each stage.
+
+    The tracks stream through the same stages as a normal run, a chunk of
+    --memory-chunk tracks at a time, so only one chunk is held at once.
+    """
+    profiler = MemoryProfiler(top=args.memory_top)
+    # Checked as a rename plan checks them, keeping the targets but not the entries
+    checker = CollisionChecker()
+    budget = PathBudget()
+    tracks = iter(tracks)
+    count = overruns = 0
+    profiler.start()
+    try:
+        with profiler.stage("compile"):
+            runner = ScriptRunner(script, budget=_budget(args))
+        while True:
+            with profiler.stage("read"):
+                chunk = list(islice(tracks, args.memory_chunk))
+            if not chunk:
+                break
+            if artist_variables is not None:
+                with profiler.stage("artists"):
+                    chunk = [artist_variables.apply(tags) for tags in chunk]
+            with profiler.stage("render"):
+                rendered = list(runner.render_all(chunk))
+            with profiler.stage("check"):
+                for tags, path in rendered:
+                    checker.check(tags.get(PATH_KEY) or str(count), path)
+                    count += 1
+                    if budget.check(path) is not None:
+                        overruns += 1
+            with profiler.stage("output"):
+                if not args.quiet:
+                    for tags, path in rendered:
+                        source = tags.get(PATH_KEY)
+                        print(f"{source}\t{path}" if source else path)
+            chunk = rendered = []
+            profiler.release()
+    finally:
+        profiler.stop()
+    report_skipped(runner.skipped)
+    print(f"{count} tracks, {checker.counts[STATUS_COLLISION]} collisions, {overruns} paths too long\n",
+          file=sys.stderr)
+    return profiler
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Dry-run a Picard naming script over a tag manifest")
+    parser.add_argument("script", help="Picard script file (.pts)")
+    parser.add_argument("manifest", help="Tag manifest (NDJSON, one track per line)")
+    parser.add_argument("--profile", action="store_true", help="Print time spent per function and $set target")
+    parser.add_argument("--collapsed", metavar="FILE", help="Write collapsed stacks for flame graph tools")
+    parser.add_argument("--quiet", action="store_true", help="Do not print the rendered paths")
+    parser.add_argument("--additional-artists", action="store_true",
+                        help="Emulate the Additional Artists Variables plugin")
+    parser.add_argument("--check-lengths", action="store_true",
+                        help="Report names over 255 bytes and paths over 4096 bytes")
+    parser.add_argument("--album", action="append", metavar="MBID",
+                        help="Only render tracks of this release (repeatable; uses an offset index)")
+    parser.add_argument("--albumartist", action="append", metavar="NAME",
+                        help="Only render tracks of this album artist (repeatable; uses an offset index)")
+    parser.add_argument("--max-steps", type=int, default=DEFAULT_MAX_STEPS,
+                        help="Loop iterations allowed per track before it is skipped (0: no limit)")
+    parser.add_argument("--max-seconds", type=float, default=DEFAULT_MAX_SECONDS,
+                        help="Seconds allowed per track before it is skipped (0: no limit)")
+    parser.add_argument("--metrics-json", metavar="FILE", help="Write run metrics to this JSON file")
+    parser.add_argument("--metrics-prom", metavar="FILE",
+                        help="Write run metrics to this Prometheus textfile collector file")
+    parser.add_argument("--metrics-interval", type=float, default=30.0,
+                        help="Seconds between metric flushes during the run")
+    parser.add_argument("--memory-profile", metavar="FILE",
+                        help="Trace the memory of each stage and write the memory report here (slow)")
+    parser.add_argument("--memory-top", type=int, default=10, help="Allocation sites reported per stage")
+    parser.add_argument("--memory-chunk", type=int, default=10000,
+                        help="Tracks going through the stages at once while profiling memory")
+    parser.add_argument("--memory-compare", metavar="FILE",
+                        help="Compare the memory report with this earlier one")
+    args = parser.parse_args(argv)
+    earlier_report = None
+    if args.memory_compare:
+        if not args.memory_profile:
+            parser.error("--memory-compare needs --memory-profile")
+        try:
+            earlier_report = load_report(args.memory_compare)
+        except (OSError, ValueError) as e:
+            parser.error(str(e))
+    if args.memory_chunk < 1:
+        parser.error("--memory-chunk must be at least 1")
+
+    with open(args.script, "r", encoding="utf-8") as f:
+        script = f.read()
+
+    reader = None
+    if args.album or args.albumartist:
+        reader = ManifestReader(args.manifest)
+        if args.album:
+            tracks = reader.iter_tracks("musicbrainz_albumid", args.album)
+        else:
+            tracks = reader.iter_tracks("albumartist", args.albumartist)
+        if args.album and args.albumartist:
+            albumartists = set(args.albumartist)
+            tracks = (tags for tags in tracks if index_value(tags.get("albumartist", "")) in albumartists)
+    else:
+        tracks = iter_manifest(args.manifest)
+    artist_variables = AdditionalArtistsVariables() if args.additional_artists else None
+
+    if args.memory_profile:
+        profiler = profile_memory(script, tracks, args, artist_variables)
+        if reader is not None:
+            reader.close()
+        profiler.save(args.memory_profile)
+        print(profiler.format_text(), file=sys.stderr)
+        if earlier_report is not None:
+            print(f"\nCompared with {args.memory_compare}:", file=sys.stderr)
+            print(format_comparison(compare_reports(earlier_report, profiler.report())), file=sys.stderr)
+        return
+
+    runner = ScriptRunner(script, profile=args.profile or bool(args.collapsed), budget=_budget(args))
+    budget = PathBudget() if args.check_lengths else None
+    # Timing the stages costs well under a percent of rendering, so it is
+    # always done; the metrics are only written when asked for
+    metrics = RunMetrics("script_runner", args.metrics_json, args.metrics_prom, args.metrics_interval)
+    tracks = timed_tracks(tracks, metrics.stage("read"))
+    if artist_variables is not None:
+        tracks = timed_map(artist_variables.apply, tracks, metrics.stage("artists"))
+    render_stage = metrics.stage("render")
+    check_stage = metrics.stage("check") if budget is not None else None
+    output_stage = metrics.stage("output")
+    for name, memo in MEMOS.items():
+        metrics.add_cache(f"{name}_memo", memo.stats)
+    if artist_variables is not None:
+        metrics.add_cache("artist_variables", artist_variables.stats)
+    if budget is not None:
+        metrics.add_cache("path_lengths", lambda: {"hits": budget.hits, "misses": budget.misses})
+    write_metrics = bool(args.metrics_json or args.metrics_prom)
+    clock = time.perf_counter
+
+    finished = False
+    try:
+        for tags, path in runner.render_all(tracks, render_stage):
+            if budget is not None:
+                start = clock()
+                overrun = budget.check(path)
+                check_stage.busy += clock() - start
+                check_stage.items += 1
+                if overrun is not None:
+                    print(f"Too long: {format_overrun(overrun)}", file=sys.stderr)
+            start = clock()
+            if not args.quiet:
+                source = tags.get(PATH_KEY)
+                print(f"{source}\t{path}" if source else path)
+            output_stage.busy += clock() - start
+            output_stage.items += 1
+            if write_metrics:
+                metrics.tick()
+        finished = True
+    finally:
+        if write_metrics:
+            metrics.close(finished)
+
+    if reader is not None:
+        reader.close()
+    report_skipped(runner.skipped)
+    if budget is not None:
+        stats = budget.stats()
+        print(f"{stats['overruns']} of {stats['paths']} paths too long", file=sys.stderr)
+
+    if args.profile:
+        print(runner.profiler.format_text(), file=sys.stderr)
+        print("\nName helper memos:", file=sys.stderr)
+        for name, stats in memo_stats().items():
+            if stats["hits"] or stats["misses"]:
+                print(f"  {name:<16} {stats['size']:>7} entries  {stats['hit_rate']:>6.1%} hits", file=sys.stderr)
+        if artist_variables is not None:
+            print(f"\nArtist variables cache: {artist_variables.stats()}", file=sys.stderr)
+    if args.collapsed:
+        with open(args.collapsed, "w", encoding="utf-8") as f:
+            f.write(runner.profiler.format_collapsed())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,488 @@
+#!/usr/bin/env python3
+"""
+Script Specializer
+
+Reduces a naming script for a uniform library. Many libraries have no
+multi-disc releases, no Various Artists albums or no featured artists,
+yet the generated script checks for them on every file. Given a library
+profile, the specializer prunes the branches the profile decides and
+drops the $set statements nothing reads any more.
+
+A profile gives the possible values of tags or of the script's own
+variables, as JSON:
+
+    {"variables": {"totaldiscs": ["1"], "_isVA": [""], "_isSoundtrack": [""]}}
+
+A variable missing from the profile, or mapped to null, can have any
+value. A profile can be declared by hand or measured from a tag manifest:
+the script is run over the manifest, recording the value of every
+variable read. Variables read with more than max_values distinct values
+count as unknown. A measured profile only describes the library it was
+measured on: tracks added later may need the branches it pruned.
+
+Measured values only decide conditions ($if, $if2, $and, $or and the
+tests in them); variables whose value ends up in the path are kept, so a
+library of one artist does not get that artist written into the script.
+Only a declared profile folds its fixed values into the text.
+
+The reduced script is only written after it has rendered the same paths
+as the original for every track of the manifest. Without a manifest, it
+is checked against the sample tracks that match the profile.
+
+Run: python script_specializer.py --preset organized --manifest library.ndjson --output reduced.pts
+     python script_specializer.py my_script.pts --profile profile.json --output reduced.pts
+"""
+
+import argparse
+import itertools
+import json
+import sys
+from pathlib import Path
+from typing import Dict, FrozenSet, Iterable, List, Mapping, Optional, Set, Tuple, Union
+
+from manifest import PATH_KEY, iter_manifest
+from presets import PRESETS, get_preset_script, load_user_presets
+from script_batch import PURE_FUNCTIONS
+from script_cost import estimate_cost
+from script_engine import (ScriptState, compile_node, compile_script, join_multi, path_safe_tags, render_path,
+                           statement_effects)
+from script_parser import Expression, Function, Node, Text, Variable, escape_text, parse_script, to_script
+
+
+# Distinct values of a variable above which a measured profile leaves it unknown
+MAX_VALUES = 16
+
+# Combinations of argument values a function is evaluated with at most
+MAX_COMBINATIONS = 64
+
+PROFILE_VERSION = 1
+
+# Possible values of a node; None when they are not known
+Values = Optional[FrozenSet[str]]
+
+EMPTY = frozenset([""])
+
+
+# =============================================================================
+# LIBRARY PROFILE
+# =============================================================================
+
+class LibraryProfile:
+    """Possible values of variables across a library; None marks unknown"""
+
+    def __init__(self, values: Optional[Mapping[str, Values]] = None, tracks: int = 0, measured: bool = False):
+        self.values: Dict[str, Values] = dict(values or {})
+        self.tracks = tracks
+        # Measured from a manifest rather than declared
+        self.measured = measured
+
+    def get(self, name: str) -> Values:
+        return self.values.get(name)
+
+    def covers(self, other: "LibraryProfile") -> bool:
+        """Whether every value other saw is allowed by this profile"""
+        for name, allowed in self.values.items():
+            if allowed is None or name not in other.values:
+                continue
+            seen = other.values[name]
+            if seen is None or not seen <= allowed:
+                return False
+        return True
+
+    def to_json(self) -> Dict:
+        return {
+            "version": PROFILE_VERSION,
+            "tracks": self.tracks,
+            "measured": self.measured,
+            "variables": {name: None if values is None else sorted(values)
+                          for name, values in sorted(self.values.items())},
+        }
+
+    @classmethod
+    def from_json(cls, data: Mapping) -> "LibraryProfile":
+        variables = data.get("variables")
+        if not isinstance(variables, dict):
+            raise ValueError("A library profile needs a \"variables\" object")
+        values = {}
+        for name, allowed in variables.items():
+            if allowed is not None and not (isinstance(allowed, list)
+                                            and all(isinstance(value, str) for value in allowed)):
+                raise ValueError(f"Values of '{name}' must be a list of strings or null")
+            values[name] = None if allowed is None else frozenset(allowed)
+        return cls(values, data.get("tracks", 0), bool(data.get("measured", False)))
+
+    def save(self, path: Union[str, Path]):
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(self.to_json(), f, ensure_ascii=False, indent=2)
+            f.write("\n")
+
+    @classmethod
+    def load(cls, path: Union[str, Path]) -> "LibraryProfile":
+        with open(path, "r", encoding="utf-8") as f:
+            return cls.from_json(json.load(f))
+
+
+class RecordingState(ScriptState):
+    """Script state recording the values of the variables read"""
+
+    __slots__ = ("reads",)
+
+    def __init__(self, tags: Mapping, reads: Dict[str, Set[str]]):
+        super().__init__(tags)
+        self.reads = reads
+
+    def get(self, name: str) -> str:
+        value = ScriptState.get(self, name)
+        self.reads.setdefault(name, set()).add(value)
+        return value
+
+    def get_multi(self, name: str) -> Tuple[str, ...]:
+        values = ScriptState.get_multi(self, name)
+        self.reads.setdefault(name, set()).add(join_multi(values))
+        return values
+
+
+def measure_profile(script: str, tracks: Iterable[Mapping], max_values: int = MAX_VALUES) -> LibraryProfile:
+    """Run a naming script over tracks and record the values of every variable it reads"""
+    compiled = compile_script(script)
+    reads: Dict[str, Set[str]] = {}
+    unknown: Set[str] = set()
+    count = 0
+    for tags in tracks:
+        count += 1
+        compiled.evaluator(RecordingState(path_safe_tags(tags), reads))
+        for name in [name for name, values in reads.items() if len(values) > max_values]:
+            unknown.add(name)
+            # Keep the name so it still counts as seen, without growing further
+            reads[name] = set()
+    values = {name: None if name in unknown else frozenset(seen) for name, seen in reads.items()}
+    return LibraryProfile(values, count, measured=True)
+
+
+# =============================================================================
+# SPECIALIZATION
+# =============================================================================
+
+def _writes_nothing(node: Node) -> bool:
+    return statement_effects(node)[1] == set()
+
+
+def _expression(node: Node) -> Expression:
+    return node if isinstance(node, Expression) else Expression([node])
+
+
+def _is_empty(node: Node) -> bool:
+    return isinstance(node, Expression) and not node.items
+
+
+class ScriptSpecializer:
+    """
+    Prunes the branches a profile decides.
+
+    The values a declared profile fixes are also folded into the text; those
+    of a measured profile only decide conditions.
+    """
+
+    def __init__(self, profile: LibraryProfile):
+        self.profile = profile
+        self.fold_values = not profile.measured
+        # Variables taken to have a single value
+        self.assumed: Set[str] = set()
+        self._results: Dict[Tuple, Values] = {}
+
+    def specialize(self, script: Union[str, Expression]) -> Expression:
+        """Reduce a naming script, returning its syntax tree"""
+        if isinstance(script, str):
+            script = parse_script(script, strip_layout=True)
+        node, _ = self._node(script)
+        return remove_dead_sets(_expression(node))
+
+    def _node(self, node: Node) -> Tuple[Node, Values]:
+        if isinstance(node, Text):
+            return node, frozenset([node.value])
+        if isinstance(node, Variable):
+            return self._variable(node, node.name)
+        if isinstance(node, Function):
+            return self._function(node)
+        return self._sequence(node.items)
+
+    def _variable(self, node: Node, name: str) -> Tuple[Node, Values]:
+        values = self.profile.get(name)
+        if values is not None and len(values) == 1:
+            self.assumed.add(name)
+            if self.fold_values:
+                value, = values
+                return Text(value), values
+        return node, values
+
+    def _sequence(self, items: Iterable[Node]) -> Tuple[Expression, Values]:
+        out: List[Node] = []
+        values: Values = EMPTY
+        for item in items:
+            item, item_values = self._node(item)
+            for part in (item.items if isinstance(item, Expression) else (item,)):
+                if isinstance(part, Text):
+                    if not part.value:
+                        continue
+                    if out and isinstance(out[-1], Text):
+                        part = Text(out[-1].value + part.value)
+                        out.pop()
+                out.append(part)
+            if values is not None:
+                if item_values is None or len(values) * len(item_values) > MAX_COMBINATIONS:
+                    values = None
+                else:
+                    values = frozenset(a + b for a in values for b in item_values)
+        return Expression(out), values
+
+    def _function(self, node: Function) -> Tuple[Node, Values]:
+        name = node.name
+        if name == "noop":
+            return node, EMPTY
+        if name == "if":
+            return self._if(node)
+        if name == "if2":
+            return self._if2(node)
+        if name in ("and", "or"):
+            return self._logic(node)
+        args = [self._node(arg) for arg in node.args]
+        reduced = Function(name, [_expression(arg) for arg, _ in args])
+        if name == "get" and len(node.args) == 1 and node.args[0].literal is not None:
+            return self._variable(reduced, node.args[0].literal)
+        if name not in PURE_FUNCTIONS:
+            return reduced, None
+        values = self._evaluate(name, [arg_values for _, arg_values in args])
+        if values is not None and len(values) == 1:
+            reads, writes = statement_effects(reduced)
+            # Results depending on measured values are only used to decide conditions
+            if writes == set() and (self.fold_values or not reads):
+                value, = values
+                return Text(value), values
+        return reduced, values
+
+    def _evaluate(self, name: str, arg_values: List[Values]) -> Values:
+        """Possible results of a pure function, trying every combination of argument values"""
+        if any(values is None for values in arg_values):
+            return None
+        combinations = 1
+        for values in arg_values:
+            combinations *= len(values)
+        if combinations > MAX_COMBINATIONS:
+            return None
+        results = set()
+        for combination in itertools.product(*[sorted(values) for values in arg_values]):
+            key = (name,) + combination
+            result = self._results.get(key)
+            if key not in self._results:
+                call = Function(name, [Expression([Text(value)]) for value in combination])
+                try:
+                    result = self._results[key] = frozenset([compile_node(call)(ScriptState({}))])
+                except Exception:
+                    result = self._results[key] = None
+            if result is None:
+                return None
+            results |= result
+        return frozenset(results)
+
+    def _if(self, node: Function) -> Tuple[Node, Values]:
+        if not node.args:
+            return node, EMPTY
+        condition, condition_values = self._node(node.args[0])
+        branches = [self._node(arg) for arg in node.args[1:3]]
+        while len(branches) < 2:
+            branches.append((Expression([]), EMPTY))
+        (then, then_values), (otherwise, otherwise_values) = branches
+        if condition_values is not None and _writes_nothing(condition):
+            if "" not in condition_values:
+                return then, then_values
+            if condition_values == EMPTY:
+                return otherwise, otherwise_values
+        if _is_empty(then) and _is_empty(otherwise) and _writes_nothing(condition):
+            return Expression([]), EMPTY
+        args = [_expression(condition), _expression(then)]
+        if not _is_empty(otherwise):
+            args.append(_expression(otherwise))
+        values = None
+        if then_values is not None and otherwise_values is not None:
+            values = then_values | otherwise_values
+        return Function("if", args), values
+
+    def _if2(self, node: Function) -> Tuple[Node, Values]:
+        args = []
+        values: Values = frozenset()
+        for arg in node.args:
+            arg, arg_values = self._node(arg)
+            if arg_values == EMPTY and _writes_nothing(arg):
+                continue
+            args.append(arg)
+            if values is not None:
+                values = None if arg_values is None else values | (arg_values - EMPTY)
+            # Later arguments are only evaluated when this one is empty
+            if arg_values is not None and "" not in arg_values:
+                break
+        else:
+            if values is not None:
+                values |= EMPTY
+        if not args:
+            return Expression([]), EMPTY
+        if len(args) == 1 and values is not None and "" not in values:
+            return args[0], values
+        return Function("if2", [_expression(arg) for arg in args]), values
+
+    def _logic(self, node: Function) -> Tuple[Node, Values]:
+        # Only an all-true $and or an all-false $or depends on every argument
+        deciding = "" if node.name == "and" else "1"
+        args = []
+        decided = False
+        for arg in node.args:
+            arg, arg_values = self._node(arg)
+            if decided:
+                # Every argument is still evaluated, so its writes must stay
+                if not _writes_nothing(arg):
+                    args.append(arg)
+                continue
+            if arg_values is not None and _writes_nothing(arg):
+                truths = {bool(value) for value in arg_values}
+                if truths == {bool(deciding)}:
+                    decided = True
+                    continue
+                if len(truths) == 1:
+                    # Cannot change the result
+                    continue
+            args.append(arg)
+        if decided:
+            if not args:
+                return Text(deciding), frozenset([deciding])
+            args = [arg for arg in args if not _writes_nothing(arg)] + [Text(deciding)]
+            return Function(node.name, [_expression(arg) for arg in args]), frozenset([deciding])
+        if not args:
+            result = "1" if node.name == "and" else ""
+            return Text(result), frozenset([result])
+        if len(args) == 1:
+            # Picard's $and and $or take at least two arguments
+            return Function("if", [_expression(args[0]), Expression([Text("1")])]), frozenset(["", "1"])
+        return Function(node.name, [_expression(arg) for arg in args]), frozenset(["", "1"])
+
+
+def remove_dead_sets(tree: Expression) -> Expression:
+    """Drop top-level $set statements of variables nothing reads"""
+    items = list(tree.items)
+    while True:
+        reads, writes = statement_effects(Expression(items))
+        if writes is None:
+            # Variables may be read under names only known at run time
+            return Expression(items)
+        kept = [item for item in items if not (
+            isinstance(item, Function) and item.name == "set" and len(item.args) == 2
+            and item.args[0].literal is not None and item.args[0].literal not in reads
+            and _writes_nothing(item.args[1]))]
+        if len(kept) == len(items):
+            return Expression(items)
+        items = kept
+
+
+def format_specialized(tree: Expression, assumed: Iterable[str]) -> str:
+    """Script text of a specialized tree, one top-level statement per line"""
+    note = " ".join(sorted(assumed)) or "nothing"
+    lines = [f"$noop( {escape_text(f'Specialized for a library profile; single-valued: {note}')} )"]
+    lines.extend(to_script(item) for item in tree.items)
+    return "\n".join(lines) + "\n"
+
+
+# =============================================================================
+# VERIFICATION
+# =============================================================================
+
+def verify(original: str, reduced: str, tracks: Iterable[Mapping], limit: int = 10) -> Tuple[int, List[Dict]]:
+    """Render tracks with both scripts, returning the track count and the first mismatches"""
+    old, new = compile_script(original), compile_script(reduced)
+    count = 0
+    mismatches = []
+    for index, tags in enumerate(tracks):
+        count += 1
+        old_path, new_path = render_path(old, tags), render_path(new, tags)
+        if old_path != new_path and len(mismatches) < limit:
+            mismatches.append({"track": tags.get(PATH_KEY) or index, "original": old_path, "reduced": new_path})
+    return count, mismatches
+
+
+def conforming_samples(script: str, profile: LibraryProfile) -> List[Dict]:
+    """Sample tracks on which the script only reads values the profile allows"""
+    from script_preview import SAMPLE_TRACKS
+    samples = []
+    for tags in SAMPLE_TRACKS.values():
+        tags = dict(tags)
+        # Give tags the profile fixes their only value
+        for name, values in profile.values.items():
+            if values is not None and len(values) == 1:
+                value, = values
+                tags[name] = value
+        if profile.covers(measure_profile(script, [tags])):
+            samples.append(tags)
+    return samples
+
+
+def _script(preset: Optional[str], path: Optional[str]) -> str:
+    if path:
+        with open(path, "r", encoding="utf-8") as f:
+            return f.read()
+    return get_preset_script(preset)
+
+
+def main(argv=None):
+    load_user_presets()
+    parser = argparse.ArgumentParser(description="Reduce a naming script for a uniform library")
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument("script", nargs="?", help="Picard script file (.pts)")
+    source.add_argument("--preset", choices=list(PRESETS), help="Naming preset")
+    parser.add_argument("--manifest", help="Tag manifest to measure the profile from and verify on")
+    parser.add_argument("--profile", help="Declared library profile (JSON) instead of measuring one")
+    parser.add_argument("--save-profile", metavar="FILE", help="Write the measured profile here")
+    parser.add_argument("--max-values", type=int, default=MAX_VALUES,
+                        help="Distinct values above which a measured variable counts as unknown")
+    parser.add_argument("--output", help="Write the reduced script here instead of printing it")
+    args = parser.parse_args(argv)
+    if not args.manifest and not args.profile:
+        parser.error("Give a --manifest to measure the profile from, or a declared --profile")
+
+    try:
+        script = _script(args.preset, args.script)
+        if args.profile:
+            profile = LibraryProfile.load(args.profile)
+        else:
+            profile = measure_profile(script, iter_manifest(args.manifest), args.max_values)
+    except (OSError, ValueError) as e:
+        parser.error(str(e))
+    if args.save_profile:
+        profile.save(args.save_profile)
+
+    specializer = ScriptSpecializer(profile)
+    reduced = format_specialized(specializer.specialize(script), specializer.assumed)
+
+    if args.manifest:
+        count, mismatches = verify(script, reduced, iter_manifest(args.manifest))
+        checked = f"{count} tracks of {args.manifest}"
+    else:
+        samples = conforming_samples(script, profile)
+        if not samples:
+            parser.error("No sample track matches the profile to verify on; give a --manifest")
+        count, mismatches = verify(script, reduced, samples)
+        checked = f"{count} sample tracks matching the profile"
+    if mismatches:
+        print(f"The reduced script differs from the original on {checked}; not written:", file=sys.stderr)
+        for row in mismatches:
+            print(f"  {row['track']}: {row['original']!r} -> {row['reduced']!r}", file=sys.stderr)
+        sys.exit(1)
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(reduced)
+    else:
+        print(reduced, end="")
+    before, after = estimate_cost(script), estimate_cost(reduced)
+    print(f"Verified on {checked}. Per file: {before.describe()} -> {after.describe()}; "
+          f"single-valued: {', '.join(sorted(specializer.assumed)) or 'nothing'}", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,236 @@
+#!/usr/bin/env python3
+"""
+Sharded Plan
+
+Plans the renaming of a library too large for one machine. The
+coordinator splits a tag manifest into shards, runs one planner worker
+per shard as an independent process, then merges the shard plans and
+checks collisions across the whole library.
+
+Shards are assigned per album, so all tracks of an album land on the same
+shard:
+
+    album    hash of musicbrainz_albumid (album artist and album without one)
+    initial  first letter of the album artist sort name, as in _nInitial,
+             with letter ranges split evenly between shards
+
+Workers only exchange files with the coordinator: a shard manifest in and
+a shard plan out. Locally they are subprocesses; on a cluster the same
+worker command runs on each node against shared storage.
+
+Run: python sharded_plan.py my_script.pts library.ndjson --shards 4 --plan plan.ndjson
+"""
+
+import argparse
+import json
+import os
+import queue
+import subprocess
+import sys
+import threading
+import time
+import zlib
+from pathlib import Path
+from typing import Dict, Iterable, List, Mapping, Optional, Tuple, Union
+
+from manifest import PATH_KEY, iter_manifest
+from name_helpers import first_alpha_char
+from rename_plan import CollisionChecker, STATUS_COLLISION, check_plan, iter_plan, write_plan
+from script_batch import path_renderer
+from script_engine import DEFAULT_MAX_SECONDS, DEFAULT_MAX_STEPS, EvaluationBudget
+
+
+SHARD_MODES = ("album", "initial")
+
+# Initials in order; initials outside A-Z share the "#" range
+INITIALS = "#ABCDEFGHIJKLMNOPQRSTUVWXYZ"
+
+
+def _text(value) -> str:
+    if isinstance(value, str):
+        return value
+    return "; ".join(value)
+
+
+def shard_of(tags: Mapping, shards: int, mode: str = "album") -> int:
+    """Shard a track belongs to; only album-level tags are used"""
+    if mode == "initial":
+        name = _text(tags.get("albumartistsort") or tags.get("albumartist") or "")
+        initial = first_alpha_char(name).upper()
+        position = INITIALS.find(initial) if initial else 0
+        return max(position, 0) * shards // len(INITIALS)
+    key = tags.get("musicbrainz_albumid")
+    if not key:
+        key = f"{_text(tags.get('albumartist', ''))}\0{_text(tags.get('album', ''))}"
+    # crc32 rather than hash(), which differs between processes
+    return zlib.crc32(_text(key).encode("utf-8")) % shards
+
+
+def partition_manifest(path: Union[str, Path], work_dir: Union[str, Path], shards: int,
+                       mode: str = "album") -> List[Path]:
+    """Split a manifest into one manifest per shard, returning their paths"""
+    work_dir = Path(work_dir)
+    work_dir.mkdir(parents=True, exist_ok=True)
+    paths = [work_dir / f"shard-{index:03d}.ndjson" for index in range(shards)]
+    files = [open(shard_path, "w", encoding="utf-8") for shard_path in paths]
+    try:
+        for tags in iter_manifest(path):
+            files[shard_of(tags, shards, mode)].write(json.dumps(tags, ensure_ascii=False) + "\n")
+    finally:
+        for f in files:
+            f.close()
+    return paths
+
+
+def plan_shard(script: str, manifest: Union[str, Path], plan_path: Union[str, Path],
+               dest: str = "", case_sensitive: bool = False, max_steps: Optional[int] = DEFAULT_MAX_STEPS,
+               max_seconds: Optional[float] = DEFAULT_MAX_SECONDS) -> Dict:
+    """
+    Write the rename plan of one shard.
+
+    Collisions are checked within the shard only; tracks without a path
+    are skipped, and so are tracks going over the evaluation budget,
+    which are listed in the result with the reason.
+    """
+    start = time.perf_counter()
+    skipped = []
+    budget = EvaluationBudget(max_steps, max_seconds) if max_steps or max_seconds else None
+    render = path_renderer(script, budget=budget,
+                           on_exceeded=lambda tags, e: skipped.append([tags[PATH_KEY], str(e)]))
+    tracks = [tags for tags in iter_manifest(manifest) if tags.get(PATH_KEY)]
+    checker = CollisionChecker(case_sensitive)
+    entries = (checker.check(tags[PATH_KEY], os.path.join(dest, path))
+               for tags, path in zip(tracks, render(tracks)) if path is not None)
+    written = write_plan(plan_path, entries)
+    return {"tracks": written, "counts": checker.counts, "skipped": skipped,
+            "seconds": time.perf_counter() - start}
+
+
+def merge_plans(plan_paths: Iterable[Union[str, Path]], plan_path: Union[str, Path],
+                case_sensitive: bool = False) -> Dict[str, int]:
+    """Merge shard plans in shard order, checking collisions across all of them"""
+    checker = CollisionChecker(case_sensitive)
+    entries = (entry for path in plan_paths for entry in iter_plan(path))
+    write_plan(plan_path, check_plan(entries, checker=checker))
+    return checker.counts
+
+
+class ShardCoordinator:
+    """Partitions a manifest, runs a worker process per shard and merges their plans"""
+
+    def __init__(self, script_path: str, manifest: str, work_dir: str, shards: int,
+                 mode: str = "album", dest: str = "", jobs: int = 0, case_sensitive: bool = False,
+                 max_steps: Optional[int] = DEFAULT_MAX_STEPS, max_seconds: Optional[float] = DEFAULT_MAX_SECONDS):
+        if mode not in SHARD_MODES:
+            raise ValueError(f"Unknown shard mode '{mode}'")
+        self.script_path = script_path
+        self.manifest = manifest
+        self.work_dir = Path(work_dir)
+        self.shards = shards
+        self.mode = mode
+        self.dest = dest
+        self.jobs = jobs or shards
+        self.case_sensitive = case_sensitive
+        self.max_steps = max_steps
+        self.max_seconds = max_seconds
+        self.results: List[Dict] = []
+
+    def _worker_command(self, shard_manifest: Path, shard_plan: Path) -> List[str]:
+        command = [sys.executable, os.path.abspath(__file__), self.script_path, str(shard_manifest),
+                   "--worker", "--plan", str(shard_plan), "--dest", self.dest,
+                   "--max-steps", str(self.max_steps or 0), "--max-seconds", str(self.max_seconds or 0)]
+        if self.case_sensitive:
+            command.append("--case-sensitive")
+        return command
+
+    def run_workers(self, shard_manifests: List[Path]) -> List[Path]:
+        """Run the workers, at most jobs at a time, and return the shard plans"""
+        plans = [path.with_suffix(".plan.ndjson") for path in shard_manifests]
+        pending = list(enumerate(zip(shard_manifests, plans)))
+        running: Dict[int, subprocess.Popen] = {}
+        # Outputs of the workers as they exit, read by one thread per worker
+        # since a summary listing skipped tracks may not fit the pipe buffer
+        finished: "queue.Queue[Tuple[int, str]]" = queue.Queue()
+        self.results = [None] * len(plans)
+
+        def collect(index: int, process: subprocess.Popen):
+            finished.put((index, process.communicate()[0]))
+
+        try:
+            while pending or running:
+                while pending and len(running) < self.jobs:
+                    index, (shard_manifest, shard_plan) = pending.pop(0)
+                    process = subprocess.Popen(self._worker_command(shard_manifest, shard_plan),
+                                               stdout=subprocess.PIPE, text=True)
+                    running[index] = process
+                    threading.Thread(target=collect, args=(index, process), daemon=True).start()
+                # Whichever worker exits first frees its slot, and a failure
+                # shows up without waiting for slower shards
+                index, output = finished.get()
+                process = running.pop(index)
+                if process.returncode:
+                    raise RuntimeError(f"Worker for shard {index} failed with exit code {process.returncode}")
+                self.results[index] = json.loads(output)
+        finally:
+            # After a failure or an interrupt, stop the workers still writing plans
+            for process in running.values():
+                process.terminate()
+            for process in running.values():
+                process.wait()
+        return plans
+
+    def run(self, plan_path: str) -> Dict[str, int]:
+        """Plan the whole manifest and write the merged plan"""
+        shard_manifests = partition_manifest(self.manifest, self.work_dir, self.shards, self.mode)
+        shard_plans = self.run_workers(shard_manifests)
+        return merge_plans(shard_plans, plan_path, self.case_sensitive)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Plan renaming a large library in shards")
+    parser.add_argument("script", help="Picard script file (.pts)")
+    parser.add_argument("manifest", help="Tag manifest (NDJSON, one track per line, with _path)")
+    parser.add_argument("--plan", required=True, help="Rename plan to write (NDJSON)")
+    parser.add_argument("--shards", type=int, default=4, help="Number of shards")
+    parser.add_argument("--by", choices=SHARD_MODES, default="album", help="How tracks are assigned to shards")
+    parser.add_argument("--work-dir", help="Directory for shard manifests and plans (default: next to the plan)")
+    parser.add_argument("--jobs", type=int, default=0, help="Workers run at once (default: one per shard)")
+    parser.add_argument("--dest", default="", help="Directory the targets are relative to")
+    parser.add_argument("--case-sensitive", action="store_true", help="Treat targets differing in case as distinct")
+    parser.add_argument("--max-steps", type=int, default=DEFAULT_MAX_STEPS,
+                        help="Loop iterations allowed per track before it is skipped (0: no limit)")
+    parser.add_argument("--max-seconds", type=float, default=DEFAULT_MAX_SECONDS,
+                        help="Seconds allowed per track before it is skipped (0: no limit)")
+    parser.add_argument("--worker", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.worker:
+        with open(args.script, "r", encoding="utf-8") as f:
+            result = plan_shard(f.read(), args.manifest, args.plan, args.dest, args.case_sensitive,
+                                args.max_steps, args.max_seconds)
+        print(json.dumps(result))
+        return
+
+    work_dir = args.work_dir or f"{args.plan}.shards"
+    coordinator = ShardCoordinator(args.script, args.manifest, work_dir, args.shards, args.by,
+                                   args.dest, args.jobs, args.case_sensitive, args.max_steps, args.max_seconds)
+    start = time.perf_counter()
+    counts = coordinator.run(args.plan)
+    elapsed = time.perf_counter() - start
+
+    print(f"{'Shard':>5} {'tracks':>9} {'collisions':>11} {'seconds':>8}", file=sys.stderr)
+    for index, result in enumerate(coordinator.results):
+        print(f"{index:>5} {result['tracks']:>9} {result['counts'][STATUS_COLLISION]:>11} "
+              f"{result['seconds']:>8.2f}", file=sys.stderr)
+    local = sum(result["counts"][STATUS_COLLISION] for result in coordinator.results)
+    print(f"\nMerged plan: {', '.join(f'{count} {status}' for status, count in counts.items())} "
+          f"({counts[STATUS_COLLISION] - local} only visible across shards); {elapsed:.2f} s", file=sys.stderr)
+    skipped = [item for result in coordinator.results for item in result["skipped"]]
+    if skipped:
+        print(f"\nSkipped {len(skipped)} tracks over the evaluation budget:", file=sys.stderr)
+        for source, reason in skipped:
+            print(f"  {source}: {reason}", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
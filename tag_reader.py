@@ -0,0 +1,88 @@
+"""
+Tag Reader Module
+
+Reads the tags of audio files as Picard-style tag dicts, keyed by the
+names in script_components.STANDARD_TAGS, for dry runs and rename plans.
+
+Reading tags from files needs the optional mutagen package. Without it,
+tags can be looked up by path in a tag manifest instead.
+"""
+
+import importlib.util
+import os
+from pathlib import Path
+from typing import Callable, Dict, Iterable, Mapping, Optional, Union
+
+from manifest import PATH_KEY, iter_manifest
+
+
+# File extensions treated as audio files when scanning a library
+AUDIO_EXTENSIONS = frozenset({
+    ".aac", ".aif", ".aiff", ".ape", ".dsf", ".flac", ".m4a", ".mp3",
+    ".mp4", ".mpc", ".ogg", ".opus", ".wav", ".wma", ".wv",
+})
+
+# "n/total" tags and the tag holding their total
+NUMBER_TAGS = {"tracknumber": "totaltracks", "discnumber": "totaldiscs"}
+
+TagReader = Callable[[str], Optional[Dict]]
+
+
+def has_mutagen() -> bool:
+    """Whether tags can be read from audio files"""
+    return importlib.util.find_spec("mutagen") is not None
+
+
+def read_file_tags(path: str) -> Optional[Dict]:
+    """
+    Read the tags of an audio file with mutagen.
+
+    Tags with several values become lists. Returns None for files mutagen
+    cannot read.
+    """
+    import mutagen
+
+    try:
+        audio = mutagen.File(path, easy=True)
+    except mutagen.MutagenError:
+        return None
+    if audio is None:
+        return None
+    tags = {}
+    for name, values in (audio.tags or {}).items():
+        name = name.lower()
+        values = [str(value) for value in values if str(value)]
+        if not values or name.startswith("~"):
+            continue
+        tags[name] = values if len(values) > 1 else values[0]
+    for name, total_name in NUMBER_TAGS.items():
+        value = tags.get(name)
+        if isinstance(value, str) and "/" in value:
+            tags[name], total = value.split("/", 1)
+            if total and total_name not in tags:
+                tags[total_name] = total
+    tags["_extension"] = Path(path).suffix[1:].lower()
+    tags[PATH_KEY] = path
+    return tags
+
+
+class ManifestTagReader:
+    """Looks up the tags of files by their path in a tag manifest"""
+
+    def __init__(self, manifests: Union[str, Path, Iterable[Union[str, Path]]]):
+        if isinstance(manifests, (str, Path)):
+            manifests = [manifests]
+        self.tags: Dict[str, Mapping] = {}
+        for manifest in manifests:
+            for tags in iter_manifest(manifest):
+                path = tags.get(PATH_KEY)
+                if path:
+                    self.tags[os.path.abspath(path)] = tags
+
+    def __call__(self, path: str) -> Optional[Dict]:
+        tags = self.tags.get(os.path.abspath(path))
+        if tags is None:
+            return None
+        tags = dict(tags)
+        tags[PATH_KEY] = path
+        return tags
@@ -0,0 +1,137 @@
+"""
+Track Records Module
+
+Compact in-memory tracks for multi-million-row manifests.
+
+A plain dict per track costs over a kilobyte before counting its strings,
+and every track of an album carries its own copy of the album, album
+artist, label, date and MusicBrainz ids. A TrackRecord instead holds a
+tuple of values and a reference to a layout (the track's tag names and
+their positions) shared by every track with the same tags. Values of tags
+that repeat across tracks are interned in a pool, so each distinct album
+or artist string is stored once.
+
+TrackRecord is a read-only Mapping, so records can be passed anywhere the
+engine takes a tag dict.
+"""
+
+from collections.abc import Mapping
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple, Union
+
+from manifest import PATH_KEY, iter_manifest
+
+
+# Tags that are unique to a track and not worth interning
+UNIQUE_TAGS = {
+    "title", "titlesort", "musicbrainz_recordingid", "musicbrainz_trackid",
+    "isrc", "acoustid_id", "acoustid_fingerprint", "comment", "lyrics", PATH_KEY,
+}
+
+
+class TrackLayout:
+    """Tag names of a track and their positions in its values tuple"""
+
+    __slots__ = ("names", "index")
+
+    def __init__(self, names: Tuple[str, ...]):
+        self.names = names
+        self.index = {name: i for i, name in enumerate(names)}
+
+
+class TrackRecord(Mapping):
+    """Read-only tags of one track"""
+
+    __slots__ = ("_layout", "_values")
+
+    def __init__(self, layout: TrackLayout, values: Tuple):
+        self._layout = layout
+        self._values = values
+
+    def __getitem__(self, name: str):
+        return self._values[self._layout.index[name]]
+
+    def get(self, name: str, default=None):
+        i = self._layout.index.get(name)
+        return default if i is None else self._values[i]
+
+    def __contains__(self, name) -> bool:
+        return name in self._layout.index
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self._layout.names)
+
+    def __len__(self) -> int:
+        return len(self._values)
+
+    def keys(self):
+        return self._layout.names
+
+    def items(self):
+        return zip(self._layout.names, self._values)
+
+    def values(self):
+        return self._values
+
+    def __repr__(self) -> str:
+        return f"TrackRecord({dict(self.items())!r})"
+
+
+class TrackPool:
+    """
+    Builds TrackRecords, sharing layouts and repeated values between them.
+
+    Multi-value tags become tuples, which the engine reads directly.
+    """
+
+    def __init__(self, unique_tags: Iterable[str] = UNIQUE_TAGS):
+        self.unique_tags = frozenset(unique_tags)
+        self._values: Dict = {}
+        self._layouts: Dict[Tuple[str, ...], TrackLayout] = {}
+        self.lookups = 0
+
+    def intern(self, value: Union[str, Tuple[str, ...]]):
+        """Get the pooled copy of a value"""
+        self.lookups += 1
+        return self._values.setdefault(value, value)
+
+    def layout(self, names: Tuple[str, ...]) -> TrackLayout:
+        """Get the shared layout for a set of tag names"""
+        layout = self._layouts.get(names)
+        if layout is None:
+            names = tuple(self.intern(name) for name in names)
+            layout = self._layouts[names] = TrackLayout(names)
+        return layout
+
+    def record(self, tags: Mapping) -> TrackRecord:
+        """Build the compact record of a track"""
+        unique_tags = self.unique_tags
+        values = []
+        for name, value in tags.items():
+            if value.__class__ is list:
+                value = tuple(value)
+                if name not in unique_tags:
+                    value = self.intern(tuple(self.intern(item) for item in value))
+            elif name not in unique_tags:
+                value = self.intern(value)
+            values.append(value)
+        return TrackRecord(self.layout(tuple(tags)), tuple(values))
+
+    def records(self, tracks: Iterable[Mapping]) -> Iterator[TrackRecord]:
+        """Build the compact records of many tracks"""
+        for tags in tracks:
+            yield self.record(tags)
+
+    def stats(self) -> Dict[str, int]:
+        """Get the pool counters"""
+        return {
+            "values": len(self._values),
+            "layouts": len(self._layouts),
+            "lookups": self.lookups,
+        }
+
+
+def load_records(path, pool: Optional[TrackPool] = None) -> List[TrackRecord]:
+    """Load all tracks of a manifest as compact records"""
+    if pool is None:
+        pool = TrackPool()
+    return list(pool.records(iter_manifest(path)))
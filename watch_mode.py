@@ -0,0 +1,311 @@
+#!/usr/bin/env python3
+"""
+Watch Mode
+
+Watches an ingest folder and moves newly arriving albums into the library
+as soon as they are complete, using a preset or naming script.
+
+Polling is cheap: each poll only stats the directories already known,
+and lists the entries of those whose modification time changed (adding
+or removing a file changes its directory's mtime). A new file is only
+read once its size and mtime have not changed for the settle time, so
+files still being copied are left alone.
+
+Settled tracks are grouped into albums by musicbrainz_albumid (or their
+folder without one). An album is placed once every track of every disc
+announced by totaltracks/totaldiscs has arrived, or once no track of it
+has arrived for the album timeout. Only the tracks of that album are
+rendered and moved; existing files are never overwritten.
+
+Latency is measured from the moment a file appeared in the ingest folder
+(its ctime) to the moment it was placed.
+
+Run: python watch_mode.py /ingest /music --preset simple
+     python watch_mode.py /ingest /music --script my_script.pts --manifest tags.ndjson --dry-run
+"""
+
+import argparse
+import json
+import os
+import shutil
+import sys
+import time
+from typing import Callable, Dict, List, Optional
+
+from manifest import PATH_KEY
+from presets import PRESETS, get_preset_script, load_user_presets
+from rename_plan import CollisionChecker, STATUS_COLLISION
+from script_batch import path_renderer
+from tag_reader import AUDIO_EXTENSIONS, ManifestTagReader, TagReader, has_mutagen, read_file_tags
+
+
+class PendingFile:
+    """A new file waiting for its size and mtime to settle"""
+
+    __slots__ = ("size", "mtime_ns", "changed_at", "dropped_at")
+
+    def __init__(self, size: int, mtime_ns: int, changed_at: float, dropped_at: float):
+        self.size = size
+        self.mtime_ns = mtime_ns
+        self.changed_at = changed_at
+        self.dropped_at = dropped_at
+
+
+class AlbumGroup:
+    """Settled tracks of one album, waiting for the rest of the album"""
+
+    __slots__ = ("tracks", "dropped_at", "last_arrival")
+
+    def __init__(self):
+        self.tracks: Dict[str, Dict] = {}
+        self.dropped_at: Dict[str, float] = {}
+        self.last_arrival = 0.0
+
+
+def _int(value) -> Optional[int]:
+    if not isinstance(value, str):
+        return None
+    try:
+        return int(value.split("/")[0])
+    except ValueError:
+        return None
+
+
+def album_complete(tracks: List[Dict]) -> bool:
+    """Whether every track of every disc, as given by the totals tags, is present"""
+    total_discs = max((_int(tags.get("totaldiscs")) or 1 for tags in tracks), default=1)
+    discs: Dict[int, List[Dict]] = {}
+    for tags in tracks:
+        discs.setdefault(_int(tags.get("discnumber")) or 1, []).append(tags)
+    for disc in range(1, total_discs + 1):
+        disc_tracks = discs.get(disc)
+        if not disc_tracks:
+            return False
+        expected = max((_int(tags.get("totaltracks")) or 0 for tags in disc_tracks), default=0)
+        if not expected or len(disc_tracks) < expected:
+            return False
+    return True
+
+
+class IngestWatcher:
+    """Polls an ingest folder and places complete albums into a library"""
+
+    def __init__(self, root: str, dest: str, script: str, read_tags: Optional[TagReader] = None,
+                 settle: float = 5.0, album_timeout: float = 300.0, dry_run: bool = False,
+                 extensions=AUDIO_EXTENSIONS, clock: Callable[[], float] = time.time,
+                 log: Optional[Callable[[Dict], None]] = None):
+        if read_tags is None:
+            if not has_mutagen():
+                raise RuntimeError("Reading tags from audio files needs mutagen (pip install mutagen); "
+                                   "or look tags up in a manifest instead")
+            read_tags = read_file_tags
+        self.root = root
+        self.dest = dest
+        self.render = path_renderer(script)
+        self.read_tags = read_tags
+        self.settle = settle
+        self.album_timeout = album_timeout
+        self.dry_run = dry_run
+        self.extensions = frozenset(extension.lower() for extension in extensions)
+        self.clock = clock
+        self.log = log
+        # Directory mtimes from the last poll; None until first listed
+        self.directories: Dict[str, Optional[int]] = {root: None}
+        self.entries: Dict[str, set] = {}
+        self.pending: Dict[str, PendingFile] = {}
+        self.albums: Dict[str, AlbumGroup] = {}
+        self.latencies: List[float] = []
+        self.placed = 0
+        self.skipped = 0
+        self.listings = 0
+
+    # =========================================================================
+    # POLLING
+    # =========================================================================
+
+    def poll(self) -> List[Dict]:
+        """Look for new files once and place the albums that are ready"""
+        now = self.clock()
+        self._scan(now)
+        self._settle(now)
+        placed = []
+        for key in list(self.albums):
+            album = self.albums[key]
+            if album_complete(list(album.tracks.values())) or now - album.last_arrival >= self.album_timeout:
+                placed.extend(self._place(self.albums.pop(key)))
+        return placed
+
+    def _scan(self, now: float):
+        for directory in list(self.directories):
+            if directory not in self.directories:
+                continue
+            try:
+                mtime_ns = os.stat(directory).st_mtime_ns
+            except OSError:
+                self._forget(directory)
+                continue
+            if mtime_ns != self.directories[directory]:
+                self.directories[directory] = mtime_ns
+                self._list(directory, now)
+
+    def _list(self, directory: str, now: float):
+        self.listings += 1
+        seen = set()
+        try:
+            with os.scandir(directory) as entries:
+                for entry in entries:
+                    seen.add(entry.path)
+                    if entry.path in self.entries.get(directory, ()):
+                        continue
+                    if entry.is_dir(follow_symlinks=False):
+                        self.directories[entry.path] = None
+                        self._list_new(entry.path, now)
+                    elif os.path.splitext(entry.name)[1].lower() in self.extensions:
+                        stat = entry.stat()
+                        self.pending[entry.path] = PendingFile(stat.st_size, stat.st_mtime_ns, now, stat.st_ctime)
+        except OSError:
+            return
+        for path in self.entries.get(directory, set()) - seen:
+            self.pending.pop(path, None)
+            if path in self.directories:
+                self._forget(path)
+        self.entries[directory] = seen
+
+    def _list_new(self, directory: str, now: float):
+        """List a directory that appeared since the last poll, and its subdirectories"""
+        try:
+            self.directories[directory] = os.stat(directory).st_mtime_ns
+        except OSError:
+            return
+        self._list(directory, now)
+
+    def _forget(self, directory: str):
+        self.directories.pop(directory, None)
+        for path in self.entries.pop(directory, ()):
+            self.pending.pop(path, None)
+            if path in self.directories:
+                self._forget(path)
+
+    def _settle(self, now: float):
+        for path, pending in list(self.pending.items()):
+            try:
+                stat = os.stat(path)
+            except OSError:
+                del self.pending[path]
+                continue
+            if stat.st_size != pending.size or stat.st_mtime_ns != pending.mtime_ns:
+                pending.size, pending.mtime_ns, pending.changed_at = stat.st_size, stat.st_mtime_ns, now
+                continue
+            if now - pending.changed_at < self.settle:
+                continue
+            del self.pending[path]
+            tags = self.read_tags(path)
+            if tags is None:
+                self.skipped += 1
+                continue
+            tags[PATH_KEY] = path
+            key = tags.get("musicbrainz_albumid") or os.path.dirname(path)
+            album = self.albums.get(key)
+            if album is None:
+                album = self.albums[key] = AlbumGroup()
+            album.tracks[path] = tags
+            album.dropped_at[path] = pending.dropped_at
+            album.last_arrival = now
+
+    # =========================================================================
+    # PLACING
+    # =========================================================================
+
+    def _place(self, album: AlbumGroup) -> List[Dict]:
+        tracks = list(album.tracks.values())
+        checker = CollisionChecker()
+        entries = []
+        for tags, path in zip(tracks, self.render(tracks)):
+            source = tags[PATH_KEY]
+            entry = checker.check(source, os.path.join(self.dest, path))
+            if entry["status"] != STATUS_COLLISION and os.path.exists(entry["target"]):
+                entry["status"] = STATUS_COLLISION
+            if entry["status"] != STATUS_COLLISION and not self.dry_run:
+                try:
+                    os.makedirs(os.path.dirname(entry["target"]) or ".", exist_ok=True)
+                    shutil.move(source, entry["target"])
+                except OSError as e:
+                    entry["status"] = "error"
+                    entry["error"] = str(e)
+            if entry["status"] not in (STATUS_COLLISION, "error"):
+                entry["latency"] = round(self.clock() - album.dropped_at[source], 3)
+                self.latencies.append(entry["latency"])
+                self.placed += 1
+            entries.append(entry)
+            if self.log is not None:
+                self.log(entry)
+        return entries
+
+    def run(self, interval: float = 2.0, polls: Optional[int] = None):
+        """Poll every interval seconds, forever or for a number of polls"""
+        count = 0
+        while polls is None or count < polls:
+            started = time.monotonic()
+            self.poll()
+            count += 1
+            time.sleep(max(0.0, interval - (time.monotonic() - started)))
+
+    def latency_stats(self) -> Dict[str, float]:
+        """Drop-to-placed latency of the placed tracks, in seconds"""
+        if not self.latencies:
+            return {"tracks": 0}
+        ordered = sorted(self.latencies)
+        return {
+            "tracks": len(ordered),
+            "mean": sum(ordered) / len(ordered),
+            "p50": ordered[len(ordered) // 2],
+            "p95": ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))],
+            "max": ordered[-1],
+        }
+
+
+def main(argv=None):
+    load_user_presets()
+    parser = argparse.ArgumentParser(description="Move albums arriving in an ingest folder into a library")
+    parser.add_argument("root", help="Ingest folder to watch")
+    parser.add_argument("dest", help="Library folder the albums are moved into")
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument("--preset", choices=list(PRESETS), help="Naming preset")
+    source.add_argument("--script", help="Picard script file (.pts)")
+    parser.add_argument("--manifest", action="append",
+                        help="Look tags up by path in this manifest instead of reading files (repeatable)")
+    parser.add_argument("--interval", type=float, default=2.0, help="Seconds between polls")
+    parser.add_argument("--settle", type=float, default=5.0, help="Seconds a file must stay unchanged")
+    parser.add_argument("--album-timeout", type=float, default=300.0,
+                        help="Seconds after the last track before an incomplete album is placed anyway")
+    parser.add_argument("--polls", type=int, help="Stop after this many polls")
+    parser.add_argument("--dry-run", action="store_true", help="Only print where files would go")
+    args = parser.parse_args(argv)
+
+    if args.script:
+        with open(args.script, "r", encoding="utf-8") as f:
+            script = f.read()
+    else:
+        try:
+            script = get_preset_script(args.preset)
+        except ValueError as e:
+            parser.error(str(e))
+    read_tags = ManifestTagReader(args.manifest) if args.manifest else None
+
+    def log(entry):
+        print(json.dumps(entry, ensure_ascii=False), flush=True)
+
+    try:
+        watcher = IngestWatcher(args.root, args.dest, script, read_tags, args.settle,
+                                args.album_timeout, args.dry_run, log=log)
+    except RuntimeError as e:
+        parser.error(str(e))
+    try:
+        watcher.run(args.interval, args.polls)
+    except KeyboardInterrupt:
+        pass
+    print(f"\nPlaced {watcher.placed} tracks; latency {watcher.latency_stats()}", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()